@@ -0,0 +1,591 @@
+"""
+Attendance storage engines.
+
+The attendance routes go through an AttendanceStore instead of querying a
+collection directly, so the storage format can be chosen per deployment with
+ATTENDANCE_STORAGE:
+
+- "documents" (default): one `attendances` document per employee per day.
+- "buckets": one `attendance_buckets` document per employee per month with a
+  compact per-day status array (see models/attendance_bucket.py). Marks are
+  positional updates of a single array slot; reads expand buckets back into
+  per-day records. Migrate existing data with scripts/migrate_attendance_buckets.py.
+
+Both engines return plain per-day records ({"_id", "employeeId", "date",
+"status", "createdAt", "updatedAt"}) sorted newest first, which the routes
+convert with record_to_attendance_out.
+
+Each engine also has an archive tier, `<collection>_archive`, filled by
+scripts/archive_attendance.py with data older than ATTENDANCE_HOT_DAYS. The
+job records the cutoff ("archivedBefore") in attendance_archive_state; reads
+only touch the archive when their date range starts before it, so the hot
+collection and its indexes stay small. Marks always go to the hot collection;
+a correction to an archived day is merged into the archive by the next run,
+and until then the hot record wins on reads.
+"""
+import os
+import time
+import asyncio
+from datetime import datetime, timedelta
+
+from pymongo import ReturnDocument, ReplaceOne, DeleteOne, DeleteMany, IndexModel
+from pymongo.errors import DuplicateKeyError, CollectionInvalid
+
+from models.attendance_bucket import AttendanceBucket, UNMARKED, PRESENT, ABSENT, DAYS_PER_BUCKET
+
+
+ATTENDANCE_STORAGE = os.getenv("ATTENDANCE_STORAGE", "documents").lower()
+
+STATUS_CODES = {"Present": PRESENT, "Absent": ABSENT}
+STATUS_NAMES = {PRESENT: "Present", ABSENT: "Absent"}
+
+ATTENDANCE_HOT_DAYS = int(os.getenv("ATTENDANCE_HOT_DAYS", 90))
+ARCHIVE_STATE_COLLECTION = "attendance_archive_state"
+# How long a worker trusts its copy of the archive cutoff. The archive job waits
+# this long after advancing the cutoff before it moves anything.
+ARCHIVE_WATERMARK_CACHE_SECONDS = float(os.getenv("ARCHIVE_WATERMARK_CACHE_SECONDS", 30))
+# Archive collections are created with zstd block compression (WiredTiger).
+ARCHIVE_STORAGE_ENGINE = {"wiredTiger": {"configString": "block_compressor=zstd"}}
+
+_watermarks = {}  # (database name, hot collection name) -> (loaded at, archivedBefore)
+
+
+def _day_start(day):
+    return datetime.combine(day, datetime.min.time())
+
+
+def _sort_records(records):
+    records.sort(key=lambda r: (r["date"], r.get("createdAt") or datetime.min), reverse=True)
+    return records
+
+
+async def archive_watermark(database, collection_name):
+    """Cutoff below which data of a hot collection may be archived (None if never archived)."""
+    key = (database.name, collection_name)
+    loaded = _watermarks.get(key)
+    now = time.monotonic()
+    if loaded is None or now - loaded[0] > ARCHIVE_WATERMARK_CACHE_SECONDS:
+        state = await database[ARCHIVE_STATE_COLLECTION].find_one({"_id": collection_name})
+        loaded = _watermarks[key] = (now, state.get("archivedBefore") if state else None)
+    return loaded[1]
+
+
+class _TieredStore:
+    """Hot/archive collection handling shared by the storage engines."""
+
+    collection_name = None
+    archive_indexes = []
+
+    @property
+    def archive_collection_name(self):
+        return f"{self.collection_name}_archive"
+
+    async def _reaches_archive(self, database, start):
+        watermark = await archive_watermark(database, self.collection_name)
+        return watermark is not None and (start is None or _day_start(start) < watermark)
+
+    async def _read_tiers(self, database, start, read):
+        """
+        Run read(collection) on the hot collection and, if the range starting at
+        `start` reaches into it, the archive. Returns (hot results, archive results).
+        """
+        hot = await read(database[self.collection_name])
+        archived = []
+        if await self._reaches_archive(database, start):
+            archived = await read(database[self.archive_collection_name])
+        return hot, archived
+
+    async def changed_since(self, database, start, end, since):
+        """Whether any attendance in [start, end] was marked after `since`."""
+        query = self._changed_filter(start, end, since)
+
+        async def read(collection):
+            return await collection.find_one(query, {"_id": 1})
+
+        return any(await self._read_tiers(database, start, read))
+
+    async def iter_records(self, database, start, end):
+        """
+        Stream the per-day records in [start, end] from cursors, without loading
+        the range into memory. Archived records come first, so when a day is in
+        both tiers the later (hot) record is the current one.
+        """
+        collections = [database[self.collection_name]]
+        if await self._reaches_archive(database, start):
+            collections.insert(0, database[self.archive_collection_name])
+        for collection in collections:
+            async for record in self._range_records(collection, start, end):
+                yield record
+
+    async def _prepare_archive(self, database):
+        try:
+            await database.create_collection(self.archive_collection_name, storageEngine=ARCHIVE_STORAGE_ENGINE)
+        except CollectionInvalid:
+            pass
+        if self.archive_indexes:
+            await database[self.archive_collection_name].create_indexes(self.archive_indexes)
+
+    def archive_cutoff(self, today, hot_days):
+        return _day_start(today - timedelta(days=hot_days))
+
+    async def summary_stages(self, database, start, end, on_date):
+        """
+        Aggregation stages over `employees` that add each employee's
+        presentDays/absentDays within the optional [start, end] window and
+        todayStatus (status on `on_date`, or null).
+        """
+        window = {}
+        if start:
+            window["$gte"] = _day_start(start)
+        if end:
+            window["$lte"] = datetime.combine(end, datetime.max.time())
+        on_date_start = _day_start(on_date)
+        dates = {"$or": [{"date": window}, {"date": on_date_start}]} if window else {}
+        per_day = self._daily_status_stages(start, end, on_date, dates)
+
+        def lookup(collection_name, field):
+            return {
+                "$lookup": {
+                    "from": collection_name,
+                    "let": {"employeeId": "$employeeId"},
+                    "pipeline": per_day,
+                    "as": field,
+                }
+            }
+
+        stages = [lookup(self.collection_name, "_days")]
+        if await self._reaches_archive(database, start):
+            # A day corrected after archival is in both tiers until the next run; the hot one wins.
+            stages += [
+                lookup(self.archive_collection_name, "_archivedDays"),
+                {
+                    "$set": {
+                        "_days": {
+                            "$concatArrays": [
+                                "$_days",
+                                {"$filter": {"input": "$_archivedDays", "cond": {"$not": [{"$in": ["$$this.date", "$_days.date"]}]}}},
+                            ]
+                        }
+                    }
+                },
+            ]
+
+        def count(status):
+            conditions = [{"$eq": ["$$this.status", status]}]
+            conditions += [{op: ["$$this.date", bound]} for op, bound in window.items()]
+            return {"$size": {"$filter": {"input": "$_days", "cond": {"$and": conditions}}}}
+
+        on_date_record = {"$filter": {"input": "$_days", "cond": {"$eq": ["$$this.date", on_date_start]}}}
+        stages += [
+            {
+                "$set": {
+                    "presentDays": count("Present"),
+                    "absentDays": count("Absent"),
+                    "todayStatus": {"$arrayElemAt": [{"$map": {"input": on_date_record, "in": "$$this.status"}}, 0]},
+                }
+            },
+            {"$project": {"_days": 0, "_archivedDays": 0}},
+        ]
+        return stages
+
+    async def archive(self, database, before, batch_size=1000):
+        """
+        Move data older than `before` from the hot collection into the archive.
+
+        The cutoff is published first and the move waits until every worker has
+        picked it up, so no read skips the archive for data that is being moved.
+        A record marked again while it is being moved stays in the hot collection
+        for the next run. Returns the number of documents moved.
+        """
+        await self._prepare_archive(database)
+        state = database[ARCHIVE_STATE_COLLECTION]
+        current = await state.find_one({"_id": self.collection_name})
+        if current is None or current["archivedBefore"] < before:
+            await state.update_one(
+                {"_id": self.collection_name},
+                {"$set": {"archivedBefore": before, "updatedAt": datetime.utcnow()}},
+                upsert=True,
+            )
+            _watermarks.pop((database.name, self.collection_name), None)
+            print(f"Archive cutoff for {self.collection_name} is now {before:%Y-%m-%d}")
+            await asyncio.sleep(ARCHIVE_WATERMARK_CACHE_SECONDS)
+
+        hot = database[self.collection_name]
+        archive = database[self.archive_collection_name]
+        moved = 0
+        last_id = None
+        while True:
+            query = self._older_than(before)
+            if last_id is not None:
+                query["_id"] = {"$gt": last_id}
+            batch = await hot.find(query).sort("_id", 1).limit(batch_size).to_list(length=None)
+            if not batch:
+                return moved
+            last_id = batch[-1]["_id"]
+
+            await archive.bulk_write(await self._archive_writes(archive, batch), ordered=True)
+            # Only delete what was copied: a document marked since has a new updatedAt.
+            result = await hot.bulk_write(
+                [DeleteOne({"_id": doc["_id"], "updatedAt": doc.get("updatedAt")}) for doc in batch],
+                ordered=False,
+            )
+            moved += result.deleted_count
+
+
+class DocumentAttendanceStore(_TieredStore):
+    """One document per employee per day in `attendances`."""
+
+    collection_name = "attendances"
+    archive_indexes = [
+        IndexModel([("employeeId", 1), ("date", 1)], name="employeeId_1_date_1"),
+        IndexModel([("date", 1), ("updatedAt", 1)], name="date_1_updatedAt_1"),
+    ]
+
+    @staticmethod
+    def _employee_filter(employee_id):
+        # Legacy documents may only carry employee_id.
+        return {"$or": [{"employeeId": employee_id}, {"employee_id": employee_id}]}
+
+    async def find(self, database, employee_id=None, start=None, end=None, session=None):
+        """Records for an employee and/or inclusive date range, newest first."""
+        query = {}
+        if employee_id:
+            query.update(self._employee_filter(employee_id))
+        if start or end:
+            query["date"] = {}
+            if start:
+                query["date"]["$gte"] = _day_start(start)
+            if end:
+                query["date"]["$lte"] = datetime.combine(end, datetime.max.time())
+
+        async def read(collection):
+            return await collection.find(query, session=session).to_list(length=None)
+
+        hot, archived = await self._read_tiers(database, start, read)
+        if archived:
+            # A day corrected after archival is in both tiers until the next run.
+            hot_days = {self._day_key(r) for r in hot}
+            hot += [r for r in archived if self._day_key(r) not in hot_days]
+        return _sort_records(hot)
+
+    @staticmethod
+    def _day_key(record):
+        return record.get("employeeId") or record.get("employee_id"), record.get("date")
+
+    async def mark(self, database, employee_id, day, status, session=None):
+        """Upsert an employee's status for a day and return the saved record."""
+        date_dt = _day_start(day)
+        day_filter = {
+            "$or": [
+                {"employeeId": employee_id, "date": date_dt},
+                {"employee_id": employee_id, "date": date_dt},
+            ]
+        }
+        now = datetime.utcnow()
+        await database[self.collection_name].update_one(
+            day_filter,
+            {
+                # Keep both field variants for backward compatibility with legacy indexes/data.
+                "$set": {
+                    "employeeId": employee_id,
+                    "employee_id": employee_id,
+                    "status": status,
+                    "updatedAt": now,
+                },
+                "$setOnInsert": {"date": date_dt, "createdAt": now},
+            },
+            upsert=True,
+            session=session,
+        )
+        return await database[self.collection_name].find_one(day_filter, session=session)
+
+    async def stats(self, database, employee_id, session=None):
+        """(total, present, absent) days for an employee."""
+        async def read(collection):
+            return await collection.find(
+                self._employee_filter(employee_id), {"date": 1, "status": 1}, session=session
+            ).to_list(length=None)
+
+        records, archived = await self._read_tiers(database, None, read)
+        if archived:
+            hot_dates = {r.get("date") for r in records}
+            records += [r for r in archived if r.get("date") not in hot_dates]
+        present = sum(1 for r in records if r.get("status") == "Present")
+        absent = sum(1 for r in records if r.get("status") == "Absent")
+        return len(records), present, absent
+
+    def records_from_change(self, change):
+        """Per-day records touched by a change stream event on the collection."""
+        document = change.get("fullDocument")
+        return [document] if document else []
+
+    def _older_than(self, before):
+        return {"date": {"$lt": before}}
+
+    def _changed_filter(self, start, end, since):
+        return {
+            "date": {"$gte": _day_start(start), "$lte": datetime.combine(end, datetime.max.time())},
+            "updatedAt": {"$gt": since},
+        }
+
+    async def _range_records(self, collection, start, end):
+        cursor = collection.find(
+            {"date": {"$gte": _day_start(start), "$lte": datetime.combine(end, datetime.max.time())}},
+            {"employeeId": 1, "employee_id": 1, "date": 1, "status": 1},
+        )
+        async for record in cursor:
+            yield record
+
+    def _daily_status_stages(self, start, end, on_date, dates):
+        # Legacy records may only carry employee_id; count them like stats() does.
+        employee = {
+            "$or": [
+                {"$expr": {"$eq": ["$employeeId", "$$employeeId"]}},
+                {"$expr": {"$eq": ["$employee_id", "$$employeeId"]}},
+            ]
+        }
+        return [
+            {"$match": {"$and": [employee, dates]} if dates else employee},
+            {"$project": {"_id": 0, "date": 1, "status": 1}},
+        ]
+
+    async def _archive_writes(self, archive, batch):
+        writes = []
+        for doc in batch:
+            employee_id, day = self._day_key(doc)
+            # The hot copy is the newer one; drop an older archived copy of the same day.
+            writes.append(DeleteMany({**self._employee_filter(employee_id), "date": day, "_id": {"$ne": doc["_id"]}}))
+            writes.append(ReplaceOne({"_id": doc["_id"]}, doc, upsert=True))
+        return writes
+
+
+class BucketAttendanceStore(_TieredStore):
+    """One document per employee per month in `attendance_buckets`."""
+
+    collection_name = AttendanceBucket.Settings.name
+    archive_indexes = [
+        IndexModel([("month", 1), ("employeeId", 1)], name="month_1_employeeId_1"),
+        IndexModel([("employeeId", 1), ("month", 1)], name="employeeId_1_month_1"),
+        IndexModel([("month", 1), ("updatedAt", 1)], name="month_1_updatedAt_1"),
+    ]
+
+    @staticmethod
+    def bucket_id(employee_id, day):
+        return f"{employee_id}:{day.year:04d}-{day.month:02d}"
+
+    @staticmethod
+    def _month_start(day):
+        return datetime(day.year, day.month, 1)
+
+    @staticmethod
+    def _expand(bucket, start_index=0):
+        """
+        Per-day records for the marked days of a bucket.
+
+        start_index is the day index the arrays start at when they were read
+        with a $slice projection.
+        """
+        records = []
+        month = bucket["month"]
+        updated = bucket.get("updatedAt", [])
+        for position, code in enumerate(bucket.get("days", [])):
+            if code == UNMARKED:
+                continue
+            day_number = start_index + position + 1
+            records.append(
+                {
+                    "_id": f"{bucket['_id']}:{day_number:02d}",
+                    "employeeId": bucket["employeeId"],
+                    "date": month + timedelta(days=day_number - 1),
+                    "status": STATUS_NAMES.get(code),
+                    "createdAt": None,
+                    "updatedAt": updated[position] if position < len(updated) else None,
+                }
+            )
+        return records
+
+    @staticmethod
+    def _merge_buckets(hot, archived):
+        """
+        Buckets of the hot tier with unmarked slots filled from the archive tier.
+
+        After a month is archived, marking one of its days creates a new hot
+        bucket holding just that day until the next archive run merges it.
+        """
+        merged = {bucket["_id"]: bucket for bucket in archived}
+        for bucket in hot:
+            old = merged.get(bucket["_id"])
+            if old is not None:
+                bucket = dict(bucket)
+                updated = list(bucket.get("updatedAt", []))
+                days = list(bucket.get("days", []))
+                for i, code in enumerate(days):
+                    if code == UNMARKED and i < len(old.get("days", [])):
+                        days[i] = old["days"][i]
+                        updated[i] = old["updatedAt"][i]
+                bucket["days"], bucket["updatedAt"] = days, updated
+            merged[bucket["_id"]] = bucket
+        return list(merged.values())
+
+    @staticmethod
+    def _day_projection(index):
+        return {"employeeId": 1, "month": 1, "days": {"$slice": [index, 1]}, "updatedAt": {"$slice": [index, 1]}}
+
+    async def find(self, database, employee_id=None, start=None, end=None, session=None):
+        """Records for an employee and/or inclusive date range, newest first."""
+        # A single day: read just that slot of each bucket.
+        if start is not None and start == end:
+            index = start.day - 1
+            if employee_id:
+                query = {"_id": self.bucket_id(employee_id, start)}
+            else:
+                query = {"month": self._month_start(start), f"days.{index}": {"$ne": UNMARKED}}
+
+            async def read_day(collection):
+                return await collection.find(query, self._day_projection(index), session=session).to_list(length=None)
+
+            buckets = self._merge_buckets(*await self._read_tiers(database, start, read_day))
+            return _sort_records([r for b in buckets for r in self._expand(b, index)])
+
+        query = {}
+        if employee_id:
+            # By field (employeeId_1_month_1), not an _id prefix range: "<id>:" is also
+            # the prefix of the buckets of an employee whose ID starts with "<id>:".
+            query["employeeId"] = employee_id
+        if start or end:
+            query["month"] = {}
+            if start:
+                query["month"]["$gte"] = self._month_start(start)
+            if end:
+                query["month"]["$lte"] = self._month_start(end)
+
+        async def read(collection):
+            return await collection.find(query, session=session).to_list(length=None)
+
+        records = []
+        for bucket in self._merge_buckets(*await self._read_tiers(database, start, read)):
+            for record in self._expand(bucket):
+                record_day = record["date"].date()
+                if (start is None or record_day >= start) and (end is None or record_day <= end):
+                    records.append(record)
+        return _sort_records(records)
+
+    async def mark(self, database, employee_id, day, status, session=None):
+        """Set one day's slot (a positional update) and return the saved record."""
+        collection = database[self.collection_name]
+        bucket_id = self.bucket_id(employee_id, day)
+        index = day.day - 1
+        now = datetime.utcnow()
+        update = {"$set": {f"days.{index}": STATUS_CODES[status], f"updatedAt.{index}": now}}
+
+        for _ in range(2):
+            bucket = await collection.find_one_and_update(
+                {"_id": bucket_id},
+                update,
+                projection=self._day_projection(index),
+                return_document=ReturnDocument.AFTER,
+                session=session,
+            )
+            if bucket is not None:
+                return self._expand(bucket, index)[0]
+
+            # First mark of the month: create the bucket with every slot allocated.
+            days = [UNMARKED] * DAYS_PER_BUCKET
+            updated = [None] * DAYS_PER_BUCKET
+            days[index] = STATUS_CODES[status]
+            updated[index] = now
+            bucket = {"_id": bucket_id, "employeeId": employee_id, "month": self._month_start(day), "days": days, "updatedAt": updated}
+            try:
+                await collection.insert_one(bucket, session=session)
+                return [r for r in self._expand(bucket) if r["date"].day == day.day][0]
+            except DuplicateKeyError:
+                # Another request created the bucket first; retry the positional update.
+                continue
+        raise RuntimeError(f"Could not write attendance bucket {bucket_id}")
+
+    async def stats(self, database, employee_id, session=None):
+        """(total, present, absent) days for an employee."""
+        async def read(collection):
+            return await collection.find(
+                {"employeeId": employee_id},
+                {"days": 1, "updatedAt": 1},
+                session=session,
+            ).to_list(length=None)
+
+        present = absent = 0
+        for bucket in self._merge_buckets(*await self._read_tiers(database, None, read)):
+            days = bucket.get("days", [])
+            present += days.count(PRESENT)
+            absent += days.count(ABSENT)
+        return present + absent, present, absent
+
+    def records_from_change(self, change):
+        """Per-day records touched by a change stream event on the collection."""
+        bucket = change.get("fullDocument")
+        if not bucket:
+            return []
+        updated_fields = change.get("updateDescription", {}).get("updatedFields")
+        if updated_fields is None:
+            return self._expand(bucket)
+        touched = {int(key.split(".")[1]) + 1 for key in updated_fields if key.startswith("days.")}
+        return [r for r in self._expand(bucket) if r["date"].day in touched]
+
+    def archive_cutoff(self, today, hot_days):
+        # Only whole months are archived.
+        return self._month_start(today - timedelta(days=hot_days))
+
+    def _older_than(self, before):
+        return {"month": {"$lt": before}}
+
+    def _changed_filter(self, start, end, since):
+        # Month granularity: any day of an overlapping month marked since counts.
+        return {
+            "month": {"$gte": self._month_start(start), "$lte": self._month_start(end)},
+            "updatedAt": {"$gt": since},
+        }
+
+    async def _range_records(self, collection, start, end):
+        cursor = collection.find(
+            {"month": {"$gte": self._month_start(start), "$lte": self._month_start(end)}},
+            {"employeeId": 1, "month": 1, "days": 1},
+        )
+        async for bucket in cursor:
+            for record in self._expand(bucket):
+                if start <= record["date"].date() <= end:
+                    yield record
+
+    def _daily_status_stages(self, start, end, on_date, dates):
+        months = {}
+        if start:
+            months["$gte"] = self._month_start(start)
+        if end:
+            months["$lte"] = self._month_start(end)
+        month_match = {"$or": [{"month": months}, {"month": self._month_start(on_date)}]} if months else {}
+        return [
+            {"$match": {"$expr": {"$eq": ["$employeeId", "$$employeeId"]}, **month_match}},
+            {"$project": {"_id": 0, "month": 1, "days": 1}},
+            {"$unwind": {"path": "$days", "includeArrayIndex": "day"}},
+            {"$match": {"days": {"$ne": UNMARKED}}},
+            {
+                "$project": {
+                    "date": {"$add": ["$month", {"$multiply": ["$day", 24 * 60 * 60 * 1000]}]},
+                    "status": {"$cond": [{"$eq": ["$days", PRESENT]}, "Present", "Absent"]},
+                }
+            },
+            {"$match": dates},
+        ]
+
+    async def _archive_writes(self, archive, batch):
+        # Only this job writes to the archive, so a read-merge-replace is safe.
+        existing = await archive.find({"_id": {"$in": [b["_id"] for b in batch]}}).to_list(length=None)
+        return [ReplaceOne({"_id": b["_id"]}, b, upsert=True) for b in self._merge_buckets(batch, existing)]
+
+
+_stores = {"documents": DocumentAttendanceStore(), "buckets": BucketAttendanceStore()}
+
+
+def get_attendance_store():
+    """The configured attendance storage engine."""
+    if ATTENDANCE_STORAGE not in _stores:
+        raise RuntimeError(f"Unknown ATTENDANCE_STORAGE: {ATTENDANCE_STORAGE}")
+    return _stores[ATTENDANCE_STORAGE]
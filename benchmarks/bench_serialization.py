@@ -0,0 +1,65 @@
+"""
+Microbenchmarks for the per-record validation and serialization helpers.
+
+    pytest benchmarks/bench_serialization.py --benchmark-json benchmarks/results/micro.json
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+from typing import List
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGODB_URI", "mongodb://localhost:27017")
+
+from routers.attendance import AttendanceCreate, AttendanceOut, record_to_attendance_out, records_to_attendance_out
+from routers.employees import EmployeeCreate
+
+START = datetime(2024, 1, 1)
+
+RECORDS = [
+    {
+        "_id": ObjectId(),
+        "employeeId": f"EMP{i % 500:06d}",
+        "employee_id": f"EMP{i % 500:06d}",
+        "date": START + timedelta(days=i // 500),
+        "status": "Absent" if i % 20 == 0 else "Present",
+        "createdAt": START,
+        "updatedAt": START,
+    }
+    for i in range(5_000)
+]
+
+
+def test_record_to_attendance_out(benchmark):
+    benchmark(record_to_attendance_out, RECORDS[0])
+
+
+def test_records_to_attendance_out_5k(benchmark):
+    result = benchmark(records_to_attendance_out, RECORDS)
+    assert len(result) == len(RECORDS)
+
+
+def test_attendance_list_json_5k(benchmark):
+    attendance = records_to_attendance_out(RECORDS)
+    adapter = TypeAdapter(List[AttendanceOut])
+    benchmark(adapter.dump_json, attendance)
+
+
+def test_attendance_list_jsonable_encoder_5k(benchmark):
+    attendance = records_to_attendance_out(RECORDS)
+    benchmark(jsonable_encoder, attendance)
+
+
+def test_attendance_create_validation(benchmark):
+    payload = {"employeeId": " emp000001 ", "date": "2024-01-01", "status": "Present"}
+    benchmark(AttendanceCreate.model_validate, payload)
+
+
+def test_employee_create_validation(benchmark):
+    payload = {"employeeId": "emp1", "fullName": " John Doe ", "email": "John@Example.com", "department": "Sales"}
+    benchmark(EmployeeCreate.model_validate, payload)
+
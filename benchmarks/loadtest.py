@@ -0,0 +1,214 @@
+"""
+Scripted load benchmark.
+
+Starts a throwaway mongod (see benchmarks/mongod.py), seeds it, runs the API
+under uvicorn against it and drives these scenarios over HTTP:
+
+- checkin_burst: shift start, every employee POSTs /api/attendance at once
+- dashboard_polling: dashboards polling today's attendance and the employee list
+- login_storm: concurrent POST /api/auth/login
+- month_end_export: per-employee history/stats plus every day of the last month
+
+Throughput and p50/p95/p99 latency per scenario are written as JSON:
+
+    python -m benchmarks.loadtest --output benchmarks/results/run.json
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import statistics
+import subprocess
+from datetime import date, datetime, timedelta
+from importlib import metadata
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from benchmarks.mongod import local_mongod
+from benchmarks.seed import seed, user_email, BENCH_PASSWORD
+
+DATABASE_NAME = "hrms_bench"
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(mongodb_uri, workers):
+    """Run the app under uvicorn in a subprocess and wait until it reports a database connection."""
+    port = _free_port()
+    env = dict(os.environ, MONGODB_URI=mongodb_uri, MONGODB_DB=DATABASE_NAME, MONGODB_TLS="false")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--workers", str(workers), "--no-access-log"],
+        cwd=ROOT,
+        env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 600  # the first start builds indexes on the seeded data
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"{base_url}/api/health").json().get("database") == "Connected":
+                return process, base_url
+        except httpx.TransportError:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError("Server did not become ready")
+
+
+async def run_requests(client, requests, concurrency, expected_status):
+    """Send (method, url, kwargs) requests with bounded concurrency and summarize latencies."""
+    queue = asyncio.Queue()
+    for request in requests:
+        queue.put_nowait(request)
+    latencies = []
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        while not queue.empty():
+            method, url, kwargs = queue.get_nowait()
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, url, **kwargs)
+                if response.status_code != expected_status:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    if len(latencies) > 1:
+        cuts = [round(cut, 2) for cut in statistics.quantiles(latencies, n=100)]
+    else:
+        # No percentiles without samples (e.g. an empty scenario): report null.
+        cuts = [round(latencies[0], 2) if latencies else None] * 99
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "concurrency": concurrency,
+        "durationSeconds": round(elapsed, 3),
+        "throughputRps": round(len(latencies) / elapsed, 1) if elapsed > 0 else 0.0,
+        "p50Ms": cuts[49],
+        "p95Ms": cuts[94],
+        "p99Ms": cuts[98],
+    }
+
+
+def employee_ids(count):
+    return [f"EMP{i + 1:06d}" for i in range(count)]
+
+
+def scenarios(args):
+    today = date.today().isoformat()
+    last_month_end = date.today().replace(day=1) - timedelta(days=1)
+    last_month = [last_month_end.replace(day=d) for d in range(1, last_month_end.day + 1)]
+    sample = employee_ids(args.employees)[: args.export_sample]
+
+    return {
+        "checkin_burst": (
+            [("POST", "/api/attendance/", {"json": {"employeeId": e, "date": today, "status": "Present"}}) for e in employee_ids(args.employees)],
+            args.concurrency,
+            201,
+        ),
+        "dashboard_polling": (
+            [("GET", "/api/attendance/", {"params": {"date": today}}), ("GET", "/api/employees/", {})] * args.polls,
+            args.concurrency,
+            200,
+        ),
+        "login_storm": (
+            [("POST", "/api/auth/login", {"json": {"email": user_email(i % args.users), "password": BENCH_PASSWORD}}) for i in range(args.logins)],
+            args.concurrency,
+            200,
+        ),
+        "month_end_export": (
+            [("GET", f"/api/attendance/stats/{e}", {}) for e in sample]
+            + [("GET", f"/api/attendance/employee/{e}", {}) for e in sample]
+            + [("GET", "/api/attendance/", {"params": {"date": d.isoformat()}}) for d in last_month],
+            max(1, args.concurrency // 10),
+            200,
+        ),
+    }
+
+
+def versions():
+    packages = ["fastapi", "starlette", "pydantic", "beanie", "motor", "pymongo", "uvicorn"]
+    found = {}
+    for package in packages:
+        try:
+            found[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            found[package] = None
+    return found
+
+
+async def run_scenarios(base_url, args):
+    results = {}
+    selected = scenarios(args)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        for name in args.scenarios:
+            requests, concurrency, expected_status = selected[name]
+            print(f"Running {name} ({len(requests)} requests, concurrency {concurrency})")
+            results[name] = await run_requests(client, requests, concurrency, expected_status)
+            print(f"  {results[name]}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--employees", type=int, default=10_000)
+    parser.add_argument("--days", type=int, default=365, help="calendar days of attendance history")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--polls", type=int, default=500)
+    parser.add_argument("--logins", type=int, default=1_000)
+    parser.add_argument("--export-sample", type=int, default=500)
+    parser.add_argument("--scenarios", nargs="+", default=["checkin_burst", "dashboard_polling", "login_storm", "month_end_export"])
+    parser.add_argument("--skip-seed", action="store_true", help="reuse the data already in BENCH_MONGODB_URI")
+    parser.add_argument("--output", default=os.path.join(ROOT, "benchmarks", "results", f"{datetime.now():%Y%m%d-%H%M%S}.json"))
+    args = parser.parse_args()
+
+    with local_mongod() as mongodb_uri:
+        dataset = None
+        if not args.skip_seed:
+            started = time.perf_counter()
+            dataset = seed(mongodb_uri, DATABASE_NAME, employees=args.employees, days=args.days, users=args.users)
+            dataset["seedSeconds"] = round(time.perf_counter() - started, 1)
+            print(f"Seeded {dataset}")
+
+        process, base_url = start_server(mongodb_uri, args.workers)
+        try:
+            results = asyncio.run(run_scenarios(base_url, args))
+        finally:
+            process.terminate()
+            process.wait(timeout=60)
+
+    report = {
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "versions": versions(),
+        "python": sys.version.split()[0],
+        "dataset": dataset,
+        "workers": args.workers,
+        "scenarios": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
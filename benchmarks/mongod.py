@@ -0,0 +1,57 @@
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
+
+from pymongo import MongoClient
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def local_mongod(replica_set=True):
+    """
+    Yield the URI of a throwaway mongod.
+
+    Uses BENCH_MONGODB_URI if set; otherwise starts `mongod` from PATH on a free
+    port with a temporary dbpath (as a single-host replica set, so change streams
+    and secondary reads behave like production) and removes it afterwards.
+    """
+    uri = os.getenv("BENCH_MONGODB_URI")
+    if uri:
+        yield uri
+        return
+
+    mongod = shutil.which("mongod")
+    if not mongod:
+        raise RuntimeError("mongod not found on PATH; install MongoDB or set BENCH_MONGODB_URI")
+
+    port = _free_port()
+    dbpath = tempfile.mkdtemp(prefix="hrms-bench-")
+    args = [mongod, "--port", str(port), "--dbpath", dbpath, "--bind_ip", "127.0.0.1", "--quiet"]
+    if replica_set:
+        args += ["--replSet", "rs0"]
+    process = subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    try:
+        client = MongoClient(f"mongodb://127.0.0.1:{port}/?directConnection=true", serverSelectionTimeoutMS=30000)
+        client.admin.command("ping")
+        if replica_set:
+            client.admin.command("replSetInitiate", {"_id": "rs0", "members": [{"_id": 0, "host": f"127.0.0.1:{port}"}]})
+            while not client.admin.command("hello").get("isWritablePrimary"):
+                time.sleep(0.2)
+        client.close()
+
+        query = "?replicaSet=rs0" if replica_set else ""
+        yield f"mongodb://127.0.0.1:{port}/{query}"
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+        shutil.rmtree(dbpath, ignore_errors=True)
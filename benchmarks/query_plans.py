@@ -0,0 +1,235 @@
+"""
+Query-plan regression check.
+
+Starts a throwaway mongod (see benchmarks/mongod.py), seeds it, runs the app
+in-process and calls every route in routers/ once while a pymongo command
+listener records the queries each route issues. Every recorded query is then
+run through explain("executionStats") and fails the check if its plan has
+
+- a COLLSCAN (including collection scans inside $lookup),
+- an in-memory SORT / $sort, or
+- a docsExamined/nReturned ratio above --max-ratio,
+
+unless ALLOWED_PROBLEMS says the route is meant to read the whole collection.
+Exits with status 1 when any query fails, so it can gate CI:
+
+    python -m benchmarks.query_plans
+    python -m benchmarks.query_plans --storage buckets --output plans.json
+"""
+import os
+import sys
+import json
+import asyncio
+import argparse
+import contextvars
+from datetime import date, timedelta
+
+import httpx
+from pymongo import MongoClient, monitoring
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, "scripts"))
+
+from benchmarks.mongod import local_mongod
+from benchmarks.seed import seed, user_email, BENCH_PASSWORD
+from querylog import EXPLAINABLE_COMMANDS, _SESSION_FIELDS, query_shape, summarize_explain
+from metrics import command_collection
+
+DATABASE_NAME = "hrms_plans"
+
+# Routes that return a whole collection by design; a scan is the right plan for them.
+ALLOWED_PROBLEMS = {
+    "GET /api/employees": {"COLLSCAN"},
+    "GET /api/attendance": {"COLLSCAN"},
+}
+
+current_label = contextvars.ContextVar("current_label", default=None)
+
+
+class QueryRecorder(monitoring.CommandListener):
+    """Records explainable commands issued while a route is being checked."""
+
+    def __init__(self):
+        self.queries = []
+
+    def started(self, event):
+        label = current_label.get()
+        if label is not None and event.command_name in EXPLAINABLE_COMMANDS:
+            self.queries.append((label, event.database_name, event.command_name, dict(event.command)))
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def route_requests(sample):
+    """(label, method, url, kwargs) for every route, in an order that keeps them valid."""
+    today = date.today()
+    week_ago = (today - timedelta(days=7)).isoformat()
+    yesterday = (today - timedelta(days=1)).isoformat()
+    employee_id = sample["employeeId"]
+    return [
+        ("POST /api/auth/signup", "POST", "/api/auth/signup", {"json": {"email": "plans@example.com", "password": BENCH_PASSWORD, "fullName": "Plans"}}),
+        ("POST /api/auth/login", "POST", "/api/auth/login", {"json": {"email": user_email(0), "password": BENCH_PASSWORD}}),
+        ("POST /api/auth/login/form", "POST", "/api/auth/login/form", {"data": {"username": user_email(0), "password": BENCH_PASSWORD}}),
+        ("GET /api/auth/me", "GET", "/api/auth/me", {}),
+        ("GET /api/employees", "GET", "/api/employees/", {}),
+        ("GET /api/employees/{id}", "GET", f"/api/employees/{sample['_id']}", {}),
+        ("POST /api/employees", "POST", "/api/employees/", {"json": {"employeeId": "PLANS001", "fullName": "Plans", "email": "plans001@example.com", "department": sample["department"]}}),
+        ("DELETE /api/employees/{id}", "DELETE", "/api/employees/{created}", {}),
+        ("GET /api/attendance", "GET", "/api/attendance/", {}),
+        ("GET /api/attendance?date", "GET", "/api/attendance/", {"params": {"date": yesterday}}),
+        ("GET /api/attendance?employeeId", "GET", "/api/attendance/", {"params": {"employeeId": employee_id}}),
+        ("GET /api/attendance?employeeId&date", "GET", "/api/attendance/", {"params": {"employeeId": employee_id, "date": yesterday}}),
+        ("GET /api/attendance/employee/{employeeId}", "GET", f"/api/attendance/employee/{employee_id}", {}),
+        ("GET /api/attendance/employee/{employeeId}?startDate", "GET", f"/api/attendance/employee/{employee_id}", {"params": {"startDate": week_ago}}),
+        ("POST /api/attendance", "POST", "/api/attendance/", {"json": {"employeeId": employee_id, "date": today.isoformat(), "status": "Present"}}),
+        ("GET /api/attendance/stats/{employeeId}", "GET", f"/api/attendance/stats/{employee_id}", {}),
+        ("GET /api/dashboard/summary", "GET", "/api/dashboard/summary", {}),
+        ("GET /api/dashboard/summary?department&startDate&endDate", "GET", "/api/dashboard/summary", {"params": {"department": sample["department"], "startDate": week_ago, "endDate": yesterday}}),
+    ]
+
+
+async def record_queries(sample):
+    """Call every route against the seeded database and return the queries they issued."""
+    import main
+
+    recorder = QueryRecorder()
+    monitoring.register(recorder)  # applies to the client init_db creates
+
+    async with main.lifespan(main.app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://plans") as client:
+            headers = {}
+            created = None
+            for label, method, url, kwargs in route_requests(sample):
+                url = url.replace("{created}", str(created))
+                token = current_label.set(label)
+                try:
+                    response = await client.request(method, url, headers=headers, **kwargs)
+                finally:
+                    current_label.reset(token)
+                if response.status_code >= 400:
+                    raise RuntimeError(f"{label} returned {response.status_code}: {response.text}")
+                body = response.json()
+                if label == "POST /api/auth/login":
+                    headers = {"Authorization": f"Bearer {body['access_token']}"}
+                if label == "POST /api/employees":
+                    created = body.get("_id") or body.get("id")
+    return recorder.queries
+
+
+def plan_problems(explain, max_ratio):
+    """Problems found anywhere in an explain() result (rejected plans are ignored)."""
+    problems = set()
+
+    def walk(node):
+        if isinstance(node, list):
+            for item in node:
+                walk(item)
+            return
+        if not isinstance(node, dict):
+            return
+        stage = node.get("stage")
+        if stage == "COLLSCAN":
+            problems.add("COLLSCAN")
+        elif stage == "SORT":
+            problems.add("SORT")
+        if isinstance(node.get("$sort"), dict) and "sortKey" in node["$sort"]:
+            # An aggregation $sort stage that wasn't pushed down into an index scan.
+            problems.add("SORT")
+        if node.get("collectionScans"):
+            problems.add("COLLSCAN")
+        if "executionStages" in node:
+            ratio = node.get("totalDocsExamined", 0) / max(node.get("nReturned", 0), 1)
+            if ratio > max_ratio:
+                problems.add("RATIO")
+        for key, value in node.items():
+            # "command" echoes the explained command, not its plan.
+            if key not in ("rejectedPlans", "allPlansExecution", "command"):
+                walk(value)
+
+    walk(explain)
+    return problems
+
+
+def check_plans(uri, queries, max_ratio):
+    client = MongoClient(uri)
+    results = []
+    seen = set()
+    for label, database_name, command_name, command in queries:
+        shape = query_shape(command_name, command)
+        collection = command_collection(command_name, command)
+        key = json.dumps([label, collection, command_name, shape], sort_keys=True, default=str)
+        if key in seen:
+            continue
+        seen.add(key)
+
+        explain_command = {k: v for k, v in command.items() if not k.startswith("$") and k not in _SESSION_FIELDS}
+        explain = client[database_name].command({"explain": explain_command, "verbosity": "executionStats"})
+        problems = plan_problems(explain, max_ratio)
+        allowed = ALLOWED_PROBLEMS.get(label, set())
+        results.append(
+            {
+                "route": label,
+                "collection": collection,
+                "command": command_name,
+                "shape": shape,
+                "plan": summarize_explain(explain),
+                "problems": sorted(problems),
+                "allowed": sorted(problems & allowed),
+                "ok": problems <= allowed,
+            }
+        )
+    client.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--employees", type=int, default=2_000)
+    parser.add_argument("--days", type=int, default=120, help="calendar days of attendance history")
+    parser.add_argument("--storage", choices=["documents", "buckets"], default="documents")
+    parser.add_argument("--max-ratio", type=float, default=10, help="maximum docsExamined/nReturned")
+    parser.add_argument("--output", help="also write the results as JSON")
+    args = parser.parse_args()
+
+    with local_mongod() as mongodb_uri:
+        print(seed(mongodb_uri, DATABASE_NAME, employees=args.employees, days=args.days, users=5))
+        with MongoClient(mongodb_uri) as client:
+            sample = client[DATABASE_NAME].employees.find_one({}, {"employeeId": 1, "department": 1})
+
+        # The app reads its configuration from the environment at import time.
+        os.environ.update(
+            MONGODB_URI=mongodb_uri,
+            MONGODB_DB=DATABASE_NAME,
+            MONGODB_TLS="false",
+            MONGODB_STARTUP_MODE="full",
+            ATTENDANCE_STORAGE=args.storage,
+        )
+        if args.storage == "buckets":
+            from migrate_attendance_buckets import migrate_attendance_buckets
+
+            asyncio.run(migrate_attendance_buckets())
+
+        queries = asyncio.run(record_queries(sample))
+        results = check_plans(mongodb_uri, queries, args.max_ratio)
+
+    failures = [r for r in results if not r["ok"]]
+    for r in results:
+        status = "FAIL" if not r["ok"] else "ok  "
+        note = f" problems={r['problems']}" if r["problems"] else ""
+        print(f"{status} {r['route']}: {r['collection']}.{r['command']} {r['plan']['planStages']}{note}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, default=str)
+
+    print(f"{len(results)} query shapes checked, {len(failures)} failed")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import os
+import sys
+from datetime import date, timedelta
+from itertools import islice
+
+from pymongo import MongoClient
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+from generate_data import employee_docs, attendance_docs, user_docs, working_days, user_email, DEFAULT_PASSWORD
+
+BENCH_PASSWORD = DEFAULT_PASSWORD
+
+
+def _insert(collection, docs, batch_size):
+    count = 0
+    docs = iter(docs)
+    while True:
+        batch = list(islice(docs, batch_size))
+        if not batch:
+            return count
+        collection.insert_many(batch, ordered=False)
+        count += len(batch)
+
+
+def seed(uri, database_name, employees=10_000, days=365, users=200, batch_size=10_000, seed_value=42):
+    """
+    Load a benchmark dataset with scripts/generate_data.py's generators:
+    employees, `days` calendar days of attendance ending yesterday, and users
+    sharing BENCH_PASSWORD.
+    """
+    client = MongoClient(uri)
+    db = client[database_name]
+    for name in ("employees", "attendances", "users"):
+        db.drop_collection(name)
+
+    end = date.today() - timedelta(days=1)
+    start = end - timedelta(days=days - 1)
+
+    counts = {
+        "employees": _insert(db.employees, employee_docs(employees, start, end, seed_value), batch_size),
+        "attendance": _insert(
+            db.attendances,
+            attendance_docs(employee_docs(employees, start, end, seed_value), working_days(start, end), seed_value),
+            batch_size,
+        ),
+        "users": _insert(db.users, user_docs(users, seed_value, False, None, 1), batch_size),
+    }
+    client.close()
+    return counts
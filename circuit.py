@@ -0,0 +1,239 @@
+"""
+MongoDB circuit breaker.
+
+db_breaker trips (opens) after MONGODB_CIRCUIT_FAILURE_THRESHOLD consecutive
+connection failures or timeouts of MongoDB commands or requests, when the
+driver loses its primary, or when init_db fails. While it is open,
+CircuitBreakerMiddleware answers database-backed API requests with 503 right
+away instead of letting each one wait for server selection. After
+MONGODB_CIRCUIT_OPEN_SECONDS it goes half-open and lets exactly one request
+through as a probe, answering the others with 503 until the probe is done:
+a success closes the breaker, a failure opens it for another period.
+
+Timeouts of requests whose client asked for a shorter deadline than the
+route's default (deadlines.py) are not counted: they say nothing about
+MongoDB's health.
+
+Outcomes come from pymongo listeners (BreakerCommandListener,
+BreakerTopologyListener) registered by database.command_listeners(), so every
+driver call is covered without wrapping individual queries. Server selection
+timeouts and connection errors happen before any command is sent, so they
+are recorded from the requests that raise them (record_request_error). The
+state is reported by GET /api/health.
+"""
+import os
+import time
+import threading
+from datetime import datetime
+
+from fastapi.responses import JSONResponse
+from pymongo import monitoring
+from pymongo.errors import AutoReconnect
+
+from deadlines import client_deadline
+
+
+CIRCUIT_BREAKER_ENABLED = os.getenv("MONGODB_CIRCUIT_BREAKER_ENABLED", "true").lower() != "false"
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("MONGODB_CIRCUIT_FAILURE_THRESHOLD", 5))
+CIRCUIT_OPEN_SECONDS = float(os.getenv("MONGODB_CIRCUIT_OPEN_SECONDS", 10))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Server error code for an operation that exceeded maxTimeMS.
+MAX_TIME_MS_EXPIRED = 50
+# Server error codes meaning the member can't serve the command right now
+# (stepped down, shutting down, unreachable) rather than that it was rejected.
+UNAVAILABLE_CODES = {
+    6,  # HostUnreachable
+    7,  # HostNotFound
+    89,  # NetworkTimeout
+    91,  # ShutdownInProgress
+    189,  # PrimarySteppedDown
+    9001,  # SocketException
+    10107,  # NotWritablePrimary
+    11600,  # InterruptedAtShutdown
+    11602,  # InterruptedDueToReplStateChange
+    13435,  # NotPrimaryNoSecondaryOk
+    13436,  # NotPrimaryOrSecondary
+}
+
+# allow_request() result for the one request let through while half-open.
+PROBE = "probe"
+
+# Paths served without MongoDB, never short-circuited.
+EXEMPT_PATHS = ("/api/health", "/api/admin")
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker; safe to call from driver threads."""
+
+    def __init__(self, failure_threshold, open_seconds):
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.opened_at_wall = None
+        self.last_failure = None
+        self.probing = False
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.opened_at_wall = datetime.utcnow()
+        self.probing = False
+
+    def allow_request(self):
+        """
+        True while closed, False while open. Once the open period is over
+        (half-open) it returns PROBE to one caller, which must call
+        probe_finished() when done, and False to everyone else meanwhile.
+        """
+        with self.lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.open_seconds:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN:
+                if self.probing:
+                    return False
+                self.probing = True
+                return PROBE
+            return self.state == CLOSED
+
+    def probe_finished(self):
+        """The probe is done; if it didn't reach MongoDB, the next request probes."""
+        with self.lock:
+            self.probing = False
+
+    def retry_after(self):
+        with self.lock:
+            if self.state == HALF_OPEN:
+                return 1
+            if self.state != OPEN:
+                return 0
+            return max(0, self.open_seconds - (time.monotonic() - self.opened_at))
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            if self.state != CLOSED:
+                print("MongoDB circuit breaker closed")
+            self.state = CLOSED
+            self.opened_at = self.opened_at_wall = None
+            self.probing = False
+
+    def record_failure(self, reason):
+        with self.lock:
+            self.failures += 1
+            self.last_failure = reason
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self._open()
+                print(f"MongoDB circuit breaker opened: {reason}")
+
+    def trip(self, reason):
+        """Open immediately (e.g. the database is known to be unreachable)."""
+        with self.lock:
+            self.last_failure = reason
+            if self.state != OPEN:
+                self._open()
+                print(f"MongoDB circuit breaker opened: {reason}")
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "state": self.state,
+                "consecutiveFailures": self.failures,
+                "probeInFlight": self.probing,
+                "openedAt": self.opened_at_wall.isoformat() + "Z" if self.opened_at_wall else None,
+                "lastFailure": self.last_failure,
+            }
+
+
+db_breaker = CircuitBreaker(CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_OPEN_SECONDS)
+
+
+def record_request_error(error):
+    """
+    Count a server selection timeout or connection error raised while handling
+    a request; unlike command failures, these never reach the command listener.
+    """
+    if CIRCUIT_BREAKER_ENABLED and isinstance(error, AutoReconnect) and not client_deadline.get():
+        db_breaker.record_failure(f"{type(error).__name__}: {error}")
+
+
+def is_availability_failure(failure):
+    """
+    Whether a CommandFailedEvent.failure means MongoDB is unavailable or slow
+    rather than that the command was rejected (e.g. a duplicate key).
+    """
+    # Driver-side errors (network errors, timeouts) are published as {"errmsg", "errtype"};
+    # server errors are the server's reply with a "code".
+    code = failure.get("code")
+    return "errtype" in failure or code == MAX_TIME_MS_EXPIRED or code in UNAVAILABLE_CODES
+
+
+class BreakerCommandListener(monitoring.CommandListener):
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        db_breaker.record_success()
+
+    def failed(self, event):
+        if is_availability_failure(event.failure):
+            if client_deadline.get():
+                # Runs in the driver thread with the request's context copied by Motor.
+                return
+            db_breaker.record_failure(f"{event.command_name}: {event.failure.get('errmsg', '')}")
+        else:
+            # The server answered, so it is reachable.
+            db_breaker.record_success()
+
+
+class BreakerTopologyListener(monitoring.TopologyListener):
+    """Opens the breaker when the driver loses its primary, closes it when one is found."""
+
+    def opened(self, event):
+        pass
+
+    def closed(self, event):
+        pass
+
+    def description_changed(self, event):
+        had_primary = event.previous_description.has_writable_server()
+        has_primary = event.new_description.has_writable_server()
+        if had_primary and not has_primary:
+            db_breaker.trip("no reachable primary")
+        elif has_primary and not had_primary:
+            db_breaker.record_success()
+
+
+class CircuitBreakerMiddleware:
+    """Pure ASGI middleware failing API requests fast while the breaker is open."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith("/api/") or scope["path"].startswith(EXEMPT_PATHS):
+            return await self.app(scope, receive, send)
+
+        allowed = db_breaker.allow_request()
+        if allowed:
+            try:
+                return await self.app(scope, receive, send)
+            except Exception as e:
+                record_request_error(e)
+                raise
+            finally:
+                if allowed == PROBE:
+                    db_breaker.probe_finished()
+
+        response = JSONResponse(
+            {"detail": "Database unavailable"},
+            status_code=503,
+            headers={"Retry-After": str(max(1, round(db_breaker.retry_after())))},
+        )
+        await response(scope, receive, send)
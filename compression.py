@@ -0,0 +1,224 @@
+"""
+Negotiated response compression.
+
+CompressionMiddleware compresses JSON/text responses of at least
+COMPRESSION_MIN_SIZE bytes with the best encoding the client accepts
+(Accept-Encoding, honouring q-values) out of COMPRESSION_ENCODINGS, in the
+server's order of preference. gzip is always available; br and zstd use the
+`brotli` / `zstandard` packages (in requirements.txt) and are skipped if they
+are not installed.
+
+Compressed bodies of GET responses are kept in a small LRU cache keyed by
+encoding and a digest of the uncompressed body, so an unchanged payload (the
+employee directory, a day's attendance) is compressed once and then reused.
+The cache is bounded by entries and by total compressed bytes.
+
+Streaming responses (e.g. the text/event-stream live feed) are passed through
+untouched. Every response of a compressible type carries
+`Vary: Accept-Encoding`, compressed or not, so shared caches keep the encodings
+apart.
+"""
+import os
+import gzip
+import hashlib
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() != "false"
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", 1024))
+COMPRESSION_ENCODINGS = [
+    e.strip() for e in os.getenv("COMPRESSION_ENCODINGS", "zstd,br,gzip").split(",") if e.strip()
+]
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", 6))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", 5))
+COMPRESSION_ZSTD_LEVEL = int(os.getenv("COMPRESSION_ZSTD_LEVEL", 3))
+# Number of compressed bodies kept for reuse (0 disables the cache) and their total size.
+COMPRESSION_CACHE_SIZE = int(os.getenv("COMPRESSION_CACHE_SIZE", 256))
+COMPRESSION_CACHE_BYTES = int(os.getenv("COMPRESSION_CACHE_BYTES", 32 * 1024 * 1024))
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript")
+UNCOMPRESSIBLE_TYPES = ("text/event-stream",)
+
+
+def _gzip(body):
+    return gzip.compress(body, compresslevel=COMPRESSION_GZIP_LEVEL, mtime=0)
+
+
+def _available_compressors():
+    compressors = {"gzip": _gzip}
+    if brotli is not None:
+        compressors["br"] = lambda body: brotli.compress(body, quality=COMPRESSION_BROTLI_QUALITY)
+    if zstandard is not None:
+        compressor = zstandard.ZstdCompressor(level=COMPRESSION_ZSTD_LEVEL)
+        compressors["zstd"] = compressor.compress
+    return compressors
+
+
+COMPRESSORS = _available_compressors()
+
+
+def parse_accept_encoding(value):
+    """Accept-Encoding header -> {coding: q}."""
+    accepted = {}
+    for part in value.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def choose_encoding(accept_encoding):
+    """The preferred configured encoding the client accepts, or None."""
+    accepted = parse_accept_encoding(accept_encoding)
+    wildcard = accepted.get("*", 0.0)
+    for encoding in COMPRESSION_ENCODINGS:
+        if encoding in COMPRESSORS and accepted.get(encoding, wildcard) > 0:
+            return encoding
+    return None
+
+
+class CompressedBodyCache:
+    """LRU of compressed bodies keyed by (encoding, digest of the uncompressed body)."""
+
+    def __init__(self, size, max_bytes):
+        self.size = size
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        body = self.entries.get(key)
+        if body is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return body
+
+    def put(self, key, body):
+        if self.size <= 0 or len(body) > self.max_bytes:
+            return
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.bytes -= len(old)
+        self.entries[key] = body
+        self.bytes += len(body)
+        while len(self.entries) > self.size or self.bytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.bytes -= len(evicted)
+
+
+compressed_cache = CompressedBodyCache(COMPRESSION_CACHE_SIZE, COMPRESSION_CACHE_BYTES)
+
+
+def compress_body(encoding, body, cacheable):
+    if not cacheable:
+        return COMPRESSORS[encoding](body)
+    key = (encoding, hashlib.blake2b(body, digest_size=16).digest())
+    compressed = compressed_cache.get(key)
+    if compressed is None:
+        compressed = COMPRESSORS[encoding](body)
+        compressed_cache.put(key, compressed)
+    return compressed
+
+
+def _header(headers, name):
+    for key, value in headers:
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return None
+
+
+def _with_vary(headers):
+    """Response headers with Accept-Encoding added to Vary."""
+    vary = _header(headers, b"vary")
+    if vary and "accept-encoding" in vary.lower():
+        return list(headers)
+    headers = [(k, v) for k, v in headers if k.lower() != b"vary"]
+    headers.append((b"vary", f"{vary}, Accept-Encoding".encode() if vary else b"Accept-Encoding"))
+    return headers
+
+
+def _compressible(headers):
+    if _header(headers, b"content-encoding"):
+        return False
+    content_type = (_header(headers, b"content-type") or "").lower()
+    if content_type.startswith(UNCOMPRESSIBLE_TYPES):
+        return False
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+class CompressionMiddleware:
+    """Pure ASGI middleware compressing complete (non-streaming) responses."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        encoding = None
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                encoding = choose_encoding(value.decode("latin-1"))
+                break
+        cacheable = scope["method"] == "GET"
+        start = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start, passthrough
+            if passthrough:
+                return await send(message)
+
+            if message["type"] == "http.response.start":
+                if not _compressible(message.get("headers", [])):
+                    passthrough = True
+                    return await send(message)
+                # Whether or not this one gets compressed, the response depends on Accept-Encoding.
+                start = {**message, "headers": _with_vary(message.get("headers", []))}
+                if encoding is None:
+                    passthrough = True
+                    return await send(start)
+                return
+
+            if message["type"] != "http.response.body":
+                return await send(message)
+
+            body = message.get("body", b"")
+            if message.get("more_body", False) or len(body) < COMPRESSION_MIN_SIZE:
+                # Streaming or small: send as is.
+                passthrough = True
+                await send(start)
+                return await send(message)
+
+            headers = [(k, v) for k, v in start["headers"] if k.lower() != b"content-length"]
+            compressed = compress_body(encoding, body, cacheable)
+            headers.append((b"content-encoding", encoding.encode()))
+            headers.append((b"content-length", str(len(compressed)).encode()))
+            await send({**start, "headers": headers})
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_wrapper)
@@ -1,11 +1,31 @@
 import os
+import asyncio
+import time
+from contextlib import asynccontextmanager
 from beanie import init_beanie
+from beanie.odm.utils.init import Initializer
 from motor.motor_asyncio import AsyncIOMotorClient
+from bson import Timestamp
+from pymongo import IndexModel
+from pymongo.read_preferences import Primary, PrimaryPreferred, Secondary, SecondaryPreferred, Nearest
 import certifi
 
 from models.employee import Employee
 from models.attendance import Attendance
 from models.user import User
+from models.attendance_bucket import AttendanceBucket
+from metrics import METRICS_ENABLED, MongoCommandMetrics
+from querylog import SLOW_QUERY_LOG_ENABLED, slow_query_log
+from profiling import PROFILING_ENABLED, ProfileCommandListener
+from circuit import (
+    CIRCUIT_BREAKER_ENABLED,
+    PROBE,
+    BreakerCommandListener,
+    BreakerTopologyListener,
+    db_breaker,
+    record_request_error,
+)
+from tenancy import current_tenant, tenant_database_name
 
 
 MONGODB_URI = os.getenv("MONGODB_URI")
@@ -15,11 +35,39 @@ if not MONGODB_URI:
 
 DATABASE_NAME = os.getenv("MONGODB_DB", "hrms_lite")
 
+# "full" creates/repairs indexes on every start; "fast" only verifies them and
+# leaves index builds to scripts/migrate_indexes.py.
+STARTUP_MODE = os.getenv("MONGODB_STARTUP_MODE", "full").lower()
+SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGODB_SERVER_SELECTION_TIMEOUT_MS", 30000))
+
+# Backoff cap between background reconnect attempts when init_db failed.
+RECONNECT_MAX_DELAY_SECONDS = float(os.getenv("MONGODB_RECONNECT_MAX_DELAY", 60))
+
+MONGODB_TLS = os.getenv("MONGODB_TLS", "true").lower() != "false"
+
+# Read preference used by heavy reporting reads (lists, stats, exports). Writes and
+# read-your-writes paths always use the primary.
+REPORTING_READ_PREFERENCE = os.getenv("MONGODB_REPORTING_READ_PREFERENCE", "secondaryPreferred")
+REPORTING_MAX_STALENESS_SECONDS = int(os.getenv("MONGODB_REPORTING_MAX_STALENESS_SECONDS", -1))
+
+READ_PRIMARY = "primary"
+READ_REPORTING = "reporting"
+
+DOCUMENT_MODELS = [Employee, Attendance, User, AttendanceBucket]
+# Models stored per tenant (users stay in the default database).
+TENANT_MODELS = [Employee, Attendance, AttendanceBucket]
+
 
 client = None
 database = None
 last_db_error = None
-
+startup_timings = {}
+database_views = {}
+tenant_databases = {}
+prepared_tenants = set()
+tenant_locks = {}
+reconnect_task = None
+reconnect_attempts = 0
 
 
 async def ensure_attendance_indexes(db):
@@ -53,33 +101,191 @@ async def ensure_attendance_indexes(db):
         print(f"Warning: failed to ensure attendance index: {e}")
 
 
-async def init_db():
-    global client, database, last_db_error
+def _expected_index_names(model):
+    """Index names declared in a model's Settings.indexes."""
+    names = set()
+    for index in model.Settings.indexes:
+        if isinstance(index, str):
+            names.add(f"{index}_1")
+        else:
+            names.add(index.document["name"])
+    return names
+
+
+def _index_models(model):
+    return [IndexModel([(index, 1)]) if isinstance(index, str) else index for index in model.Settings.indexes]
+
+
+async def check_indexes(db, models=DOCUMENT_MODELS):
+    """
+    Verify the expected indexes exist without building anything.
+
+    Runs a single list_indexes pass per collection (concurrently) and returns a
+    mapping of collection name to missing index names. The legacy
+    employee_id_1_date_1 index is reported as well since it breaks attendance upserts.
+    """
+
+    async def missing_for(model):
+        collection_name = model.Settings.name
+        existing = {index["name"] async for index in db[collection_name].list_indexes()}
+        missing = sorted(_expected_index_names(model) - existing)
+        if collection_name == "attendances" and "employee_id_1_date_1" in existing:
+            missing.append("(drop) employee_id_1_date_1")
+        return collection_name, missing
+
+    results = await asyncio.gather(*(missing_for(model) for model in models))
+    problems = {name: missing for name, missing in results if missing}
+    for name, missing in problems.items():
+        print(f"Warning: {name} index mismatch {missing}; run scripts/migrate_indexes.py")
+    return problems
+
 
+class _NoIndexInitializer(Initializer):
+    """Beanie initializer that skips index syncing (fast startup mode)."""
+
+    async def init_indexes(self, cls, allow_index_dropping: bool = False):
+        return None
+
+
+async def _timed(name, awaitable):
+    start = time.perf_counter()
     try:
-        client = AsyncIOMotorClient(MONGODB_URI,tls=True,tlsCAFile=certifi.where(),serverSelectionTimeoutMS=30000)
-        database = client[DATABASE_NAME]
+        return await awaitable
+    finally:
+        startup_timings[name] = round((time.perf_counter() - start) * 1000, 1)
 
-        await client.admin.command("ping")
 
-        await ensure_attendance_indexes(database)
+def command_listeners():
+    """pymongo command listeners to register on the client."""
+    listeners = []
+    if METRICS_ENABLED:
+        listeners.append(MongoCommandMetrics())
+    if SLOW_QUERY_LOG_ENABLED:
+        listeners.append(slow_query_log)
+    if PROFILING_ENABLED:
+        listeners.append(ProfileCommandListener())
+    if CIRCUIT_BREAKER_ENABLED:
+        listeners += [BreakerCommandListener(), BreakerTopologyListener()]
+    return listeners
+
+
+async def init_db(startup_mode=None):
+    global client, database, last_db_error
+
+    startup_mode = (startup_mode or STARTUP_MODE).lower()
+    startup_timings.clear()
+    database_views.clear()
+    tenant_databases.clear()
+    started = time.perf_counter()
 
-        await init_beanie(
-            database=database,
-            document_models=[Employee, Attendance, User],
+    if client is not None:
+        # Re-initializing after a failed attempt; drop the old client and its monitors.
+        client.close()
+
+    try:
+        tls_options = {"tls": True, "tlsCAFile": certifi.where()} if MONGODB_TLS else {}
+        client = AsyncIOMotorClient(
+            MONGODB_URI,
+            serverSelectionTimeoutMS=SERVER_SELECTION_TIMEOUT_MS,
+            event_listeners=command_listeners(),
+            **tls_options,
         )
+        database = client[DATABASE_NAME]
+        slow_query_log.attach(client, asyncio.get_running_loop())
+
+        # The ping, index work and Beanie model setup don't depend on each other.
+        if startup_mode == "fast":
+            steps = [
+                _timed("ping", client.admin.command("ping")),
+                _timed("check_indexes", check_indexes(database)),
+                _timed("init_beanie", _NoIndexInitializer(database=database, document_models=DOCUMENT_MODELS)),
+            ]
+        else:
+            steps = [
+                _timed("ping", client.admin.command("ping")),
+                _timed("ensure_attendance_indexes", ensure_attendance_indexes(database)),
+                _timed("init_beanie", init_beanie(database=database, document_models=DOCUMENT_MODELS)),
+            ]
+        await asyncio.gather(*steps)
 
         last_db_error = None
-        print("Connected to MongoDB")
+        db_breaker.record_success()
+        startup_timings["total"] = round((time.perf_counter() - started) * 1000, 1)
+        print(f"Connected to MongoDB ({startup_mode} startup)")
+        print("Startup timings (ms):", ", ".join(f"{k}={v}" for k, v in startup_timings.items()))
         return database
 
     except Exception as e:
         last_db_error = str(e)
         database = None
+        if CIRCUIT_BREAKER_ENABLED:
+            db_breaker.trip(f"init_db: {last_db_error}")
         print("MongoDB connection error:", last_db_error)
         return None
 
 
+async def ensure_tenant_indexes(tenant_db):
+    """Create/repair the indexes of a tenant database (idempotent)."""
+    await asyncio.gather(
+        ensure_attendance_indexes(tenant_db),
+        *(tenant_db[model.Settings.name].create_indexes(_index_models(model)) for model in TENANT_MODELS),
+    )
+
+
+async def prepare_tenant(tenant):
+    """
+    Build (or, in fast startup mode, check) a tenant database's indexes the
+    first time this process serves the tenant.
+    """
+    if tenant in prepared_tenants or client is None:
+        return
+    lock = tenant_locks.setdefault(tenant, asyncio.Lock())
+    async with lock:
+        if tenant in prepared_tenants:
+            return
+        tenant_db = client[tenant_database_name(tenant)]
+        try:
+            if STARTUP_MODE == "fast":
+                await check_indexes(tenant_db, TENANT_MODELS)
+            else:
+                await ensure_tenant_indexes(tenant_db)
+            prepared_tenants.add(tenant)
+            print(f"Prepared tenant database {tenant_db.name}")
+        except Exception as e:
+            # Serve the request anyway; the next request retries.
+            print(f"Warning: failed to prepare tenant {tenant}: {e}")
+
+
+async def _reconnect_loop():
+    global reconnect_attempts
+    delay = 1
+    while database is None:
+        await asyncio.sleep(delay)
+        reconnect_attempts += 1
+        print(f"Reconnecting to MongoDB (attempt {reconnect_attempts})")
+        await init_db()
+        delay = min(delay * 2, RECONNECT_MAX_DELAY_SECONDS)
+    reconnect_attempts = 0
+
+
+def start_reconnect_supervisor():
+    """Keep re-running init_db in the background, with exponential backoff, until it succeeds."""
+    global reconnect_task
+    if reconnect_task is None or reconnect_task.done():
+        reconnect_task = asyncio.create_task(_reconnect_loop())
+
+
+async def stop_reconnect_supervisor():
+    global reconnect_task
+    if reconnect_task is not None:
+        reconnect_task.cancel()
+        try:
+            await reconnect_task
+        except asyncio.CancelledError:
+            pass
+        reconnect_task = None
+
+
 async def close_db():
     """Close MongoDB connection"""
     global client
@@ -89,20 +295,122 @@ async def close_db():
 
 async def get_db_status():
     """Check if database is connected"""
+    if database is None:
+        return False
+    allowed = db_breaker.allow_request()
+    if not allowed:
+        # Don't wait for server selection when we already know it is down.
+        return False
     try:
         if client:
             await client.admin.command('ping')
             return True
-    except:
-        pass
+    except Exception as e:
+        record_request_error(e)
+    finally:
+        if allowed == PROBE:
+            db_breaker.probe_finished()
     return False
 
-def get_database():
-    """Get the database instance"""
-    global database
+def make_read_preference(mode, max_staleness_seconds=-1):
+    """Build a pymongo read preference from its mode name (e.g. "secondaryPreferred")."""
+    modes = {
+        "primaryPreferred": PrimaryPreferred,
+        "secondary": Secondary,
+        "secondaryPreferred": SecondaryPreferred,
+        "nearest": Nearest,
+    }
+    if mode == "primary":
+        return Primary()
+    if mode not in modes:
+        raise ValueError(f"Unknown read preference: {mode}")
+    return modes[mode](max_staleness=max_staleness_seconds)
+
+
+def get_database(read_preference=READ_PRIMARY):
+    """
+    Get the current tenant's database (see tenancy.py), or the default one.
+
+    Pass READ_REPORTING for heavy reads that may be served by a secondary
+    (MONGODB_REPORTING_READ_PREFERENCE / MONGODB_REPORTING_MAX_STALENESS_SECONDS).
+    """
+    if database is None:
+        return None
+
+    tenant = current_tenant.get()
+    base = database
+    if tenant is not None:
+        base = tenant_databases.get(tenant)
+        if base is None:
+            base = tenant_databases[tenant] = client[tenant_database_name(tenant)]
+    if read_preference == READ_PRIMARY:
+        return base
+
+    view = database_views.get((tenant, read_preference))
+    if view is None:
+        if read_preference == READ_REPORTING:
+            pref = make_read_preference(REPORTING_READ_PREFERENCE, REPORTING_MAX_STALENESS_SECONDS)
+        else:
+            pref = make_read_preference(read_preference)
+        view = database_views[(tenant, read_preference)] = base.with_options(read_preference=pref)
+    return view
+
+
+def get_shared_database():
+    """The default database regardless of tenant (user accounts, report queue)."""
     return database
 
+
+def encode_causal_token(session):
+    """Encode a session's operation time as an opaque X-Causal-Token value."""
+    if session is None or session.operation_time is None:
+        return None
+    return f"{session.operation_time.time}.{session.operation_time.inc}"
+
+
+@asynccontextmanager
+async def causal_session(causal_token=None):
+    """
+    Start a causally consistent session.
+
+    If causal_token (from a previous write response) is given, reads in this
+    session wait until the selected member has caught up to that write, so a
+    client can read its own writes even from a secondary.
+    """
+    async with await client.start_session(causal_consistency=True) as session:
+        if causal_token:
+            try:
+                seconds, increment = causal_token.split(".")
+                session.advance_operation_time(Timestamp(int(seconds), int(increment)))
+            except ValueError:
+                pass
+        yield session
+
+
+@asynccontextmanager
+async def causal_read_session(causal_token=None):
+    """
+    Session for a read: a causal_session when the client sent a causal token,
+    otherwise None, so plain reads don't start a session or send an lsid.
+    """
+    if not causal_token:
+        yield None
+        return
+    async with causal_session(causal_token) as session:
+        yield session
+
 def get_last_db_error():
     """Get last database connection error (if any)."""
     global last_db_error
     return last_db_error
+
+def get_reconnect_state():
+    """Background reconnect status for /api/health."""
+    return {
+        "reconnecting": reconnect_task is not None and not reconnect_task.done(),
+        "attempts": reconnect_attempts,
+    }
+
+def get_startup_timings():
+    """Get the per-step timings (ms) of the last init_db run."""
+    return dict(startup_timings)
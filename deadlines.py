@@ -0,0 +1,225 @@
+"""
+Per-request deadlines.
+
+DeadlineMiddleware gives every request to DEADLINE_ROUTES a deadline: the
+route's default (longest matching prefix), or less when the client sends
+`X-Request-Timeout` (seconds, capped at DEADLINE_MAX_SECONDS). The request
+then runs inside `pymongo.timeout(...)`, so every MongoDB operation it makes -
+Beanie, the attendance store, sessions - is sent with the remaining time as
+maxTimeMS and fails once the deadline has passed; server selection and pool
+checkout are bounded by it too. Motor copies the context into its executor
+threads, so nothing has to be threaded through the routers.
+
+Python-side work is bounded as well: the route runs as a task that is
+cancelled at the deadline (answered with 504 if no response was started) or
+as soon as the client disconnects, so abandoned requests stop occupying the
+event loop. Cancelling does not reach a MongoDB operation that is already
+running: Motor's executor thread keeps waiting for it and its pool
+connection stays checked out until the server finishes or stops it at its
+maxTimeMS. The deadline is what bounds database work.
+
+deadline_exceeded_handler answers a driver error with 504 only when the
+request ran under a deadline and the error is that deadline running out: an
+ExecutionTimeout, or a client-side timeout raised once the deadline passed.
+A server-selection failure or lost connection means MongoDB is unreachable,
+not that the request was too slow; it is answered with 503 "Database not
+connected" and not counted as exceeded.
+Outcomes are counted in metrics.py (deadline_requests_total by
+DEADLINE_ROUTES prefix: exceeded, disconnected).
+"""
+import os
+import time
+import asyncio
+import contextvars
+
+import pymongo
+from fastapi.responses import JSONResponse
+from pymongo.errors import ConnectionFailure, ExecutionTimeout, PyMongoError, ServerSelectionTimeoutError
+
+from metrics import deadline_requests
+
+
+DEADLINE_ENABLED = os.getenv("DEADLINE_ENABLED", "true").lower() != "false"
+# Route prefix -> default deadline in seconds.
+DEADLINE_ROUTES = {
+    prefix.strip().rstrip("/"): float(seconds)
+    for prefix, _, seconds in (
+        route.partition("=")
+        for route in os.getenv("DEADLINE_ROUTES", "/api/employees=5,/api/attendance=10").split(",")
+        if route.strip()
+    )
+}
+# Long-lived streams have no deadline.
+DEADLINE_EXEMPT_PATHS = tuple(
+    path.strip() for path in os.getenv("DEADLINE_EXEMPT_PATHS", "/api/attendance/live").split(",") if path.strip()
+)
+DEADLINE_MAX_SECONDS = float(os.getenv("DEADLINE_MAX_SECONDS", 60))
+
+DEADLINE_HEADER = b"x-request-timeout"
+
+# True while the current request runs with a deadline shortened by the client.
+client_deadline = contextvars.ContextVar("client_deadline", default=False)
+# time.monotonic() at which the current request's deadline runs out (None without one).
+request_deadline = contextvars.ContextVar("request_deadline", default=None)
+
+
+def route_prefix(path):
+    """The longest DEADLINE_ROUTES prefix matching a path (None if there is none)."""
+    path = path.rstrip("/")
+    matches = [prefix for prefix in DEADLINE_ROUTES if path == prefix or path.startswith(prefix + "/")]
+    return max(matches, key=len) if matches else None
+
+
+def route_timeout(path):
+    """Default deadline of the longest matching DEADLINE_ROUTES prefix (None if the path has none)."""
+    if path.startswith(DEADLINE_EXEMPT_PATHS):
+        return None
+    prefix = route_prefix(path)
+    return DEADLINE_ROUTES[prefix] if prefix is not None else None
+
+
+def is_deadline_error(error):
+    """Whether a driver error means this request's deadline ran out (not that MongoDB is down)."""
+    deadline = request_deadline.get()
+    if deadline is None or isinstance(error, ServerSelectionTimeoutError):
+        return False
+    if isinstance(error, ExecutionTimeout):
+        return True
+    return isinstance(error, PyMongoError) and error.timeout and time.monotonic() >= deadline
+
+
+async def deadline_exceeded_handler(request, exc):
+    """
+    Exception handler for PyMongoError: 504 when the request's deadline ran
+    out, 503 when MongoDB could not be reached.
+    """
+    deadline_error = is_deadline_error(exc)
+    if not deadline_error and not isinstance(exc, ConnectionFailure):
+        raise exc
+    # Imported here: circuit.py imports client_deadline from this module.
+    from circuit import record_request_error
+    record_request_error(exc)
+    if not deadline_error:
+        return JSONResponse({"detail": "Database not connected"}, status_code=503)
+    # Labelled by route prefix, not the raw path, so IDs in paths don't become label values.
+    _count(route_prefix(request.url.path) or "other", "exceeded")
+    return JSONResponse({"detail": "Request deadline exceeded"}, status_code=504)
+
+
+def _count(prefix, outcome):
+    key = (prefix, outcome)
+    deadline_requests[key] = deadline_requests.get(key, 0) + 1
+
+
+def _header(scope, name):
+    for header, value in scope["headers"]:
+        if header == name:
+            return value.decode("latin-1")
+    return None
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+class DeadlineMiddleware:
+    """Pure ASGI middleware running requests under a deadline, cancelled on client disconnect."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        timeout = route_timeout(scope["path"])
+        if timeout is None:
+            return await self.app(scope, receive, send)
+
+        shortened = False
+        requested = _header(scope, DEADLINE_HEADER)
+        if requested is not None:
+            try:
+                requested = float(requested)
+            except ValueError:
+                requested = 0
+            if not requested > 0:
+                response = JSONResponse(
+                    {"detail": "X-Request-Timeout must be a positive number of seconds"}, status_code=400
+                )
+                return await response(scope, receive, send)
+            requested = min(requested, DEADLINE_MAX_SECONDS)
+            shortened = requested < timeout
+            timeout = requested
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        prefix = route_prefix(scope["path"])
+
+        # The body is read up front so that receive() is free to watch for a disconnect.
+        body = await _read_body(receive)
+        if body is None:
+            return
+        disconnected = asyncio.Event()
+        body_sent = False
+        response_started = False
+
+        async def receive_body():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        async def send_tracked(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        async def run():
+            remaining = max(deadline - loop.time(), 0.001)
+            client_deadline.set(shortened)
+            request_deadline.set(time.monotonic() + remaining)
+            # Every driver call in the task gets the remaining time as maxTimeMS.
+            with pymongo.timeout(remaining):
+                await self.app(scope, receive_body, send_tracked)
+
+        async def watch_disconnect():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            disconnected.set()
+
+        task = asyncio.create_task(run())
+        watcher = asyncio.create_task(watch_disconnect())
+        try:
+            done, _ = await asyncio.wait(
+                {task, watcher}, timeout=max(deadline - loop.time(), 0), return_when=asyncio.FIRST_COMPLETED
+            )
+            if task in done:
+                return task.result()
+            # Stops the route; a query already running ends at its maxTimeMS.
+            task.cancel()
+            try:
+                await task
+            except BaseException:
+                pass
+            if watcher in done:
+                _count(prefix, "disconnected")
+                return
+            _count(prefix, "exceeded")
+        finally:
+            watcher.cancel()
+            # Also when this request itself is cancelled (e.g. on shutdown).
+            task.cancel()
+
+        if not response_started:
+            response = JSONResponse({"detail": "Request deadline exceeded"}, status_code=504)
+            await response(scope, receive_body, send)
@@ -0,0 +1,286 @@
+"""
+Idempotency-Key support for retried writes.
+
+A POST to one of IDEMPOTENCY_ROUTES that carries an `Idempotency-Key` header
+runs once: its response is stored in the `idempotency_keys` collection of the
+tenant's database (expired by a TTL index after IDEMPOTENCY_TTL_SECONDS) and in
+an in-process LRU cache (IDEMPOTENCY_CACHE_SIZE). A retry with the same key is
+answered from there with `Idempotent-Replayed: true`, without running the
+route again. Reusing a key with a different body is rejected with 422.
+Cached responses expire with their record, IDEMPOTENCY_TTL_SECONDS after it
+was created, so a late retry runs again in every process alike.
+
+A duplicate that arrives while the first request is still running waits for
+it instead of racing it: in the same process on its future, across processes
+by polling the "pending" record. The running request renews its lock every
+IDEMPOTENCY_LOCK_SECONDS / 3, so only a pending record whose process died is
+taken over, once its lock has run out.
+
+Only 2xx responses and the deterministic client errors in STORED_CLIENT_ERRORS
+(400, 409, 422) are stored. Anything else - a 404 for an employee created a
+moment later, a 5xx - is not, so the next retry runs again.
+
+Keys are scoped by method, path and Authorization header. Outcomes are counted
+in metrics.py (idempotency_requests_total: executed, replayed, waited, mismatch).
+"""
+import os
+import asyncio
+import hashlib
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+from pymongo import IndexModel
+from pymongo.errors import DuplicateKeyError
+
+from database import get_database
+from metrics import idempotency_requests
+
+
+IDEMPOTENCY_ENABLED = os.getenv("IDEMPOTENCY_ENABLED", "true").lower() != "false"
+IDEMPOTENCY_ROUTES = {
+    route.strip().rstrip("/")
+    for route in os.getenv("IDEMPOTENCY_ROUTES", "/api/attendance,/api/employees").split(",")
+    if route.strip()
+}
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", 24 * 3600))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", 1024))
+# How long a pending record blocks duplicates after its last renewal before it is
+# considered abandoned.
+IDEMPOTENCY_LOCK_SECONDS = float(os.getenv("IDEMPOTENCY_LOCK_SECONDS", 30))
+
+IDEMPOTENCY_COLLECTION = "idempotency_keys"
+MAX_KEY_LENGTH = 255
+
+PENDING = "pending"
+COMPLETED = "completed"
+
+# Client errors that a retry of the same request would get again.
+STORED_CLIENT_ERRORS = {400, 409, 422}
+
+
+def _storable(status):
+    return 200 <= status < 300 or status in STORED_CLIENT_ERRORS
+
+
+def _count(path, outcome):
+    key = (path, outcome)
+    idempotency_requests[key] = idempotency_requests.get(key, 0) + 1
+
+
+def _header(scope, name):
+    for header, value in scope["headers"]:
+        if header == name:
+            return value.decode("latin-1")
+    return None
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def ensure_idempotency_indexes(database):
+    await database[IDEMPOTENCY_COLLECTION].create_indexes(
+        [IndexModel([("createdAt", 1)], name="createdAt_ttl", expireAfterSeconds=IDEMPOTENCY_TTL_SECONDS)]
+    )
+
+
+class IdempotencyMiddleware:
+    """Pure ASGI middleware storing and replaying responses by Idempotency-Key."""
+
+    def __init__(self, app):
+        self.app = app
+        self.cache = OrderedDict()  # (database, record id) -> (expires at, stored response)
+        self.in_flight = {}  # (database, record id) -> future of the stored response (None if not stored)
+        self.indexed = set()  # database names whose TTL index was ensured
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST":
+            return await self.app(scope, receive, send)
+        path = scope["path"].rstrip("/")
+        key = _header(scope, b"idempotency-key")
+        database = get_database()
+        if path not in IDEMPOTENCY_ROUTES or key is None or database is None:
+            return await self.app(scope, receive, send)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            response = JSONResponse({"detail": f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters"}, status_code=400)
+            return await response(scope, receive, send)
+
+        body = await _read_body(receive)
+        if body is None:
+            return
+        record_id = hashlib.sha256(
+            "\0".join([scope["method"], path, _header(scope, b"authorization") or "", key]).encode()
+        ).hexdigest()
+        fingerprint = hashlib.sha256(body).hexdigest()
+        cache_key = (database.name, record_id)
+
+        while True:
+            cached = self.cache.get(cache_key)
+            if cached is not None and cached[0] <= datetime.utcnow():
+                # The TTL index has removed (or is about to remove) the record.
+                del self.cache[cache_key]
+                cached = None
+            if cached is not None:
+                self.cache.move_to_end(cache_key)
+                return await self._replay(path, cached[1], fingerprint, scope, receive, send)
+            future = self.in_flight.get(cache_key)
+            if future is None:
+                break
+            # Shielded: a duplicate that goes away must not cancel the first request.
+            stored = await asyncio.shield(future)
+            if stored is not None:
+                return await self._replay(path, stored, fingerprint, scope, receive, send, outcome="waited")
+            # The first request failed without storing a response; run again.
+
+        future = self.in_flight[cache_key] = asyncio.get_running_loop().create_future()
+        stored = None
+        try:
+            stored, created_at = await self._execute(database, record_id, path, fingerprint, scope, body, receive, send)
+        finally:
+            self.in_flight.pop(cache_key, None)
+            if stored is not None:
+                self.cache[cache_key] = (created_at + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS), stored)
+                if len(self.cache) > IDEMPOTENCY_CACHE_SIZE:
+                    self.cache.popitem(last=False)
+            future.set_result(stored)
+
+    async def _execute(self, database, record_id, path, fingerprint, scope, body, receive, send):
+        """
+        Run the request once (or replay another process's response). Returns
+        what was stored (None if nothing) and when its record was created.
+        """
+        collection = database[IDEMPOTENCY_COLLECTION]
+        if database.name not in self.indexed:
+            await ensure_idempotency_indexes(database)
+            self.indexed.add(database.name)
+
+        owner = ObjectId()
+        stored, created_at = await self._acquire(collection, record_id, fingerprint, owner)
+        if stored is not None:
+            await self._replay(path, stored, fingerprint, scope, receive, send)
+            return stored, created_at
+
+        _count(path, "executed")
+        response = {"fingerprint": fingerprint, "status": 500, "headers": [], "body": b""}
+        body_sent = False
+
+        async def receive_body():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = [list(header) for header in message.get("headers", [])]
+            elif message["type"] == "http.response.body":
+                response["body"] += message.get("body", b"")
+            await send(message)
+
+        lock = asyncio.create_task(self._renew_lock(collection, record_id, owner))
+        try:
+            await self.app(scope, receive_body, capture)
+        except BaseException:
+            await collection.delete_one({"_id": record_id, "status": PENDING, "owner": owner})
+            raise
+        finally:
+            lock.cancel()
+
+        if not _storable(response["status"]):
+            # Not stored: the client's retry should run the request again.
+            await collection.delete_one({"_id": record_id, "status": PENDING, "owner": owner})
+            return None, created_at
+
+        await collection.update_one(
+            {"_id": record_id, "owner": owner},
+            {"$set": {"status": COMPLETED, "response": response, "lockedUntil": None}},
+        )
+        return response, created_at
+
+    async def _renew_lock(self, collection, record_id, owner):
+        """Keep the pending record locked while this request is still running."""
+        while True:
+            await asyncio.sleep(IDEMPOTENCY_LOCK_SECONDS / 3)
+            try:
+                await collection.update_one(
+                    {"_id": record_id, "status": PENDING, "owner": owner},
+                    {"$set": {"lockedUntil": datetime.utcnow() + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS)}},
+                )
+            except Exception as e:
+                print(f"Warning: failed to renew idempotency lock: {e}")
+
+    async def _acquire(self, collection, record_id, fingerprint, owner):
+        """
+        Claim the key by inserting a pending record. Returns (stored response,
+        record createdAt) when another request already completed it, or
+        (None, createdAt) once this request holds the claim; waits while another
+        process is running it.
+        """
+        delay = 0.05
+        while True:
+            now = datetime.utcnow()
+            try:
+                await collection.insert_one(
+                    {
+                        "_id": record_id,
+                        "status": PENDING,
+                        "fingerprint": fingerprint,
+                        "owner": owner,
+                        "createdAt": now,
+                        "lockedUntil": now + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS),
+                    }
+                )
+                return None, now
+            except DuplicateKeyError:
+                pass
+
+            record = await collection.find_one({"_id": record_id})
+            if record is not None:
+                if record["status"] == COMPLETED:
+                    return record["response"], record["createdAt"]
+                if record["lockedUntil"] < now:
+                    # Abandoned by a process that died mid-request; take it over.
+                    taken = await collection.update_one(
+                        {"_id": record_id, "status": PENDING, "lockedUntil": record["lockedUntil"]},
+                        {
+                            "$set": {
+                                "fingerprint": fingerprint,
+                                "owner": owner,
+                                "lockedUntil": now + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS),
+                            }
+                        },
+                    )
+                    if taken.modified_count:
+                        return None, record["createdAt"]
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+    async def _replay(self, path, stored, fingerprint, scope, receive, send, outcome="replayed"):
+        if stored["fingerprint"] != fingerprint:
+            _count(path, "mismatch")
+            response = JSONResponse(
+                {"detail": "Idempotency-Key was already used with a different request body"}, status_code=422
+            )
+            return await response(scope, receive, send)
+
+        _count(path, outcome)
+        headers = [(bytes(name), bytes(value)) for name, value in stored["headers"]]
+        await send(
+            {
+                "type": "http.response.start",
+                "status": stored["status"],
+                "headers": headers + [(b"idempotent-replayed", b"true")],
+            }
+        )
+        await send({"type": "http.response.body", "body": bytes(stored["body"])})
@@ -0,0 +1,332 @@
+"""
+Live attendance feed.
+
+AttendanceFeed opens one MongoDB change stream per worker on the attendance
+store's collection and fans inserts/updates out to any number of subscribers (the SSE endpoint
+GET /api/attendance/live). Each subscriber has a bounded queue: a consumer that
+falls LIVE_QUEUE_SIZE events behind is disconnected with an "overflow" event
+instead of buffering without limit, and reconnects with its last event ID.
+
+Event IDs are change stream resume tokens. Recent events are kept in a replay
+buffer, so a reconnecting client normally resumes from memory. An older token
+(e.g. one issued by another worker) gets a private change stream resumed from
+it, which is closed as soon as the client has caught up with the replay
+buffer; the client then joins the shared stream. At most
+LIVE_MAX_PRIVATE_STREAMS private streams run per feed; beyond that the client
+gets a "reset" event.
+
+Other in-process consumers (the presence index) can follow the same stream
+with add_listener(); the stream is closed once it has neither subscribers nor
+listeners left.
+
+Change streams need a replica set (or sharded cluster).
+"""
+import os
+import asyncio
+import contextvars
+from collections import deque, OrderedDict
+
+from pymongo.errors import OperationFailure
+
+from database import get_database
+from tenancy import current_tenant
+
+
+LIVE_QUEUE_SIZE = int(os.getenv("LIVE_QUEUE_SIZE", 256))
+LIVE_REPLAY_SIZE = int(os.getenv("LIVE_REPLAY_SIZE", 2048))
+LIVE_HEARTBEAT_SECONDS = float(os.getenv("LIVE_HEARTBEAT_SECONDS", 15))
+# How long an employeeId -> department mapping is trusted before being looked up again.
+LIVE_DEPARTMENT_CACHE_SECONDS = float(os.getenv("LIVE_DEPARTMENT_CACHE_SECONDS", 300))
+LIVE_DEPARTMENT_CACHE_SIZE = int(os.getenv("LIVE_DEPARTMENT_CACHE_SIZE", 10000))
+LIVE_MAX_PRIVATE_STREAMS = int(os.getenv("LIVE_MAX_PRIVATE_STREAMS", 16))
+
+CHANGE_PIPELINE = [{"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}}]
+
+# Change stream error code when a resume token is no longer in the oplog.
+CHANGE_STREAM_HISTORY_LOST = 286
+
+_MISSING = object()
+
+
+class FeedEvent:
+    __slots__ = ("id", "data", "employee_id", "date")
+
+    def __init__(self, id, data, employee_id, event_date):
+        self.id = id
+        self.data = data
+        self.employee_id = employee_id
+        self.date = event_date
+
+
+class Subscriber:
+    def __init__(self, department=None, event_date=None):
+        self.department = department
+        self.date = event_date
+        # One spare slot for the overflow marker.
+        self.queue = asyncio.Queue(maxsize=LIVE_QUEUE_SIZE + 1)
+        self.overflowed = False
+
+    def wants(self, event, department):
+        if self.date is not None and event.date != self.date:
+            return False
+        return self.department is None or self.department == department
+
+
+class AttendanceFeed:
+    def __init__(self, store, serialize):
+        """
+        store: the attendance store whose collection is watched.
+        serialize(record) -> JSON string for a changed per-day record (or None to skip).
+        """
+        self.store = store
+        self.serialize = serialize
+        self.subscribers = set()
+        self.replay = deque(maxlen=LIVE_REPLAY_SIZE)
+        self.resume_token = None
+        self.departments = OrderedDict()  # employeeId -> (department, looked up at), LRU
+        self.private_streams = 0
+        self.listeners = set()  # callables taking the per-day records of each change
+        self.task = None
+
+    def _ensure_started(self):
+        if self.task is None or self.task.done():
+            # A fresh context with only the tenant: the stream outlives the request
+            # that starts it and must not carry its deadline, profiler or query route.
+            context = contextvars.Context()
+            context.run(current_tenant.set, current_tenant.get())
+            self.task = context.run(asyncio.create_task, self._watch())
+
+    def add_listener(self, listener):
+        """Call listener(records) with the per-day records of every change."""
+        self.listeners.add(listener)
+        self._ensure_started()
+
+    def remove_listener(self, listener):
+        self.listeners.discard(listener)
+        self._stop_if_idle()
+
+    def _stop_if_idle(self):
+        if self.subscribers or self.listeners or self.private_streams or self.task is None:
+            return
+        # Nobody is using the stream; the next subscriber or listener starts it afresh.
+        self.task.cancel()
+        self.task = None
+        self.resume_token = None
+        self.replay.clear()
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    def _to_events(self, change):
+        events = []
+        for record in self.store.records_from_change(change):
+            data = self.serialize(record)
+            if data is None:
+                continue
+            record_date = record.get("date")
+            events.append(
+                FeedEvent(
+                    change["_id"]["_data"],
+                    data,
+                    record.get("employeeId") or record.get("employee_id"),
+                    record_date.date() if hasattr(record_date, "date") else record_date,
+                )
+            )
+        return events
+
+    def _cached_department(self, employee_id):
+        """Cached department of an employee, or _MISSING if unknown or stale."""
+        entry = self.departments.get(employee_id)
+        if entry is None or asyncio.get_running_loop().time() - entry[1] > LIVE_DEPARTMENT_CACHE_SECONDS:
+            return _MISSING
+        self.departments.move_to_end(employee_id)
+        return entry[0]
+
+    async def _load_departments(self, employee_ids):
+        """Look up the departments of some employees and cache them; returns {employeeId: department}."""
+        found = dict.fromkeys(employee_ids)
+        cursor = get_database().employees.find(
+            {"employeeId": {"$in": list(found)}}, {"_id": 0, "employeeId": 1, "department": 1}
+        )
+        async for doc in cursor:
+            found[doc["employeeId"]] = doc.get("department")
+        now = asyncio.get_running_loop().time()
+        for employee_id, department in found.items():
+            self.departments[employee_id] = (department, now)
+            self.departments.move_to_end(employee_id)
+        while len(self.departments) > LIVE_DEPARTMENT_CACHE_SIZE:
+            self.departments.popitem(last=False)
+        return found
+
+    async def department_of(self, employee_id):
+        """Department of an employee, from a bounded cache of per-employee lookups."""
+        department = self._cached_department(employee_id)
+        if department is _MISSING:
+            department = (await self._load_departments([employee_id]))[employee_id]
+        return department
+
+    def _deliver(self, subscriber, event):
+        if subscriber.overflowed:
+            return
+        if subscriber.queue.qsize() >= LIVE_QUEUE_SIZE:
+            # Slow consumer: cut it off rather than buffer; it reconnects with Last-Event-ID
+            # and resumes right after the last event it received.
+            subscriber.overflowed = True
+            subscriber.queue.put_nowait(None)
+            return
+        subscriber.queue.put_nowait(event)
+
+    async def _publish(self, event):
+        department = None
+        if any(subscriber.department for subscriber in self.subscribers):
+            department = await self.department_of(event.employee_id)
+        # Buffered and delivered without awaiting in between, so _catch_up can't deliver it twice.
+        self.replay.append(event)
+        if department is None and any(subscriber.department for subscriber in self.subscribers):
+            # A department-filtered subscriber joined while looking it up.
+            department = self._cached_department(event.employee_id)
+            department = None if department is _MISSING else department
+        for subscriber in list(self.subscribers):
+            if subscriber.wants(event, department):
+                self._deliver(subscriber, event)
+
+    async def _watch(self):
+        """Run the shared change stream, reconnecting with backoff from the last resume token."""
+        delay = 1
+        while True:
+            database = get_database()
+            try:
+                if database is None:
+                    raise RuntimeError("Database not connected")
+                async with database[self.store.collection_name].watch(
+                    CHANGE_PIPELINE, full_document="updateLookup", resume_after=self.resume_token
+                ) as stream:
+                    delay = 1
+                    async for change in stream:
+                        self.resume_token = change["_id"]
+                        if self.listeners:
+                            records = self.store.records_from_change(change)
+                            for listener in list(self.listeners):
+                                try:
+                                    listener(records)
+                                except Exception as e:
+                                    print(f"Live attendance listener error: {e}")
+                        for event in self._to_events(change):
+                            await self._publish(event)
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                if e.code == CHANGE_STREAM_HISTORY_LOST:
+                    self.resume_token = None
+                print(f"Live attendance feed error: {e}")
+            except Exception as e:
+                print(f"Live attendance feed error: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60)
+
+    async def _catch_up(self, subscriber, last_event_id):
+        """
+        Deliver the buffered events after last_event_id and add the subscriber to
+        the shared stream. Returns False (and does nothing) if last_event_id is not
+        in the replay buffer.
+        """
+        departments = {}
+        while True:
+            ids = [event.id for event in self.replay]
+            if last_event_id not in ids:
+                return False
+            # A change can produce several events with the same ID; resume after the last one.
+            missed = list(self.replay)[len(ids) - ids[::-1].index(last_event_id):]
+            if subscriber.department:
+                for event in missed:
+                    if event.employee_id not in departments:
+                        department = self._cached_department(event.employee_id)
+                        if department is not _MISSING:
+                            departments[event.employee_id] = department
+                unknown = {event.employee_id for event in missed} - departments.keys()
+                if unknown:
+                    departments.update(await self._load_departments(unknown))
+                    # The buffer may have moved on meanwhile; look again.
+                    continue
+            # No awaits from here on, so no event is missed or delivered twice.
+            for event in missed:
+                if subscriber.wants(event, departments.get(event.employee_id)):
+                    self._deliver(subscriber, event)
+            self.subscribers.add(subscriber)
+            # The stream may have been closed for lack of users while catching up.
+            self._ensure_started()
+            return True
+
+    async def _private_stream(self, subscriber, token):
+        """Serve a subscriber whose resume point is older than the replay buffer until it catches up."""
+        self.private_streams += 1
+        last_event_id = token
+        try:
+            async with get_database()[self.store.collection_name].watch(
+                CHANGE_PIPELINE, full_document="updateLookup", resume_after={"_data": token}
+            ) as stream:
+                async for change in stream:
+                    # Once the shared stream has published what this client last got, switch to it.
+                    if await self._catch_up(subscriber, last_event_id):
+                        return
+                    for event in self._to_events(change):
+                        department = await self.department_of(event.employee_id) if subscriber.department else None
+                        if subscriber.wants(event, department):
+                            self._deliver(subscriber, event)
+                    last_event_id = change["_id"]["_data"]
+                    if subscriber.overflowed:
+                        return
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Live attendance feed resume error: {e}")
+            self._deliver(subscriber, "reset")
+            subscriber.overflowed = True
+        finally:
+            self.private_streams -= 1
+            self._stop_if_idle()
+
+    async def subscribe(self, department=None, event_date=None, last_event_id=None):
+        """
+        Async generator of SSE messages for one client.
+
+        Yields "reset" events when the client's resume point is gone (it should
+        refetch GET /api/attendance) and "overflow" before disconnecting a slow client.
+        """
+        self._ensure_started()
+        subscriber = Subscriber(department, event_date)
+        private_task = None
+
+        if not last_event_id:
+            self.subscribers.add(subscriber)
+        elif not await self._catch_up(subscriber, last_event_id):
+            if self.private_streams >= LIVE_MAX_PRIVATE_STREAMS:
+                self._deliver(subscriber, "reset")
+            else:
+                private_task = asyncio.create_task(self._private_stream(subscriber, last_event_id))
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), LIVE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+                if event is None:
+                    yield "event: overflow\ndata: {}\n\n"
+                    return
+                if event == "reset":
+                    yield "event: reset\ndata: {}\n\n"
+                    return
+                yield f"id: {event.id}\nevent: attendance\ndata: {event.data}\n\n"
+        finally:
+            self.subscribers.discard(subscriber)
+            if private_task is not None:
+                private_task.cancel()
+            self._stop_if_idle()
@@ -1,9 +1,32 @@
 import os
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from contextlib import asynccontextmanager
-from database import init_db, close_db, get_db_status, get_last_db_error
-from routers import employees, attendance, auth
+from pymongo.errors import PyMongoError
+from database import (
+    init_db,
+    close_db,
+    get_database,
+    get_db_status,
+    get_last_db_error,
+    get_reconnect_state,
+    prepare_tenant,
+    start_reconnect_supervisor,
+    stop_reconnect_supervisor,
+)
+from circuit import CIRCUIT_BREAKER_ENABLED, CircuitBreakerMiddleware, db_breaker
+from metrics import METRICS_ENABLED, MetricsMiddleware, render_metrics
+from querylog import SLOW_QUERY_LOG_ENABLED, QueryRouteMiddleware
+from profiling import PROFILING_ENABLED, ProfilingMiddleware
+from compression import COMPRESSION_ENABLED, CompressionMiddleware
+from singleflight import SINGLE_FLIGHT_ENABLED, SingleFlightMiddleware
+from tenancy import TenantMiddleware
+from idempotency import IDEMPOTENCY_ENABLED, IdempotencyMiddleware
+from deadlines import DEADLINE_ENABLED, DeadlineMiddleware, deadline_exceeded_handler
+from reports import report_workers
+from presence import PRESENCE_ENABLED, presence_index
+from routers import employees, attendance, auth, admin, dashboard, reports, presence
 
 PORT = int(os.getenv("PORT", 5000))
 MONGODB_URI = os.getenv("MONGODB_URI", "mongodb://localhost:27017/hrms_lite")
@@ -18,10 +41,25 @@ async def lifespan(app: FastAPI):
         print(f"MongoDB connection error: {e}")
         # For development, continue even if MongoDB is not available
         # In production, you might want to exit the process
+
+    if get_database() is None:
+        # Keep retrying in the background instead of serving 503s until a restart.
+        start_reconnect_supervisor()
+
+    # Report jobs wait in MongoDB until the database is up.
+    report_workers.start()
+    if PRESENCE_ENABLED:
+        # Marks from other processes come through the tenants' attendance change streams.
+        presence_index.follow(attendance.get_attendance_feed)
+        presence_index.start()
     
     yield
     
     # Shutdown
+    await presence_index.stop()
+    await report_workers.stop()
+    await stop_reconnect_supervisor()
+    await attendance.stop_attendance_feeds()
     await close_db()
 
 
@@ -32,6 +70,26 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Coalesce identical concurrent GETs; innermost so CORS still runs per request
+if SINGLE_FLIGHT_ENABLED:
+    app.add_middleware(SingleFlightMiddleware)
+
+# Bound each request's MongoDB calls and processing by its deadline; cancel it on disconnect
+if DEADLINE_ENABLED:
+    app.add_middleware(DeadlineMiddleware)
+    app.add_exception_handler(PyMongoError, deadline_exceeded_handler)
+
+# Replay stored responses for retried POSTs with an Idempotency-Key (needs the tenant)
+if IDEMPOTENCY_ENABLED:
+    app.add_middleware(IdempotencyMiddleware)
+
+# Fail fast with 503 while MongoDB is known to be down
+if CIRCUIT_BREAKER_ENABLED:
+    app.add_middleware(CircuitBreakerMiddleware)
+
+# Route each request to its tenant's database (tenant claim of the access token)
+app.add_middleware(TenantMiddleware, prepare=prepare_tenant)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -41,10 +99,29 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# gzip/br/zstd response compression negotiated via Accept-Encoding
+if COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
+
+# Per-request profiling (opt-in; not installed at all when disabled)
+if PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+
+if SLOW_QUERY_LOG_ENABLED:
+    app.add_middleware(QueryRouteMiddleware)
+
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 # Include routers
 app.include_router(auth.router)
 app.include_router(employees.router)
 app.include_router(attendance.router)
+app.include_router(dashboard.router)
+app.include_router(reports.router)
+if PRESENCE_ENABLED:
+    app.include_router(presence.router)
+app.include_router(admin.router)
 
 
 @app.get("/api/health")
@@ -56,9 +133,18 @@ async def health_check():
         "message": "Server is running",
         "database": "Connected" if db_status else "Disconnected",
         "databaseError": None if db_status else get_last_db_error(),
+        "circuitBreaker": db_breaker.snapshot() if CIRCUIT_BREAKER_ENABLED else None,
+        "reconnect": get_reconnect_state(),
     }
 
 
+if METRICS_ENABLED:
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        """Prometheus metrics"""
+        return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=PORT)
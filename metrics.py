@@ -0,0 +1,231 @@
+"""
+Prometheus-style metrics.
+
+Collects per-route HTTP request counts, latency histograms and in-flight gauges
+(MetricsMiddleware), single-flight coalescing counts (singleflight.py),
+Idempotency-Key outcomes (idempotency.py), request deadline outcomes
+(deadlines.py), plus MongoDB command latency and error counts by database,
+collection and command (MongoCommandMetrics, a pymongo CommandListener). Each tenant has its own database (see tenancy.py),
+so the database label gives per-tenant query metrics. Everything is kept in
+plain dicts/lists in-process and rendered in the Prometheus text format by
+render_metrics(), which main.py serves at /metrics.
+
+Set METRICS_ENABLED=false to turn collection off entirely (no middleware, no
+command listener, no /metrics endpoint).
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from pymongo import monitoring
+
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() != "false"
+
+# Upper bounds (seconds) of the latency histogram buckets.
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Fixed-bucket histogram; observe() is a bisect and two increments."""
+
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+# HTTP metrics are only touched from the event loop thread, so they need no lock.
+http_requests = {}  # (method, route, status) -> count
+http_latency = {}  # (method, route) -> Histogram
+http_in_flight = {}  # route group -> gauge
+singleflight_requests = {}  # (path, leader|follower|bypass) -> count
+idempotency_requests = {}  # (path, executed|replayed|waited|mismatch) -> count
+deadline_requests = {}  # (DEADLINE_ROUTES prefix, exceeded|disconnected) -> count
+
+# Mongo command events arrive on Motor's executor threads.
+mongo_lock = threading.Lock()
+mongo_latency = {}  # (database, collection, command) -> Histogram
+mongo_errors = {}  # (database, collection, command) -> count
+
+
+# Label values of the in-flight gauge; the route isn't matched yet when a request
+# comes in, and unknown paths must not add series.
+ROUTE_GROUPS = {"auth", "employees", "attendance", "dashboard", "reports", "presence", "admin", "health"}
+
+
+def _route_group(path):
+    """Coarse route label for the in-flight gauge, e.g. /api/attendance/stats/X -> attendance."""
+    parts = path.split("/", 3)
+    if len(parts) > 2 and parts[1] == "api" and parts[2] in ROUTE_GROUPS:
+        return parts[2]
+    return "other"
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording request count, latency and in-flight requests."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status_holder = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder[0] = message["status"]
+            await send(message)
+
+        group = _route_group(scope["path"])
+        http_in_flight[group] = http_in_flight.get(group, 0) + 1
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            http_in_flight[group] -= 1
+
+            # The router stores the matched route in the scope; use its template
+            # so path parameters don't create one series per ID.
+            route = scope.get("route")
+            route_label = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+
+            key = (method, route_label, status_holder[0])
+            http_requests[key] = http_requests.get(key, 0) + 1
+            histogram = http_latency.get((method, route_label))
+            if histogram is None:
+                histogram = http_latency[(method, route_label)] = Histogram()
+            histogram.observe(elapsed)
+
+
+def command_collection(command_name, command):
+    """Collection a MongoDB command targets ("" for database/admin commands)."""
+    if command_name == "getMore":
+        return command.get("collection", "")
+    value = command.get(command_name)
+    return value if isinstance(value, str) else ""
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Records MongoDB command latency and failures by database, collection and command."""
+
+    def __init__(self):
+        self.collections = {}  # request_id -> collection
+
+    def started(self, event):
+        self.collections[event.request_id] = command_collection(event.command_name, event.command)
+
+    def succeeded(self, event):
+        collection = self.collections.pop(event.request_id, "")
+        key = (event.database_name, collection, event.command_name)
+        with mongo_lock:
+            histogram = mongo_latency.get(key)
+            if histogram is None:
+                histogram = mongo_latency[key] = Histogram()
+            histogram.observe(event.duration_micros / 1_000_000)
+
+    def failed(self, event):
+        collection = self.collections.pop(event.request_id, "")
+        key = (event.database_name, collection, event.command_name)
+        with mongo_lock:
+            mongo_errors[key] = mongo_errors.get(key, 0) + 1
+            histogram = mongo_latency.get(key)
+            if histogram is None:
+                histogram = mongo_latency[key] = Histogram()
+            histogram.observe(event.duration_micros / 1_000_000)
+
+
+def _labels(**labels):
+    return ",".join(f'{name}="{str(value)}"' for name, value in labels.items())
+
+
+def _render_histogram(lines, name, labels, histogram):
+    cumulative = 0
+    for bound, count in zip(LATENCY_BUCKETS, histogram.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+    lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+    lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+
+
+def render_metrics():
+    """Render all metrics in the Prometheus text exposition format."""
+    lines = [
+        "# HELP http_requests_total Total HTTP requests.",
+        "# TYPE http_requests_total counter",
+    ]
+    for (method, route, status_code), count in sorted(http_requests.items()):
+        lines.append(f"http_requests_total{{{_labels(method=method, route=route, status=status_code)}}} {count}")
+
+    lines += [
+        "# HELP http_request_duration_seconds HTTP request latency.",
+        "# TYPE http_request_duration_seconds histogram",
+    ]
+    for (method, route), histogram in sorted(http_latency.items()):
+        _render_histogram(lines, "http_request_duration_seconds", _labels(method=method, route=route), histogram)
+
+    lines += [
+        "# HELP http_requests_in_flight HTTP requests currently being served.",
+        "# TYPE http_requests_in_flight gauge",
+    ]
+    for group, value in sorted(http_in_flight.items()):
+        lines.append(f"http_requests_in_flight{{{_labels(route=group)}}} {value}")
+
+    lines += [
+        "# HELP singleflight_requests_total Coalescable GET requests by outcome (followers shared a leader's response).",
+        "# TYPE singleflight_requests_total counter",
+    ]
+    for (path, outcome), count in sorted(singleflight_requests.items()):
+        lines.append(f"singleflight_requests_total{{{_labels(path=path, outcome=outcome)}}} {count}")
+
+    lines += [
+        "# HELP idempotency_requests_total POST requests with an Idempotency-Key by outcome.",
+        "# TYPE idempotency_requests_total counter",
+    ]
+    for (path, outcome), count in sorted(idempotency_requests.items()):
+        lines.append(f"idempotency_requests_total{{{_labels(path=path, outcome=outcome)}}} {count}")
+
+    lines += [
+        "# HELP deadline_requests_total Requests cut short by their deadline or by the client disconnecting.",
+        "# TYPE deadline_requests_total counter",
+    ]
+    for (prefix, outcome), count in sorted(deadline_requests.items()):
+        lines.append(f"deadline_requests_total{{{_labels(route=prefix, outcome=outcome)}}} {count}")
+
+    with mongo_lock:
+        latency = sorted(mongo_latency.items())
+        errors = sorted(mongo_errors.items())
+
+    lines += [
+        "# HELP mongodb_command_duration_seconds MongoDB command latency.",
+        "# TYPE mongodb_command_duration_seconds histogram",
+    ]
+    for (database, collection, command), histogram in latency:
+        _render_histogram(
+            lines,
+            "mongodb_command_duration_seconds",
+            _labels(database=database, collection=collection, command=command),
+            histogram,
+        )
+
+    lines += [
+        "# HELP mongodb_command_errors_total Failed MongoDB commands.",
+        "# TYPE mongodb_command_errors_total counter",
+    ]
+    for (database, collection, command), count in errors:
+        labels = _labels(database=database, collection=collection, command=command)
+        lines.append(f"mongodb_command_errors_total{{{labels}}} {count}")
+
+    return "\n".join(lines) + "\n"
@@ -1,11 +1,11 @@
-from beanie import Document
+from tenancy import TenantDocument
 from pydantic import Field, field_validator
 from typing import Optional, Literal
 from datetime import datetime, date, time
 from pymongo import IndexModel
 
 
-class Attendance(Document):
+class Attendance(TenantDocument):
     employeeId: str = Field(..., min_length=1)
     date: datetime
     status: Literal["Present", "Absent"] = "Present"
@@ -39,6 +39,13 @@ class Attendance(Document):
                 unique=True,
                 name="employeeId_1_date_1",
             ),
+            # GET /api/attendance?date=... across all employees, and whether a
+            # report period changed since a cached result (reports.py).
+            IndexModel([("date", 1), ("updatedAt", 1)], name="date_1_updatedAt_1"),
+            # The legacy employee_id branch of the store's $or filters. Non-unique, and
+            # keyed differently from the old unique employee_id_1_date_1 that
+            # ensure_attendance_indexes drops, so the two never conflict.
+            IndexModel([("employee_id", 1), ("date", -1)], name="employee_id_1_date_-1"),
         ]
 
     class Config:
@@ -0,0 +1,43 @@
+from tenancy import TenantDocument
+from pydantic import Field
+from typing import List, Optional
+from datetime import datetime
+from pymongo import IndexModel
+
+
+# Per-day status codes stored in AttendanceBucket.days.
+UNMARKED = 0
+PRESENT = 1
+ABSENT = 2
+
+DAYS_PER_BUCKET = 31
+
+
+class AttendanceBucket(TenantDocument):
+    """
+    One employee's attendance for one month (ATTENDANCE_STORAGE=buckets).
+
+    _id is "<employeeId>:<YYYY-MM>", so a bucket is addressed without a secondary
+    index; an employee's history is read by employeeId and month. days[d - 1]
+    holds the status code for day d and updatedAt[d - 1] when it was last marked.
+    """
+    id: str
+    employeeId: str = Field(..., min_length=1)
+    month: datetime
+    days: List[int] = Field(default_factory=lambda: [UNMARKED] * DAYS_PER_BUCKET)
+    updatedAt: List[Optional[datetime]] = Field(default_factory=lambda: [None] * DAYS_PER_BUCKET)
+
+    class Settings:
+        name = "attendance_buckets"
+        indexes = [
+            IndexModel(
+                [("month", 1), ("employeeId", 1)],
+                name="month_1_employeeId_1",
+            ),
+            IndexModel(
+                [("employeeId", 1), ("month", 1)],
+                name="employeeId_1_month_1",
+            ),
+            # Whether a report period changed since a cached result (reports.py).
+            IndexModel([("month", 1), ("updatedAt", 1)], name="month_1_updatedAt_1"),
+        ]
@@ -1,11 +1,11 @@
-from beanie import Document
+from tenancy import TenantDocument
 from pydantic import Field, EmailStr, field_validator
 from typing import Optional
 from datetime import datetime
 from pymongo import IndexModel
 
 
-class Employee(Document):
+class Employee(TenantDocument):
     employee_id: str = Field(..., alias="employeeId", min_length=1)
     full_name: str = Field(..., alias="fullName", min_length=1)
     email: EmailStr
@@ -38,6 +38,9 @@ class Employee(Document):
         indexes = [
             IndexModel([("employeeId", 1)], unique=True),  # Use MongoDB field name (alias)
             IndexModel([("email", 1)], unique=True),
+            # Dashboard summary pages (newest first, optionally per department).
+            IndexModel([("createdAt", -1), ("_id", -1)], name="createdAt_-1__id_-1"),
+            IndexModel([("department", 1), ("createdAt", -1), ("_id", -1)], name="department_1_createdAt_-1__id_-1"),
         ]
 
     class Config:
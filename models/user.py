@@ -8,6 +8,8 @@ class User(Document):
     email: EmailStr
     password: str  # Will be hashed
     full_name: str = Field(..., alias="fullName", min_length=1)
+    # Tenant (company) whose data the user works on; None uses the default database.
+    tenant: Optional[str] = None
     created_at: Optional[datetime] = Field(default_factory=datetime.utcnow, alias="createdAt")
     updated_at: Optional[datetime] = Field(default_factory=datetime.utcnow, alias="updatedAt")
 
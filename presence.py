@@ -0,0 +1,324 @@
+"""
+In-memory index of today's attendance ("who has checked in").
+
+Every employee gets a dense ordinal, and a day's state is three bitsets over
+those ordinals (Python ints): present, absent, and per department the members.
+"Who in Sales hasn't been marked yet" is then `members & ~(present | absent)`,
+a few big-int operations instead of loading the employee list and the day's
+attendance.
+
+Each worker process keeps one PresenceDay per tenant. It is loaded from MongoDB
+at startup (the default tenant) or on first use, updated in place by
+POST /api/attendance and the employee routes, and rolled over to an empty day
+when the date changes. Marks handled
+by other worker processes arrive through the tenant's attendance change
+stream (live.py), which the index follows while the tenant is loaded.
+
+As a backstop (for employees created elsewhere, or without a replica set) the
+loaded days are rebuilt from the database every PRESENCE_RECONCILE_SECONDS
+and swapped in; the number of employees that rebuild corrected is the day's
+`drift`. A tenant not read for PRESENCE_IDLE_SECONDS is dropped from memory.
+"""
+import os
+import time
+import asyncio
+from datetime import date, datetime
+
+from database import get_database
+from tenancy import current_tenant
+from attendance_store import get_attendance_store
+
+
+PRESENCE_ENABLED = os.getenv("PRESENCE_ENABLED", "true").lower() != "false"
+PRESENCE_RECONCILE_SECONDS = float(os.getenv("PRESENCE_RECONCILE_SECONDS", 600))
+PRESENCE_IDLE_SECONDS = float(os.getenv("PRESENCE_IDLE_SECONDS", 900))
+
+
+def bit_ordinals(bits):
+    """Ordinals of the set bits of a bitset, lowest first."""
+    # One pass over the binary digits; cheaper than peeling bits off a large int.
+    return [i for i, digit in enumerate(reversed(bin(bits)[2:])) if digit == "1"]
+
+
+class PresenceDay:
+    """Presence bitsets of one tenant for one day."""
+
+    def __init__(self, day):
+        self.day = day
+        self.ordinals = {}  # employeeId -> ordinal
+        self.employee_ids = []  # ordinal -> employeeId (None once deleted)
+        self.departments = {}  # department -> member bitset
+        self.employee_departments = {}  # employeeId -> department
+        self.present = 0
+        self.absent = 0
+        self.loaded_at = None
+        self.drift = None  # employees corrected by the rebuild that produced this day
+
+    def add_employee(self, employee_id, department):
+        ordinal = self.ordinals.get(employee_id)
+        if ordinal is None:
+            ordinal = self.ordinals[employee_id] = len(self.employee_ids)
+            self.employee_ids.append(employee_id)
+        old_department = self.employee_departments.get(employee_id)
+        if old_department is not None and old_department != department:
+            self._leave(old_department, 1 << ordinal)
+        self.employee_departments[employee_id] = department
+        self.departments[department] = self.departments.get(department, 0) | (1 << ordinal)
+        return ordinal
+
+    def remove_employee(self, employee_id):
+        ordinal = self.ordinals.pop(employee_id, None)
+        if ordinal is None:
+            return
+        bit = 1 << ordinal
+        self._leave(self.employee_departments.pop(employee_id), bit)
+        self.present &= ~bit
+        self.absent &= ~bit
+        # The ordinal is not reused; the next reconciliation compacts them.
+        self.employee_ids[ordinal] = None
+
+    def _leave(self, department, bit):
+        members = self.departments[department] & ~bit
+        if members:
+            self.departments[department] = members
+        else:
+            del self.departments[department]
+
+    def mark(self, employee_id, department, status):
+        bit = 1 << self.add_employee(employee_id, department)
+        if status == "Present":
+            self.present |= bit
+            self.absent &= ~bit
+        else:
+            self.absent |= bit
+            self.present &= ~bit
+
+    def next_day(self, day):
+        """The same employees on a later day, nobody marked yet."""
+        rolled = PresenceDay(day)
+        for employee_id in self.ordinals:
+            rolled.add_employee(employee_id, self.employee_departments[employee_id])
+        rolled.loaded_at = self.loaded_at
+        rolled.drift = self.drift
+        return rolled
+
+    def members(self, department=None):
+        if department is not None:
+            return self.departments.get(department, 0)
+        members = 0
+        for bits in self.departments.values():
+            members |= bits
+        return members
+
+    def sets(self, department=None):
+        """(present, absent, not marked) employee IDs, optionally for one department."""
+        members = self.members(department)
+        present = self.present & members
+        absent = self.absent & members
+        not_marked = members & ~(self.present | self.absent)
+        return tuple([self.employee_ids[i] for i in bit_ordinals(bits)] for bits in (present, absent, not_marked))
+
+    def counts(self):
+        """{department: (present, absent, not marked)} counts."""
+        counts = {}
+        for department, members in self.departments.items():
+            present = (self.present & members).bit_count()
+            absent = (self.absent & members).bit_count()
+            counts[department] = (present, absent, members.bit_count() - present - absent)
+        return counts
+
+
+async def load_presence_day(database, day):
+    """Build a tenant's PresenceDay from the employees and the day's attendance."""
+    presence = PresenceDay(day)
+    async for employee in database.employees.find({}, {"_id": 0, "employeeId": 1, "department": 1}):
+        if employee.get("employeeId"):
+            presence.add_employee(employee["employeeId"], employee.get("department") or "")
+    for record in await get_attendance_store().find(database, start=day, end=day):
+        employee_id = record.get("employeeId") or record.get("employee_id")
+        if employee_id in presence.ordinals:
+            presence.mark(employee_id, presence.employee_departments[employee_id], record.get("status"))
+    presence.loaded_at = datetime.utcnow()
+    return presence
+
+
+def _stream_update(record):
+    """Update applying a per-day attendance record from the change stream."""
+    employee_id = record.get("employeeId") or record.get("employee_id")
+    record_date = record.get("date")
+    day = record_date.date() if hasattr(record_date, "date") else record_date
+    status = record.get("status")
+
+    def update(presence):
+        # Employees this process doesn't know yet are added by the next rebuild.
+        department = presence.employee_departments.get(employee_id)
+        if presence.day == day and department is not None:
+            presence.mark(employee_id, department, status)
+    return update
+
+
+class PresenceIndex:
+    """Per-tenant PresenceDay of this process, with reconciliation in the background."""
+
+    def __init__(self):
+        self.days = {}  # tenant -> PresenceDay
+        self.loading = {}  # tenant -> task loading its PresenceDay
+        self.replay = {}  # tenant -> updates applied while it is being reloaded
+        self.last_read = {}  # tenant -> time.monotonic() of the last get()
+        self.following = {}  # tenant -> (AttendanceFeed, listener)
+        self.get_feed = None  # () -> the current tenant's AttendanceFeed, see follow()
+        self.task = None
+        self.warming = None
+
+    def follow(self, get_feed):
+        """Apply marks from other processes, read from the feeds returned by get_feed()."""
+        self.get_feed = get_feed
+
+    def _today(self, tenant):
+        """The tenant's loaded PresenceDay (None if not loaded), rolled over at midnight."""
+        presence = self.days.get(tenant)
+        today = date.today()
+        if presence is not None and presence.day != today:
+            presence = self.days[tenant] = presence.next_day(today)
+        return presence
+
+    async def get(self):
+        """Today's PresenceDay of the current tenant, loading it on first use."""
+        tenant = current_tenant.get()
+        self.last_read[tenant] = time.monotonic()
+        presence = self._today(tenant)
+        if presence is None:
+            presence = await self._reload(tenant)
+        return presence
+
+    async def _reload(self, tenant):
+        task = self.loading.get(tenant)
+        if task is None:
+            task = self.loading[tenant] = asyncio.create_task(self._load(tenant))
+            task.add_done_callback(lambda _: self.loading.pop(tenant, None))
+        return await asyncio.shield(task)
+
+    async def _load(self, tenant):
+        self.replay[tenant] = []
+        # Before reading, so that marks made meanwhile are replayed onto the result.
+        self._follow(tenant)
+        try:
+            fresh = await load_presence_day(get_database(), date.today())
+            # Updates that raced the reload are applied again on top of it.
+            for update in self.replay[tenant]:
+                update(fresh)
+        finally:
+            del self.replay[tenant]
+        old = self.days.get(tenant)
+        if old is not None and old.day == fresh.day:
+            fresh.drift = sum(
+                1
+                for employee_id in set(old.ordinals) | set(fresh.ordinals)
+                if self._state(old, employee_id) != self._state(fresh, employee_id)
+            )
+            if fresh.drift:
+                print(f"Presence index reconciled {fresh.drift} employees (tenant {tenant or 'default'})")
+        self.days[tenant] = fresh
+        return fresh
+
+    @staticmethod
+    def _state(presence, employee_id):
+        ordinal = presence.ordinals.get(employee_id)
+        if ordinal is None:
+            return None
+        bit = 1 << ordinal
+        return (
+            presence.employee_departments[employee_id],
+            bool(presence.present & bit),
+            bool(presence.absent & bit),
+        )
+
+    def _apply(self, update, tenant=None):
+        if tenant is None:
+            tenant = current_tenant.get()
+        presence = self._today(tenant)
+        if presence is not None:
+            update(presence)
+        if tenant in self.replay:
+            self.replay[tenant].append(update)
+
+    def record_mark(self, employee_id, department, day, status):
+        """A mark was saved by this process."""
+        def update(presence):
+            if presence.day == day:
+                presence.mark(employee_id, department, status)
+        self._apply(update)
+
+    def record_employee(self, employee_id, department):
+        self._apply(lambda presence: presence.add_employee(employee_id, department))
+
+    def record_employee_deleted(self, employee_id):
+        self._apply(lambda presence: presence.remove_employee(employee_id))
+
+    def _follow(self, tenant):
+        """Start applying the tenant's changed attendance records from its change stream."""
+        if self.get_feed is None or tenant in self.following:
+            return
+
+        def on_records(records):
+            for record in records:
+                self._apply(_stream_update(record), tenant)
+
+        feed = self.get_feed()
+        feed.add_listener(on_records)
+        self.following[tenant] = (feed, on_records)
+
+    def _evict(self, tenant):
+        self.days.pop(tenant, None)
+        self.last_read.pop(tenant, None)
+        following = self.following.pop(tenant, None)
+        if following is not None:
+            feed, listener = following
+            feed.remove_listener(listener)
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._reconcile_loop())
+        if get_database() is not None and self._today(current_tenant.get()) is None:
+            # Warm the default tenant's day in the background; a query arriving
+            # meanwhile waits for the same load.
+            self.warming = asyncio.create_task(self._warm())
+
+    async def _warm(self):
+        try:
+            await self.get()
+        except Exception as e:
+            print(f"Presence index warm-up failed: {e}")
+
+    async def stop(self):
+        if self.warming is not None:
+            self.warming.cancel()
+            self.warming = None
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def _reconcile_loop(self):
+        while True:
+            await asyncio.sleep(PRESENCE_RECONCILE_SECONDS)
+            now = time.monotonic()
+            # Also tenants whose first load failed after they started following.
+            for tenant in list(self.days.keys() | self.following.keys()):
+                if now - self.last_read.get(tenant, now) > PRESENCE_IDLE_SECONDS:
+                    self._evict(tenant)
+                    continue
+                token = current_tenant.set(tenant)
+                try:
+                    if get_database() is not None:
+                        await self._reload(tenant)
+                except Exception as e:
+                    print(f"Presence index reconciliation error: {e}")
+                finally:
+                    current_tenant.reset(token)
+
+
+presence_index = PresenceIndex()
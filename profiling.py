@@ -0,0 +1,197 @@
+"""
+Opt-in per-request profiling.
+
+When PROFILING_ENABLED=true, ProfilingMiddleware profiles a request if it
+carries "X-Debug-Profile: <ADMIN_TOKEN>" or is picked by PROFILING_SAMPLE_RATE.
+A sampling profiler thread records the event loop thread's stack every
+PROFILING_INTERVAL_MS and the request gets:
+
+- a Server-Timing header with the breakdown (db, validation, serialization,
+  total), where db is the summed MongoDB command time issued by the request
+  and validation/serialization are estimated from the stack samples;
+- an X-Profile-Id header; the folded stacks (flamegraph.pl / speedscope
+  format) are served by GET /api/admin/profiles/{id}.
+
+Samples cover everything running on the event loop, so concurrent requests
+show up in each other's profiles. When disabled, neither the middleware nor
+the command listener is installed.
+"""
+import os
+import sys
+import time
+import uuid
+import random
+import threading
+import contextvars
+from collections import deque
+from pymongo import monitoring
+
+from auth import is_admin_token
+
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", 0))
+PROFILING_INTERVAL_MS = float(os.getenv("PROFILING_INTERVAL_MS", 5))
+PROFILING_MAX_STORED = int(os.getenv("PROFILING_MAX_STORED", 50))
+
+# Stack frames that mark time spent in response model validation / serialization.
+VALIDATION_FRAMES = ("model_validate", "validate_python", "_validate_response")
+SERIALIZATION_FRAMES = ("serialize_response", "jsonable_encoder", "render (responses.py")
+
+current_profile = contextvars.ContextVar("current_profile", default=None)
+
+profiles = deque(maxlen=PROFILING_MAX_STORED)
+_profiling_lock = threading.Lock()
+
+
+class RequestProfile:
+    def __init__(self, method, path):
+        self.id = uuid.uuid4().hex[:12]
+        self.method = method
+        self.path = path
+        self.db_micros = 0
+        self.db_commands = 0
+        self.samples = {}  # folded stack -> sample count
+        self.breakdown = {}
+
+
+class StackSampler:
+    """Samples one thread's Python stack at a fixed interval into folded stacks."""
+
+    def __init__(self, thread_id, interval, samples):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = samples
+        self._stop = threading.Event()
+        # Held while a sample is taken, so no sample lands after stop() returns.
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling. Called on the event loop, so it doesn't join the thread; it exits on its own."""
+        with self._lock:
+            self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                if self._stop.is_set():
+                    break
+                frame = sys._current_frames().get(self.thread_id)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if stack:
+                    folded = ";".join(reversed(stack))
+                    self.samples[folded] = self.samples.get(folded, 0) + 1
+
+
+class ProfileCommandListener(monitoring.CommandListener):
+    """Adds MongoDB command time to the profile of the request that issued it."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        profile = current_profile.get()
+        if profile is not None:
+            profile.db_micros += event.duration_micros
+            profile.db_commands += 1
+
+    def failed(self, event):
+        self.succeeded(event)
+
+
+def _breakdown(profile, total_seconds, interval):
+    validation = serialization = 0
+    for folded, count in profile.samples.items():
+        if any(marker in folded for marker in SERIALIZATION_FRAMES):
+            serialization += count
+        elif any(marker in folded for marker in VALIDATION_FRAMES):
+            validation += count
+    return {
+        "total": round(total_seconds * 1000, 2),
+        "db": round(profile.db_micros / 1000, 2),
+        "validation": round(validation * interval * 1000, 2),
+        "serialization": round(serialization * interval * 1000, 2),
+    }
+
+
+class ProfilingMiddleware:
+    """Pure ASGI middleware that profiles selected requests (one at a time)."""
+
+    def __init__(self, app):
+        self.app = app
+        self.interval = PROFILING_INTERVAL_MS / 1000
+
+    def _wants_profile(self, scope):
+        for name, value in scope["headers"]:
+            if name == b"x-debug-profile":
+                return is_admin_token(value.decode("latin-1"))
+        return PROFILING_SAMPLE_RATE > 0 and random.random() < PROFILING_SAMPLE_RATE
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._wants_profile(scope):
+            return await self.app(scope, receive, send)
+        if not _profiling_lock.acquire(blocking=False):
+            return await self.app(scope, receive, send)
+
+        profile = RequestProfile(scope["method"], scope["path"])
+        sampler = StackSampler(threading.get_ident(), self.interval, profile.samples)
+        token = current_profile.set(profile)
+        start = time.perf_counter()
+        finished = False
+
+        def finish():
+            nonlocal finished
+            if not finished:
+                finished = True
+                sampler.stop()
+                _profiling_lock.release()
+                profile.breakdown = _breakdown(profile, time.perf_counter() - start, self.interval)
+                profiles.append(profile)
+
+        async def send_wrapper(message):
+            # The body has been produced (and serialized) by the time the response starts.
+            if message["type"] == "http.response.start":
+                finish()
+                server_timing = ", ".join(f"{name};dur={value}" for name, value in profile.breakdown.items())
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"server-timing", server_timing.encode()),
+                    (b"x-profile-id", profile.id.encode()),
+                ]
+            await send(message)
+
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_profile.reset(token)
+            finish()
+
+
+def list_profiles():
+    return [
+        {
+            "id": profile.id,
+            "method": profile.method,
+            "path": profile.path,
+            "dbCommands": profile.db_commands,
+            "timingsMs": profile.breakdown,
+            "samples": sum(profile.samples.values()),
+        }
+        for profile in reversed(profiles)
+    ]
+
+
+def get_folded_profile(profile_id):
+    """Folded stacks ("frame;frame;frame count" per line) of a stored profile, or None."""
+    for profile in profiles:
+        if profile.id == profile_id:
+            return "\n".join(f"{stack} {count}" for stack, count in sorted(profile.samples.items())) + "\n"
+    return None
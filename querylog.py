@@ -0,0 +1,273 @@
+"""
+Slow-query log.
+
+SlowQueryLog is a pymongo CommandListener (registered by database.init_db) that
+logs every command slower than SLOW_QUERY_THRESHOLD_MS with its redacted query
+shape, the route that issued it and the number of documents returned versus
+examined. Docs/keys examined come from re-running the command with
+explain("executionStats") in the background, at most once per shape every
+SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS; a sample of those explains
+(SLOW_QUERY_EXPLAIN_SAMPLE_RATE) also keeps the winning plan. Slow commands are
+aggregated by shape and served by GET /api/admin/slow-queries.
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import threading
+import contextvars
+from pymongo import monitoring
+
+from metrics import command_collection
+
+
+SLOW_QUERY_LOG_ENABLED = os.getenv("SLOW_QUERY_LOG_ENABLED", "true").lower() != "false"
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", 200))
+# Share of explains that also keep the winning plan.
+SLOW_QUERY_EXPLAIN_SAMPLE_RATE = float(os.getenv("SLOW_QUERY_EXPLAIN_SAMPLE_RATE", 0))
+# Don't explain the same shape more often than this.
+SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS", 300))
+SLOW_QUERY_MAX_SHAPES = int(os.getenv("SLOW_QUERY_MAX_SHAPES", 500))
+
+# ASGI scope of the request being served; Motor copies the context into its
+# executor threads, so command listeners can see which route issued a command.
+current_scope = contextvars.ContextVar("current_scope", default=None)
+
+# Commands whose filter/pipeline can be explained.
+EXPLAINABLE_COMMANDS = {"find", "aggregate", "count", "distinct", "update", "delete", "findAndModify"}
+
+# Command fields that explain doesn't accept.
+_SESSION_FIELDS = {"lsid", "txnNumber", "readConcern", "writeConcern", "startTransaction", "autocommit"}
+
+
+class QueryRouteMiddleware:
+    """Pure ASGI middleware exposing the current request to command listeners."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        token = current_scope.set(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_scope.reset(token)
+
+
+def current_route():
+    """"METHOD /route/template" of the request being served, if any."""
+    scope = current_scope.get()
+    if scope is None:
+        return None
+    route = scope.get("route")
+    return f'{scope["method"]} {getattr(route, "path", None) or scope["path"]}'
+
+
+def redact(value):
+    """Replace literal values with "?" while keeping field names and operators."""
+    if isinstance(value, dict):
+        return {key: redact(inner) for key, inner in value.items()}
+    if isinstance(value, (list, tuple)):
+        shapes = []
+        for item in value:
+            shape = redact(item)
+            if shape not in shapes:
+                shapes.append(shape)
+        return shapes
+    return "?"
+
+
+def query_shape(command_name, command):
+    """The redacted filter/sort/pipeline of a command."""
+    if command_name == "find":
+        return {"filter": redact(command.get("filter", {})), "sort": command.get("sort")}
+    if command_name == "aggregate":
+        return {"pipeline": redact(command.get("pipeline", []))}
+    if command_name in ("count", "distinct", "findAndModify"):
+        return {"filter": redact(command.get("query", {}))}
+    if command_name == "update":
+        return {"filter": redact([u.get("q", {}) for u in command.get("updates", [])])}
+    if command_name == "delete":
+        return {"filter": redact([d.get("q", {}) for d in command.get("deletes", [])])}
+    return {}
+
+
+def returned_count(command_name, reply):
+    """Number of documents a command returned or affected."""
+    cursor = reply.get("cursor")
+    if cursor:
+        return len(cursor.get("firstBatch") or cursor.get("nextBatch") or [])
+    if "n" in reply:
+        return reply["n"]
+    if command_name == "distinct":
+        return len(reply.get("values", []))
+    return None
+
+
+def _plan_stages(plan):
+    """Flatten a winning plan into its stage names, e.g. ["FETCH", "IXSCAN"]."""
+    stages = []
+    while plan:
+        stages.append(plan.get("stage"))
+        plan = plan.get("inputStage") or (plan.get("inputStages") or [None])[0] or plan.get("queryPlan")
+    return [stage for stage in stages if stage]
+
+
+def summarize_explain(explain):
+    """Pick docs/keys examined and the plan stages out of an explain() result."""
+    stats = explain.get("executionStats", {})
+    planner = explain.get("queryPlanner")
+    if planner is None:
+        # Aggregations report the $cursor stage's explain under "stages".
+        for stage in explain.get("stages", []):
+            if "$cursor" in stage:
+                planner = stage["$cursor"].get("queryPlanner", {})
+                stats = stage["$cursor"].get("executionStats", {})
+                break
+    return {
+        "docsExamined": stats.get("totalDocsExamined"),
+        "keysExamined": stats.get("totalKeysExamined"),
+        "nReturned": stats.get("nReturned"),
+        "planStages": _plan_stages((planner or {}).get("winningPlan", {})),
+    }
+
+
+class SlowQueryLog(monitoring.CommandListener):
+    """Logs and aggregates MongoDB commands slower than the threshold."""
+
+    def __init__(self, threshold_ms=SLOW_QUERY_THRESHOLD_MS, explain_sample_rate=SLOW_QUERY_EXPLAIN_SAMPLE_RATE):
+        self.threshold_micros = threshold_ms * 1000
+        self.explain_sample_rate = explain_sample_rate
+        self.client = None
+        self.loop = None
+        self.pending = {}  # request_id -> (command, route)
+        self.shapes = {}  # shape key -> aggregated stats
+        self.dropped = 0
+        self.lock = threading.Lock()
+
+    def attach(self, client, loop):
+        """Give the log a client/event loop to run sampled explain() calls on."""
+        self.client = client
+        self.loop = loop
+
+    def started(self, event):
+        if event.command_name in EXPLAINABLE_COMMANDS:
+            self.pending[event.request_id] = (event.command, current_route())
+
+    def failed(self, event):
+        self.pending.pop(event.request_id, None)
+
+    def succeeded(self, event):
+        started = self.pending.pop(event.request_id, None)
+        if started is None or event.duration_micros < self.threshold_micros:
+            return
+
+        command, route = started
+        command_name = event.command_name
+        collection = command_collection(command_name, command)
+        shape = query_shape(command_name, command)
+        key = json.dumps(
+            {"db": event.database_name, "collection": collection, "command": command_name, **shape},
+            sort_keys=True,
+            default=str,
+        )
+        duration_ms = event.duration_micros / 1000
+        returned = returned_count(command_name, event.reply)
+
+        with self.lock:
+            entry = self.shapes.get(key)
+            if entry is None:
+                if len(self.shapes) >= SLOW_QUERY_MAX_SHAPES:
+                    self.dropped += 1
+                    return
+                entry = self.shapes[key] = {
+                    "database": event.database_name,
+                    "collection": collection,
+                    "command": command_name,
+                    "shape": shape,
+                    "count": 0,
+                    "totalMs": 0.0,
+                    "maxMs": 0.0,
+                    "lastReturned": None,
+                    "docsExamined": None,
+                    "keysExamined": None,
+                    "routes": [],
+                    "lastSeen": None,
+                    "explain": None,
+                    "explainedAt": 0.0,
+                }
+            entry["count"] += 1
+            entry["totalMs"] += duration_ms
+            entry["maxMs"] = max(entry["maxMs"], duration_ms)
+            entry["lastReturned"] = returned
+            entry["lastSeen"] = time.time()
+            if route and route not in entry["routes"] and len(entry["routes"]) < 10:
+                entry["routes"].append(route)
+
+            examined = entry["docsExamined"]
+            should_explain = (
+                self.client is not None
+                and time.time() - entry["explainedAt"] > SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS
+            )
+            if should_explain:
+                entry["explainedAt"] = time.time()
+
+        # examined is from the shape's last explain (None until the first one finishes).
+        print(
+            f"Slow query ({duration_ms:.1f} ms) {event.database_name}.{collection} {command_name} "
+            f"shape={json.dumps(shape, default=str)} route={route} returned={returned} examined={examined}"
+        )
+
+        if should_explain:
+            keep_plan = random.random() < self.explain_sample_rate
+            explain_command = {k: v for k, v in command.items() if not k.startswith("$") and k not in _SESSION_FIELDS}
+            asyncio.run_coroutine_threadsafe(
+                self._explain(key, event.database_name, explain_command, keep_plan), self.loop
+            )
+
+    async def _explain(self, key, database_name, command, keep_plan):
+        try:
+            explain = await self.client[database_name].command(
+                {"explain": command, "verbosity": "executionStats"}
+            )
+        except Exception as e:
+            print(f"Warning: explain of slow query failed: {e}")
+            return
+
+        summary = summarize_explain(explain)
+        if keep_plan:
+            print(f"Slow query plan {json.loads(key)}: {summary}")
+        else:
+            print(
+                f"Slow query examined {json.loads(key)}: docs={summary['docsExamined']} "
+                f"keys={summary['keysExamined']} returned={summary['nReturned']}"
+            )
+        with self.lock:
+            entry = self.shapes.get(key)
+            if entry is not None:
+                entry["docsExamined"] = summary["docsExamined"]
+                entry["keysExamined"] = summary["keysExamined"]
+                if keep_plan:
+                    entry["explain"] = summary
+
+    def report(self):
+        """Aggregated slow queries, worst total time first."""
+        with self.lock:
+            entries = [dict(entry, routes=list(entry["routes"])) for entry in self.shapes.values()]
+            dropped = self.dropped
+        for entry in entries:
+            entry["avgMs"] = round(entry["totalMs"] / entry["count"], 1)
+            del entry["explainedAt"]
+        entries.sort(key=lambda entry: entry["totalMs"], reverse=True)
+        return {"thresholdMs": self.threshold_micros / 1000, "shapes": entries, "droppedShapes": dropped}
+
+    def reset(self):
+        with self.lock:
+            self.shapes.clear()
+            self.dropped = 0
+
+
+slow_query_log = SlowQueryLog()
@@ -0,0 +1,473 @@
+"""
+Asynchronous attendance reports.
+
+POST /api/reports/jobs queues a report job in `report_jobs`; ReportWorkers
+(REPORT_WORKERS asyncio tasks per server process) claim queued jobs with an
+atomic find_one_and_update and a lease, so any number of processes can share
+the queue and a job left behind by a crashed process is picked up again once
+its lease expires.
+
+A worker streams the attendance of the report period from the store's cursors
+(hot and archive tiers, see attendance_store.iter_records) into one compact
+day-code array per employee, then hands the arrays to a process pool
+(REPORT_PROCESSES) for the CPU-bound part, so computing a large report never
+blocks the event loop serving requests.
+
+Results are cached in `report_results` by (tenant, report type, period,
+filters), with the per-employee rows split over `report_result_chunks`
+documents of REPORT_RESULT_CHUNK_ROWS rows each, so no document nears
+MongoDB's 16MB limit. A cached result is only reused while no attendance of
+its period has been marked since it was computed (checked when a job is
+submitted, so marks write nothing extra), and expires after
+REPORT_RESULT_TTL_SECONDS.
+
+The job queue and results live in the default database, shared by all tenants;
+each job records its tenant and runs against that tenant's database.
+"""
+import os
+import json
+import asyncio
+import hashlib
+import multiprocessing
+from datetime import date, datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+
+from bson import ObjectId
+from pymongo import ReturnDocument, IndexModel
+
+from database import get_database, get_shared_database
+from tenancy import current_tenant
+from attendance_store import get_attendance_store
+
+
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", 2))
+REPORT_PROCESSES = int(os.getenv("REPORT_PROCESSES", 2))
+REPORT_POLL_SECONDS = float(os.getenv("REPORT_POLL_SECONDS", 5))
+REPORT_LEASE_SECONDS = float(os.getenv("REPORT_LEASE_SECONDS", 300))
+REPORT_RESULT_TTL_SECONDS = int(os.getenv("REPORT_RESULT_TTL_SECONDS", 7 * 24 * 3600))
+REPORT_RESULT_CHUNK_ROWS = int(os.getenv("REPORT_RESULT_CHUNK_ROWS", 5000))
+# Marks are timestamped by whichever server made them; allow for clock differences.
+REPORT_CLOCK_SKEW_SECONDS = float(os.getenv("REPORT_CLOCK_SKEW_SECONDS", 5))
+
+JOBS_COLLECTION = "report_jobs"
+RESULTS_COLLECTION = "report_results"
+RESULT_CHUNKS_COLLECTION = "report_result_chunks"
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Day codes in the per-employee arrays handed to the process pool.
+UNMARKED = 0
+PRESENT = 1
+ABSENT = 2
+DAY_CODES = {"Present": PRESENT, "Absent": ABSENT}
+
+_process_pool = None
+
+
+async def ensure_report_indexes(shared):
+    await shared[JOBS_COLLECTION].create_indexes(
+        [
+            IndexModel([("status", 1), ("createdAt", 1)], name="status_1_createdAt_1"),
+            IndexModel([("cacheKey", 1), ("status", 1)], name="cacheKey_1_status_1"),
+            IndexModel([("tenant", 1), ("_id", 1)], name="tenant_1__id_1"),
+        ]
+    )
+    await shared[RESULTS_COLLECTION].create_indexes(
+        [IndexModel([("computedAt", 1)], name="computedAt_ttl", expireAfterSeconds=REPORT_RESULT_TTL_SECONDS)]
+    )
+    await shared[RESULT_CHUNKS_COLLECTION].create_indexes(
+        [
+            IndexModel([("resultId", 1), ("generation", 1), ("n", 1)], name="resultId_1_generation_1_n_1"),
+            IndexModel([("computedAt", 1)], name="computedAt_ttl", expireAfterSeconds=REPORT_RESULT_TTL_SECONDS),
+        ]
+    )
+
+
+def cache_key(tenant, report_type, params):
+    raw = json.dumps([tenant, report_type, params], sort_keys=True)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def compute_month_end(start_ordinal, end_ordinal, holiday_ordinals, employees, days):
+    """
+    Month-end attendance report. Runs in the process pool, so it only takes and
+    returns plain picklable data.
+
+    employees: [(employeeId, fullName, department)]
+    days: {employeeId: bytes} with one day code per calendar day of the period.
+    """
+    holidays = set(holiday_ordinals)
+    working = [
+        ordinal not in holidays and date.fromordinal(ordinal).weekday() < 5
+        for ordinal in range(start_ordinal, end_ordinal + 1)
+    ]
+    working_days = sum(working)
+    empty = bytes(len(working))
+
+    rows = []
+    departments = {}
+    for employee_id, full_name, department in employees:
+        codes = days.get(employee_id, empty)
+        present = absent = unmarked = extra = 0
+        streak = longest = 0
+        for is_working, code in zip(working, codes):
+            if not is_working:
+                # Weekends and holidays neither count nor break an absence streak.
+                if code == PRESENT:
+                    extra += 1
+                continue
+            if code == PRESENT:
+                present += 1
+                streak = 0
+            elif code == ABSENT:
+                absent += 1
+                streak += 1
+                longest = max(longest, streak)
+            else:
+                unmarked += 1
+                streak = 0
+        rows.append(
+            {
+                "employeeId": employee_id,
+                "fullName": full_name,
+                "department": department,
+                "workingDays": working_days,
+                "presentDays": present,
+                "absentDays": absent,
+                "unmarkedDays": unmarked,
+                "nonWorkingDaysPresent": extra,
+                "attendancePct": round(100 * present / working_days, 1) if working_days else None,
+                "longestAbsenceStreak": longest,
+                "currentAbsenceStreak": streak,
+            }
+        )
+
+        totals = departments.setdefault(
+            department, {"department": department, "employees": 0, "presentDays": 0, "absentDays": 0, "unmarkedDays": 0}
+        )
+        totals["employees"] += 1
+        totals["presentDays"] += present
+        totals["absentDays"] += absent
+        totals["unmarkedDays"] += unmarked
+
+    for totals in departments.values():
+        expected = totals["employees"] * working_days
+        totals["attendancePct"] = round(100 * totals["presentDays"] / expected, 1) if expected else None
+
+    return {
+        "workingDays": working_days,
+        "employees": rows,
+        "departments": sorted(departments.values(), key=lambda d: d["department"]),
+    }
+
+
+# Report type -> CPU-bound compute function.
+REPORT_TYPES = {"month_end": compute_month_end}
+
+# Columns of the CSV download, per report type.
+CSV_COLUMNS = {
+    "month_end": [
+        "employeeId",
+        "fullName",
+        "department",
+        "workingDays",
+        "presentDays",
+        "absentDays",
+        "unmarkedDays",
+        "nonWorkingDaysPresent",
+        "attendancePct",
+        "longestAbsenceStreak",
+        "currentAbsenceStreak",
+    ],
+}
+
+
+def _get_process_pool():
+    global _process_pool
+    if _process_pool is None and REPORT_PROCESSES > 0:
+        # Not fork: this process runs Motor's executor and monitor threads, and a
+        # child forked while one of them holds a lock can deadlock.
+        _process_pool = ProcessPoolExecutor(
+            max_workers=REPORT_PROCESSES, mp_context=multiprocessing.get_context("forkserver")
+        )
+    return _process_pool  # None runs reports on the default thread pool
+
+
+async def _load_days(database, params):
+    """(employees, {employeeId: day codes}) for a report period, streamed from cursors."""
+    start = date.fromisoformat(params["startDate"])
+    end = date.fromisoformat(params["endDate"])
+    employee_filter = {"department": params["department"]} if params.get("department") else {}
+
+    employees = []
+    days = {}
+    length = (end - start).days + 1
+    async for employee in database.employees.find(employee_filter, {"employeeId": 1, "fullName": 1, "department": 1}):
+        employees.append((employee["employeeId"], employee.get("fullName", ""), employee.get("department", "")))
+        days[employee["employeeId"]] = bytearray(length)
+
+    # Archived records come first, so the hot record of a day overwrites them.
+    async for record in get_attendance_store().iter_records(database, start, end):
+        codes = days.get(record.get("employeeId") or record.get("employee_id"))
+        if codes is not None:
+            codes[(record["date"].date() - start).days] = DAY_CODES.get(record.get("status"), UNMARKED)
+
+    return employees, {employee_id: bytes(codes) for employee_id, codes in days.items()}
+
+
+async def _compute(database, job):
+    params = job["params"]
+    employees, days = await _load_days(database, params)
+    compute = REPORT_TYPES[job["type"]]
+    args = (
+        date.fromisoformat(params["startDate"]).toordinal(),
+        date.fromisoformat(params["endDate"]).toordinal(),
+        [date.fromisoformat(day).toordinal() for day in params["holidays"]],
+        employees,
+        days,
+    )
+    return await asyncio.get_running_loop().run_in_executor(_get_process_pool(), compute, *args)
+
+
+async def submit_report(database, report_type, start, end, department=None, holidays=()):
+    """
+    Queue a report on the current tenant's `database` and return its job
+    document. Returns the job already queued or running for the same report,
+    or a finished job when a current cached result exists.
+    """
+    shared = get_shared_database()
+    tenant = current_tenant.get()
+    params = {
+        "startDate": start.isoformat(),
+        "endDate": end.isoformat(),
+        "department": department,
+        "holidays": sorted({day.isoformat() for day in holidays}),
+    }
+    key = cache_key(tenant, report_type, params)
+    now = datetime.utcnow()
+    job = {
+        "tenant": tenant,
+        "type": report_type,
+        "params": params,
+        "cacheKey": key,
+        "createdAt": now,
+        "startedAt": None,
+        "finishedAt": None,
+        "leaseUntil": None,
+        "error": None,
+        "resultId": None,
+        "cached": False,
+    }
+
+    cached = await shared[RESULTS_COLLECTION].find_one({"_id": key}, {"computedFrom": 1})
+    if (
+        cached is not None
+        and cached.get("computedFrom") is not None
+        and not await get_attendance_store().changed_since(database, start, end, cached["computedFrom"])
+    ):
+        job.update(status=DONE, startedAt=now, finishedAt=now, resultId=key, cached=True)
+        result = await shared[JOBS_COLLECTION].insert_one(job)
+        job["_id"] = result.inserted_id
+        return job
+
+    existing = await shared[JOBS_COLLECTION].find_one({"cacheKey": key, "status": {"$in": [QUEUED, RUNNING]}})
+    if existing is not None:
+        return existing
+
+    job["status"] = QUEUED
+    result = await shared[JOBS_COLLECTION].insert_one(job)
+    job["_id"] = result.inserted_id
+    report_workers.notify()
+    return job
+
+
+async def get_job(job_id):
+    """A job of the current tenant (None for another tenant's job)."""
+    if not ObjectId.is_valid(job_id):
+        return None
+    return await get_shared_database()[JOBS_COLLECTION].find_one(
+        {"_id": ObjectId(job_id), "tenant": current_tenant.get()}
+    )
+
+
+async def get_result(job):
+    """
+    The stored result of a finished job with its rows reassembled from their
+    chunks, or None if it expired (or was recomputed away mid-read twice).
+    """
+    shared = get_shared_database()
+    for _ in range(2):
+        stored = await shared[RESULTS_COLLECTION].find_one({"_id": job["resultId"]})
+        if stored is None or "generation" not in stored:
+            return stored
+        rows = []
+        cursor = shared[RESULT_CHUNKS_COLLECTION].find(
+            {"resultId": job["resultId"], "generation": stored["generation"]}, sort=[("n", 1)]
+        )
+        chunks = 0
+        async for chunk in cursor:
+            rows.extend(chunk["rows"])
+            chunks += 1
+        if chunks == stored["chunks"]:
+            stored["result"]["employees"] = rows
+            return stored
+    return None
+
+
+async def _store_result(shared, job, computed_from, result):
+    """Write a result as a metadata document plus chunks of rows, replacing the previous one."""
+    key = job["cacheKey"]
+    generation = ObjectId()
+    computed_at = datetime.utcnow()
+    rows = result.pop("employees")
+    chunks = [
+        {
+            "resultId": key,
+            "generation": generation,
+            "n": n,
+            "rows": rows[offset:offset + REPORT_RESULT_CHUNK_ROWS],
+            "computedAt": computed_at,
+        }
+        for n, offset in enumerate(range(0, len(rows), REPORT_RESULT_CHUNK_ROWS))
+    ]
+    # Chunks first, so a reader never sees a result whose rows are missing.
+    if chunks:
+        await shared[RESULT_CHUNKS_COLLECTION].insert_many(chunks)
+    await shared[RESULTS_COLLECTION].replace_one(
+        {"_id": key},
+        {
+            "tenant": job.get("tenant"),
+            "type": job["type"],
+            "params": job["params"],
+            "computedFrom": computed_from,
+            "generation": generation,
+            "chunks": len(chunks),
+            "result": result,
+            "computedAt": computed_at,
+        },
+        upsert=True,
+    )
+    # Drop the chunks of whichever result was replaced.
+    current = await shared[RESULTS_COLLECTION].find_one({"_id": key}, {"generation": 1})
+    if current is not None:
+        await shared[RESULT_CHUNKS_COLLECTION].delete_many(
+            {"resultId": key, "generation": {"$ne": current.get("generation")}}
+        )
+
+
+async def claim_job(shared):
+    """Atomically take the oldest queued job, or a running one whose lease expired."""
+    now = datetime.utcnow()
+    return await shared[JOBS_COLLECTION].find_one_and_update(
+        {
+            "$or": [
+                {"status": QUEUED},
+                {"status": RUNNING, "leaseUntil": {"$lt": now}},
+            ]
+        },
+        {
+            "$set": {
+                "status": RUNNING,
+                "startedAt": now,
+                "leaseUntil": now + timedelta(seconds=REPORT_LEASE_SECONDS),
+            }
+        },
+        sort=[("createdAt", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def _renew_lease(shared, job_id):
+    while True:
+        await asyncio.sleep(REPORT_LEASE_SECONDS / 3)
+        try:
+            await shared[JOBS_COLLECTION].update_one(
+                {"_id": job_id, "status": RUNNING},
+                {"$set": {"leaseUntil": datetime.utcnow() + timedelta(seconds=REPORT_LEASE_SECONDS)}},
+            )
+        except Exception as e:
+            # Keep trying: two more misses still leave time before the lease runs out.
+            print(f"Warning: failed to renew lease of report job {job_id}: {e}")
+
+
+async def run_job(shared, job):
+    lease = asyncio.create_task(_renew_lease(shared, job["_id"]))
+    tenant_token = current_tenant.set(job.get("tenant"))
+    try:
+        database = get_database()
+        # Taken before reading: a mark that lands while the report is being
+        # computed is newer, so the result is not reused afterwards.
+        computed_from = datetime.utcnow() - timedelta(seconds=REPORT_CLOCK_SKEW_SECONDS)
+        result = await _compute(database, job)
+        await _store_result(shared, job, computed_from, result)
+        update = {"status": DONE, "resultId": job["cacheKey"]}
+    except Exception as e:
+        print(f"Report job {job['_id']} failed: {e}")
+        update = {"status": FAILED, "error": str(e)}
+    finally:
+        current_tenant.reset(tenant_token)
+        lease.cancel()
+
+    update.update(finishedAt=datetime.utcnow(), leaseUntil=None)
+    await shared[JOBS_COLLECTION].update_one({"_id": job["_id"], "status": RUNNING}, {"$set": update})
+
+
+class ReportWorkers:
+    """Background tasks processing the report job queue of this process."""
+
+    def __init__(self, count):
+        self.count = count
+        self.tasks = []
+        self.wake = asyncio.Event()
+        self.indexes_ready = False
+
+    def start(self):
+        if not self.tasks:
+            self.tasks = [asyncio.create_task(self._run()) for _ in range(self.count)]
+
+    def notify(self):
+        """A job was queued by this process; don't wait for the next poll."""
+        self.wake.set()
+
+    async def stop(self):
+        global _process_pool
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        if _process_pool is not None:
+            _process_pool.shutdown(cancel_futures=True)
+            _process_pool = None
+
+    async def _run(self):
+        while True:
+            shared = get_shared_database()
+            job = None
+            if shared is not None:
+                try:
+                    if not self.indexes_ready:
+                        # Created here rather than in init_db: the queue is optional
+                        # and the database may only come up after startup.
+                        await ensure_report_indexes(shared)
+                        self.indexes_ready = True
+                    job = await claim_job(shared)
+                except Exception as e:
+                    print(f"Report queue error: {e}")
+            if job is None:
+                try:
+                    await asyncio.wait_for(self.wake.wait(), REPORT_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                self.wake.clear()
+                continue
+            try:
+                await run_job(shared, job)
+            except Exception as e:
+                # Lost the database while finishing; the lease expires and the job is retried.
+                print(f"Report job {job['_id']} error: {e}")
+
+
+report_workers = ReportWorkers(REPORT_WORKERS)
@@ -0,0 +1,38 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import PlainTextResponse
+from auth import require_admin
+from querylog import slow_query_log
+from profiling import list_profiles, get_folded_profile
+
+router = APIRouter(prefix="/api/admin", tags=["admin"], dependencies=[Depends(require_admin)])
+
+
+@router.get("/slow-queries")
+async def get_slow_queries():
+    """Slow MongoDB commands aggregated by query shape (worst total time first)"""
+    return slow_query_log.report()
+
+
+@router.delete("/slow-queries")
+async def reset_slow_queries():
+    """Clear the aggregated slow-query log"""
+    slow_query_log.reset()
+    return {"message": "Slow query log cleared"}
+
+
+@router.get("/profiles")
+async def get_profiles():
+    """Recently captured request profiles with their timing breakdown"""
+    return list_profiles()
+
+
+@router.get("/profiles/{profile_id}", response_class=PlainTextResponse)
+async def get_profile(profile_id: str):
+    """Folded stacks of a profile (load into flamegraph.pl or speedscope)"""
+    folded = get_folded_profile(profile_id)
+    if folded is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profile not found"
+        )
+    return folded
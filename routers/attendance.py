@@ -1,10 +1,22 @@
-from fastapi import APIRouter, HTTPException, status, Query
+from fastapi import APIRouter, HTTPException, status, Query, Header, Response
+from fastapi.responses import StreamingResponse
 from typing import List, Optional, Literal
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
 from pydantic import BaseModel, Field, field_validator
-from models.attendance import Attendance
 from models.employee import Employee
-from database import get_database, ensure_attendance_indexes
+from database import (
+    get_database,
+    ensure_attendance_indexes,
+    causal_session,
+    causal_read_session,
+    encode_causal_token,
+    READ_REPORTING,
+)
+from attendance_store import get_attendance_store, ATTENDANCE_HOT_DAYS
+from live import AttendanceFeed
+from presence import presence_index
+from deadlines import is_deadline_error
+from tenancy import current_tenant
 
 router = APIRouter(prefix="/api/attendance", tags=["attendance"])
 
@@ -46,100 +58,139 @@ class AttendanceOut(BaseModel):
     updatedAt: Optional[datetime] = None
 
 
+def record_to_attendance_out(record):
+    """Convert a raw attendances document to AttendanceOut (None if it has no employee ID)."""
+    employee_id_value = record.get("employeeId") or record.get("employee_id")
+    if not employee_id_value:
+        return None
+
+    record_date = record.get("date")
+    return AttendanceOut.model_validate(
+        {
+            "_id": str(record.get("_id")),
+            "employeeId": employee_id_value,
+            "date": record_date.date() if isinstance(record_date, datetime) else record_date,
+            "status": record.get("status"),
+            "createdAt": record.get("createdAt"),
+            "updatedAt": record.get("updatedAt"),
+        }
+    )
+
+
+def records_to_attendance_out(records):
+    """Convert raw attendances documents, skipping records without an employee ID."""
+    attendance_list = []
+    for record in records:
+        attendance = record_to_attendance_out(record)
+        if attendance is not None:
+            attendance_list.append(attendance)
+    return attendance_list
+
+
+def _serialize_feed_document(document):
+    attendance = record_to_attendance_out(document)
+    return attendance.model_dump_json() if attendance is not None else None
+
+
+# One change stream per worker and tenant, shared by all of the tenant's live subscribers.
+attendance_feeds = {}  # tenant (None = default database) -> AttendanceFeed
+
+
+def get_attendance_feed():
+    tenant = current_tenant.get()
+    feed = attendance_feeds.get(tenant)
+    if feed is None:
+        # The feed's watch task is started from this request, so it inherits the tenant.
+        feed = attendance_feeds[tenant] = AttendanceFeed(get_attendance_store(), _serialize_feed_document)
+    return feed
+
+
+async def stop_attendance_feeds():
+    for feed in attendance_feeds.values():
+        await feed.stop()
+
+
 @router.get("/", response_model=List[AttendanceOut])
 async def get_all_attendance(
     employee_id: Optional[str] = Query(None, alias="employeeId"),
     date_filter: Optional[date] = Query(None, alias="date"),
+    causal_token: Optional[str] = Header(None, alias="X-Causal-Token"),
 ):
-    database = get_database()
+    database = get_database(READ_REPORTING)
     if database is None:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail="Database not connected"
         )
     
-    # Build query
-    query = {}
-    if employee_id:
-        employee_id_norm = employee_id.upper()
-        query["$or"] = [{"employeeId": employee_id_norm}, {"employee_id": employee_id_norm}]
-    if date_filter:
-        # Convert date to datetime for query
-        date_start = datetime.combine(date_filter, datetime.min.time())
-        date_end = datetime.combine(date_filter, datetime.max.time())
-        query["date"] = {"$gte": date_start, "$lte": date_end}
-    
-    # Fetch records
-    records = await database.attendances.find(query).sort([("date", -1), ("createdAt", -1)]).to_list(length=None)
-    
-    # Convert to Attendance objects
-    attendance_list = []
-    for record in records:
-        employee_id_value = record.get("employeeId") or record.get("employee_id")
-        if not employee_id_value:
-            continue
-
-        record_date = record.get("date")
-        attendance_list.append(
-            AttendanceOut.model_validate(
-                {
-                    "_id": str(record.get("_id")),
-                    "employeeId": employee_id_value,
-                    "date": record_date.date() if isinstance(record_date, datetime) else record_date,
-                    "status": record.get("status"),
-                    "createdAt": record.get("createdAt"),
-                    "updatedAt": record.get("updatedAt"),
-                }
-            )
+    store = get_attendance_store()
+    async with causal_read_session(causal_token) as session:
+        records = await store.find(
+            database,
+            employee_id=employee_id.upper() if employee_id else None,
+            start=date_filter,
+            end=date_filter,
+            session=session,
         )
     
-    return attendance_list
+    return records_to_attendance_out(records)
 
 
 @router.get("/employee/{employee_id}", response_model=List[AttendanceOut])
-async def get_employee_attendance(employee_id: str):
-    database = get_database()
+async def get_employee_attendance(
+    employee_id: str,
+    start_date: Optional[date] = Query(None, alias="startDate"),
+    end_date: Optional[date] = Query(None, alias="endDate"),
+    causal_token: Optional[str] = Header(None, alias="X-Causal-Token"),
+):
+    """
+    An employee's attendance, newest first. Without startDate only the last
+    ATTENDANCE_HOT_DAYS days are returned (the hot collection); ask for an
+    older startDate or endDate to read the archive as well.
+    """
+    database = get_database(READ_REPORTING)
     if database is None:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail="Database not connected"
         )
-    
-    employee_id_norm = employee_id.upper()
-    records = (
-        await database.attendances.find(
-            {"$or": [{"employeeId": employee_id_norm}, {"employee_id": employee_id_norm}]}
+
+    if start_date is None:
+        hot_start = date.today() - timedelta(days=ATTENDANCE_HOT_DAYS)
+        # An endDate before the hot window asks for older history explicitly.
+        start_date = hot_start if end_date is None or end_date >= hot_start else None
+
+    store = get_attendance_store()
+    async with causal_read_session(causal_token) as session:
+        records = await store.find(
+            database, employee_id=employee_id.upper(), start=start_date, end=end_date, session=session
         )
-        .sort([("date", -1)])
-        .to_list(length=None)
-    )
     
-    # Convert to Attendance objects
-    attendance_list = []
-    for record in records:
-        employee_id_value = record.get("employeeId") or record.get("employee_id")
-        if not employee_id_value:
-            continue
-
-        record_date = record.get("date")
-        attendance_list.append(
-            AttendanceOut.model_validate(
-                {
-                    "_id": str(record.get("_id")),
-                    "employeeId": employee_id_value,
-                    "date": record_date.date() if isinstance(record_date, datetime) else record_date,
-                    "status": record.get("status"),
-                    "createdAt": record.get("createdAt"),
-                    "updatedAt": record.get("updatedAt"),
-                }
-            )
+    return records_to_attendance_out(records)
+
+
+@router.get("/live")
+async def live_attendance(
+    department: Optional[str] = Query(None),
+    date_filter: Optional[date] = Query(None, alias="date"),
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID"),
+):
+    """Server-Sent Events stream of attendance inserts/updates (optionally filtered)"""
+    if get_database() is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Database not connected"
         )
-    
-    return attendance_list
+
+    return StreamingResponse(
+        get_attendance_feed().subscribe(department=department, event_date=date_filter, last_event_id=last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.post("/", response_model=AttendanceOut, status_code=status.HTTP_201_CREATED)
-async def mark_attendance(attendance_data: AttendanceCreate):
+async def mark_attendance(attendance_data: AttendanceCreate, response: Response):
     database = get_database()
     if database is None:
         raise HTTPException(
@@ -156,64 +207,50 @@ async def mark_attendance(attendance_data: AttendanceCreate):
             detail="Employee not found",
         )
 
-    employee_id = attendance_data.employee_id
-    date_dt = datetime.combine(attendance_data.date, datetime.min.time())
-
-    async def upsert_and_fetch():
-        now = datetime.utcnow()
-        await database.attendances.update_one(
-            {
-                "$or": [
-                    {"employeeId": employee_id, "date": date_dt},
-                    {"employee_id": employee_id, "date": date_dt},
-                ]
-            },
-            {
-                # Keep both field variants for backward compatibility with legacy indexes/data.
-                "$set": {
-                    "employeeId": employee_id,
-                    "employee_id": employee_id,
-                    "status": attendance_data.status,
-                    "updatedAt": now,
-                },
-                "$setOnInsert": {"date": date_dt, "createdAt": now},
-            },
-            upsert=True,
-        )
-        saved_doc = await database.attendances.find_one(
-            {
-                "$or": [
-                    {"employeeId": employee_id, "date": date_dt},
-                    {"employee_id": employee_id, "date": date_dt},
-                ]
-            }
+    store = get_attendance_store()
+
+    async def upsert_and_fetch(session):
+        return await store.mark(
+            database, attendance_data.employee_id, attendance_data.date, attendance_data.status, session=session
         )
-        return saved_doc
-
-    try:
-        saved = await upsert_and_fetch()
-    except Exception as e:
-        error_str = str(e)
-        if "duplicate key" in error_str.lower() or "E11000" in error_str:
-            if "employee_id_1_date_1" in error_str or ("employee_id" in error_str and "employeeId" not in error_str):
-                await ensure_attendance_indexes(database)
-                try:
-                    saved = await upsert_and_fetch()
-                except Exception as e2:
+
+    async with causal_session() as session:
+        try:
+            saved = await upsert_and_fetch(session)
+        except Exception as e:
+            if is_deadline_error(e):
+                raise
+            error_str = str(e)
+            if "duplicate key" in error_str.lower() or "E11000" in error_str:
+                if "employee_id_1_date_1" in error_str or ("employee_id" in error_str and "employeeId" not in error_str):
+                    await ensure_attendance_indexes(database)
+                    try:
+                        saved = await upsert_and_fetch(session)
+                    except Exception as e2:
+                        if is_deadline_error(e2):
+                            raise
+                        raise HTTPException(
+                            status_code=status.HTTP_409_CONFLICT,
+                            detail=f"Attendance conflict: {str(e2)}",
+                        )
+                else:
                     raise HTTPException(
                         status_code=status.HTTP_409_CONFLICT,
-                        detail=f"Attendance conflict: {str(e2)}",
+                        detail="Attendance already exists for this employee on this date",
                     )
             else:
                 raise HTTPException(
-                    status_code=status.HTTP_409_CONFLICT,
-                    detail="Attendance already exists for this employee on this date",
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail=f"Error marking attendance: {error_str}",
                 )
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Error marking attendance: {error_str}",
-            )
+
+        causal_token = encode_causal_token(session)
+
+    presence_index.record_mark(attendance_data.employee_id, employee.department, attendance_data.date, attendance_data.status)
+
+    if causal_token:
+        # Clients pass this back on reads to see their own write from a secondary.
+        response.headers["X-Causal-Token"] = causal_token
 
     if not saved:
         raise HTTPException(
@@ -221,29 +258,21 @@ async def mark_attendance(attendance_data: AttendanceCreate):
             detail="Error marking attendance: could not read saved record",
         )
 
-    employee_id_value = saved.get("employeeId") or saved.get("employee_id")
-    if not employee_id_value:
+    attendance = record_to_attendance_out(saved)
+    if attendance is None:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error marking attendance: saved record missing employeeId",
         )
-
-    saved_date = saved.get("date")
-    return AttendanceOut.model_validate(
-        {
-            "_id": str(saved.get("_id")),
-            "employeeId": employee_id_value,
-            "date": saved_date.date() if isinstance(saved_date, datetime) else saved_date,
-            "status": saved.get("status"),
-            "createdAt": saved.get("createdAt"),
-            "updatedAt": saved.get("updatedAt"),
-        }
-    )
+    return attendance
 
 
 @router.get("/stats/{employee_id}", response_model=AttendanceStats)
-async def get_attendance_stats(employee_id: str):
-    database = get_database()
+async def get_attendance_stats(
+    employee_id: str,
+    causal_token: Optional[str] = Header(None, alias="X-Causal-Token"),
+):
+    database = get_database(READ_REPORTING)
     if database is None:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
@@ -252,13 +281,10 @@ async def get_attendance_stats(employee_id: str):
     
     employee_id = employee_id.upper()
 
-    records = await database.attendances.find(
-        {"$or": [{"employeeId": employee_id}, {"employee_id": employee_id}]}
-    ).to_list(length=None)
-
-    total_days = len(records)
-    present_days = sum(1 for r in records if r["status"] == "Present")
-    absent_days = sum(1 for r in records if r["status"] == "Absent")
+    async with causal_read_session(causal_token) as session:
+        total_days, present_days, absent_days = await get_attendance_store().stats(
+            database, employee_id, session=session
+        )
 
     return AttendanceStats(
         employee_id=employee_id,
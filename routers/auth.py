@@ -10,6 +10,14 @@ router = APIRouter(prefix="/api/auth", tags=["authentication"])
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
 
+def token_claims(user):
+    """Access token claims for a user; "tenant" selects the tenant database (tenancy.py)."""
+    claims = {"sub": str(user.id), "email": user.email}
+    if user.tenant:
+        claims["tenant"] = user.tenant
+    return claims
+
+
 class UserSignup(BaseModel):
     email: EmailStr
     password: str = Field(..., min_length=6)
@@ -60,7 +68,7 @@ async def signup(user_data: UserSignup):
         saved_user = await user.insert()
 
         # Create access token
-        access_token = create_access_token(data={"sub": str(saved_user.id), "email": saved_user.email})
+        access_token = create_access_token(data=token_claims(saved_user))
 
         return TokenResponse(
             access_token=access_token,
@@ -100,7 +108,7 @@ async def login(login_data: UserLogin):
             )
 
         # Create access token
-        access_token = create_access_token(data={"sub": str(user.id), "email": user.email})
+        access_token = create_access_token(data=token_claims(user))
 
         return TokenResponse(
             access_token=access_token,
@@ -140,7 +148,7 @@ async def login_form(form_data: OAuth2PasswordRequestForm = Depends()):
             )
 
         # Create access token
-        access_token = create_access_token(data={"sub": str(user.id), "email": user.email})
+        access_token = create_access_token(data=token_claims(user))
 
         return TokenResponse(
             access_token=access_token,
@@ -0,0 +1,113 @@
+from fastapi import APIRouter, HTTPException, status, Query, Header
+from typing import List, Optional, Literal
+from datetime import date
+from pydantic import BaseModel
+from database import get_database, causal_read_session, READ_REPORTING
+from attendance_store import get_attendance_store
+
+router = APIRouter(prefix="/api/dashboard", tags=["dashboard"])
+
+
+class EmployeeSummary(BaseModel):
+    employeeId: str
+    fullName: str
+    email: str
+    department: str
+    totalDays: int
+    presentDays: int
+    absentDays: int
+    todayStatus: Optional[Literal["Present", "Absent"]] = None
+
+
+class DashboardSummary(BaseModel):
+    total: int
+    skip: int
+    limit: int
+    date: date
+    startDate: Optional[date] = None
+    endDate: Optional[date] = None
+    employees: List[EmployeeSummary]
+
+
+@router.get("/summary", response_model=DashboardSummary)
+async def get_dashboard_summary(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    department: Optional[str] = Query(None),
+    start_date: Optional[date] = Query(None, alias="startDate"),
+    end_date: Optional[date] = Query(None, alias="endDate"),
+    date_filter: Optional[date] = Query(None, alias="date"),
+    causal_token: Optional[str] = Header(None, alias="X-Causal-Token"),
+):
+    """
+    Employees with their attendance counts and status on `date` (default today)
+    in one aggregation, replacing a stats request per employee. Counts cover
+    startDate..endDate when given, otherwise all attendance.
+    """
+    database = get_database(READ_REPORTING)
+    if database is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Database not connected"
+        )
+
+    on_date = date_filter or date.today()
+    employee_match = {"department": department} if department else {}
+    attendance_stages = await get_attendance_store().summary_stages(database, start_date, end_date, on_date)
+
+    pipeline = [
+        {"$match": employee_match},
+        # Same order as GET /api/employees; _id keeps pages stable. Sort, skip and
+        # limit run on the createdAt indexes before any attendance is looked up.
+        {"$sort": {"createdAt": -1, "_id": -1}},
+        {"$skip": skip},
+        {"$limit": limit},
+        *attendance_stages,
+        {
+            "$project": {
+                "_id": 0,
+                "employeeId": 1,
+                "fullName": 1,
+                "email": 1,
+                "department": 1,
+                "presentDays": 1,
+                "absentDays": 1,
+                "todayStatus": 1,
+            }
+        },
+    ]
+
+    async with causal_read_session(causal_token) as session:
+        if employee_match:
+            total = await database.employees.count_documents(employee_match, session=session)
+        else:
+            # Collection metadata instead of scanning every employee.
+            total = await database.employees.estimated_document_count()
+        rows = await database.employees.aggregate(pipeline, session=session).to_list(length=None)
+
+    employees = []
+    for row in rows:
+        present_days = row.get("presentDays", 0)
+        absent_days = row.get("absentDays", 0)
+        employees.append(
+            EmployeeSummary(
+                employeeId=row["employeeId"],
+                fullName=row["fullName"],
+                email=row["email"],
+                department=row["department"],
+                totalDays=present_days + absent_days,
+                presentDays=present_days,
+                absentDays=absent_days,
+                todayStatus=row.get("todayStatus"),
+            )
+        )
+
+    return DashboardSummary(
+        total=total,
+        skip=skip,
+        limit=limit,
+        date=on_date,
+        startDate=start_date,
+        endDate=end_date,
+        employees=employees,
+    )
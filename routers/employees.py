@@ -2,6 +2,8 @@ from fastapi import APIRouter, HTTPException, status
 from typing import List
 from datetime import datetime
 from models.employee import Employee
+from presence import presence_index
+from deadlines import is_deadline_error
 from pydantic import BaseModel, EmailStr, Field, field_validator
 
 router = APIRouter(prefix="/api/employees", tags=["employees"])
@@ -55,6 +57,8 @@ async def get_all_employees():
         employees.sort(key=lambda x: x.created_at if x.created_at else datetime.min, reverse=True)
         return employees
     except Exception as e:
+        if is_deadline_error(e):
+            raise
         error_msg = str(e)
         # Check if it's an authentication error
         if "authentication" in error_msg.lower() or "unauthorized" in error_msg.lower():
@@ -67,6 +71,8 @@ async def get_all_employees():
             employees = await Employee.find_all().to_list()
             return employees
         except Exception as e2:
+            if is_deadline_error(e2):
+                raise
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Error fetching employees: {str(e2)}"
@@ -87,6 +93,8 @@ async def get_employee(id: str):
     except HTTPException:
         raise
     except Exception as e:
+        if is_deadline_error(e):
+            raise
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Invalid employee ID: {str(e)}"
@@ -126,10 +134,13 @@ async def create_employee(employee_data: EmployeeCreate):
         )
 
         saved_employee = await employee.insert()
+        presence_index.record_employee(saved_employee.employee_id, saved_employee.department)
         return saved_employee
     except HTTPException:
         raise
     except Exception as e:
+        if is_deadline_error(e):
+            raise
         import traceback
         error_details = str(e)
         # Provide more detailed error information
@@ -155,10 +166,13 @@ async def delete_employee(id: str):
                 detail="Employee not found"
             )
         await employee.delete()
+        presence_index.record_employee_deleted(employee.employee_id)
         return {"message": "Employee deleted successfully", "employee": employee}
     except HTTPException:
         raise
     except Exception as e:
+        if is_deadline_error(e):
+            raise
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Invalid employee ID: {str(e)}"
@@ -0,0 +1,67 @@
+from fastapi import APIRouter, HTTPException, status, Query
+from typing import List, Optional
+from datetime import date, datetime
+from pydantic import BaseModel
+from database import get_database
+from presence import presence_index
+
+router = APIRouter(prefix="/api/presence", tags=["presence"])
+
+
+class PresenceToday(BaseModel):
+    date: date
+    department: Optional[str] = None
+    checkedIn: List[str]
+    absent: List[str]
+    notMarked: List[str]
+    reconciledAt: Optional[datetime] = None
+    reconciledDrift: Optional[int] = None
+
+
+class DepartmentPresence(BaseModel):
+    department: str
+    checkedIn: int
+    absent: int
+    notMarked: int
+
+
+def _require_database():
+    if get_database() is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Database not connected"
+        )
+
+
+@router.get("/today", response_model=PresenceToday)
+async def get_presence_today(department: Optional[str] = Query(None)):
+    """
+    Employee IDs that checked in, were marked absent or are not marked yet
+    today, optionally for one department. Served from the in-memory presence
+    index; marks made on other server processes arrive through the
+    attendance change stream. reconciledDrift is how many employees the last
+    full rebuild (reconciledAt) had to correct.
+    """
+    _require_database()
+    presence = await presence_index.get()
+    checked_in, absent, not_marked = presence.sets(department)
+    return PresenceToday(
+        date=presence.day,
+        department=department,
+        checkedIn=checked_in,
+        absent=absent,
+        notMarked=not_marked,
+        reconciledAt=presence.loaded_at,
+        reconciledDrift=presence.drift,
+    )
+
+
+@router.get("/today/departments", response_model=List[DepartmentPresence])
+async def get_department_presence_today():
+    """Checked-in, absent and not-marked counts per department for today."""
+    _require_database()
+    presence = await presence_index.get()
+    return [
+        DepartmentPresence(department=department, checkedIn=present, absent=absent, notMarked=not_marked)
+        for department, (present, absent, not_marked) in sorted(presence.counts().items())
+    ]
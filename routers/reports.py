@@ -0,0 +1,148 @@
+import csv
+import io
+import calendar
+from fastapi import APIRouter, HTTPException, status, Query
+from fastapi.responses import Response
+from typing import List, Optional, Literal
+from datetime import date, datetime
+from pydantic import BaseModel, Field, model_validator
+from database import get_database
+from reports import submit_report, get_job, get_result, CSV_COLUMNS, DONE
+
+router = APIRouter(prefix="/api/reports", tags=["reports"])
+
+# Longest period a single report may cover.
+MAX_REPORT_DAYS = 366
+
+
+class ReportJobCreate(BaseModel):
+    type: Literal["month_end"] = "month_end"
+    period: Optional[str] = Field(None, pattern=r"^\d{4}-(0[1-9]|1[0-2])$")
+    start_date: Optional[date] = Field(None, alias="startDate")
+    end_date: Optional[date] = Field(None, alias="endDate")
+    department: Optional[str] = None
+    holidays: List[date] = []
+
+    @model_validator(mode="after")
+    def resolve_period(self):
+        if self.period:
+            if self.start_date or self.end_date:
+                raise ValueError("Give either period or startDate/endDate")
+            year, month = (int(part) for part in self.period.split("-"))
+            self.start_date = date(year, month, 1)
+            self.end_date = date(year, month, calendar.monthrange(year, month)[1])
+        if not self.start_date or not self.end_date:
+            raise ValueError("period or startDate and endDate are required")
+        if self.end_date < self.start_date:
+            raise ValueError("endDate must not be before startDate")
+        if (self.end_date - self.start_date).days >= MAX_REPORT_DAYS:
+            raise ValueError(f"A report can cover at most {MAX_REPORT_DAYS} days")
+        return self
+
+    class Config:
+        populate_by_name = True
+
+
+class ReportJobOut(BaseModel):
+    id: str
+    type: str
+    status: Literal["queued", "running", "done", "failed"]
+    startDate: date
+    endDate: date
+    department: Optional[str] = None
+    holidays: List[date]
+    cached: bool
+    error: Optional[str] = None
+    createdAt: datetime
+    startedAt: Optional[datetime] = None
+    finishedAt: Optional[datetime] = None
+
+
+def job_to_out(job):
+    params = job["params"]
+    return ReportJobOut(
+        id=str(job["_id"]),
+        type=job["type"],
+        status=job["status"],
+        startDate=params["startDate"],
+        endDate=params["endDate"],
+        department=params.get("department"),
+        holidays=params["holidays"],
+        cached=job.get("cached", False),
+        error=job.get("error"),
+        createdAt=job["createdAt"],
+        startedAt=job.get("startedAt"),
+        finishedAt=job.get("finishedAt"),
+    )
+
+
+def _require_database():
+    database = get_database()
+    if database is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Database not connected"
+        )
+    return database
+
+
+@router.post("/jobs", response_model=ReportJobOut, status_code=status.HTTP_202_ACCEPTED)
+async def create_report_job(job_data: ReportJobCreate):
+    """
+    Queue a report for a month (`period`, YYYY-MM) or a date range. Poll the
+    returned job and download the result once its status is "done".
+    """
+    database = _require_database()
+    job = await submit_report(
+        database,
+        job_data.type,
+        job_data.start_date,
+        job_data.end_date,
+        department=job_data.department,
+        holidays=job_data.holidays,
+    )
+    return job_to_out(job)
+
+
+@router.get("/jobs/{job_id}", response_model=ReportJobOut)
+async def get_report_job(job_id: str):
+    _require_database()
+    job = await get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Report job not found")
+    return job_to_out(job)
+
+
+@router.get("/jobs/{job_id}/download")
+async def download_report(job_id: str, format: Literal["json", "csv"] = Query("json")):
+    _require_database()
+    job = await get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Report job not found")
+    if job["status"] != DONE:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Report job is {job['status']}")
+
+    stored = await get_result(job)
+    if not stored:
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail="Report result expired; submit the job again")
+
+    result = stored["result"]
+    if format == "json":
+        return {
+            "job": job_to_out(job),
+            "computedAt": stored["computedAt"],
+            **result,
+        }
+
+    columns = CSV_COLUMNS[job["type"]]
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+    writer.writeheader()
+    writer.writerows(result["employees"])
+    params = job["params"]
+    filename = f"{job['type']}_{params['startDate']}_{params['endDate']}.csv"
+    return Response(
+        buffer.getvalue(),
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
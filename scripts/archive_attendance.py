@@ -0,0 +1,54 @@
+import asyncio
+import argparse
+import sys
+import os
+import time
+from datetime import date
+
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import init_db, close_db, get_database
+from tenancy import current_tenant
+from attendance_store import get_attendance_store, ATTENDANCE_HOT_DAYS
+
+
+async def archive_attendance(hot_days, batch_size, tenant=None):
+    """
+    Move attendance older than `hot_days` into the archive collection.
+
+    Meant to run on a schedule (e.g. nightly from cron). Safe to re-run and to
+    run while the API is serving traffic. `tenant` archives a tenant's database
+    instead of the default one.
+    """
+    try:
+        if await init_db() is None:
+            raise RuntimeError("Could not connect to MongoDB")
+        current_tenant.set(tenant)
+        database = get_database()
+
+        store = get_attendance_store()
+        before = store.archive_cutoff(date.today(), hot_days)
+        started = time.perf_counter()
+        moved = await store.archive(database, before, batch_size=batch_size)
+
+        print(
+            f"✅ Archived {moved} documents older than {before:%Y-%m-%d} from "
+            f"{database.name}.{store.collection_name} to {store.archive_collection_name} ({time.perf_counter() - started:.1f}s)"
+        )
+
+    except Exception as e:
+        print("Error archiving attendance:", e)
+        raise
+
+    finally:
+        await close_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move old attendance into the archive collection.")
+    parser.add_argument("--hot-days", type=int, default=ATTENDANCE_HOT_DAYS, help="days of attendance kept in the hot collection")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--tenant", help="archive this tenant's database instead of the default one")
+    args = parser.parse_args()
+    asyncio.run(archive_attendance(args.hot_days, args.batch_size, args.tenant))
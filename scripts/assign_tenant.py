@@ -0,0 +1,49 @@
+import asyncio
+import argparse
+import sys
+import os
+
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import init_db, close_db, get_database, ensure_tenant_indexes
+from tenancy import current_tenant, is_valid_tenant, tenant_database_name
+
+
+async def assign_tenant(emails, tenant):
+    """
+    Move users to a tenant: their next access token carries the tenant claim, so
+    their requests use the tenant's database. Also builds that database's indexes.
+    """
+    if tenant is not None and not is_valid_tenant(tenant):
+        raise ValueError(f"Invalid tenant {tenant!r} (lowercase letters, digits, '_' and '-')")
+    try:
+        database = await init_db()
+        if database is None:
+            raise RuntimeError("Could not connect to MongoDB")
+
+        result = await database.users.update_many({"email": {"$in": [e.lower() for e in emails]}}, {"$set": {"tenant": tenant}})
+        print(f"✅ Assigned {result.modified_count} of {len(emails)} users to {tenant or 'the default database'}")
+
+        if tenant is not None:
+            token = current_tenant.set(tenant)
+            try:
+                await ensure_tenant_indexes(get_database())
+            finally:
+                current_tenant.reset(token)
+            print(f"✅ Indexes ready in {tenant_database_name(tenant)}")
+
+    except Exception as e:
+        print("Error assigning tenant:", e)
+        raise
+
+    finally:
+        await close_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Assign users to a tenant database.")
+    parser.add_argument("tenant", help="tenant ID, or 'default' for the default database")
+    parser.add_argument("emails", nargs="+", help="user emails")
+    args = parser.parse_args()
+    asyncio.run(assign_tenant(args.emails, None if args.tenant == "default" else args.tenant))
@@ -0,0 +1,298 @@
+"""
+High-volume synthetic data generator.
+
+Generates employees, users and daily attendance with realistic distributions
+(uneven department sizes, staggered hire dates, per-employee absence rates with
+Monday/Friday peaks and multi-day sick streaks, weekends and public holidays
+off) and streams them into MongoDB with batched unordered insert_many calls.
+Output is deterministic for a given --seed.
+
+    python scripts/generate_data.py --employees 100000 --users 100000 --start 2023-01-01 --drop
+
+Build the indexes afterwards (faster than maintaining them during the load):
+
+    python scripts/migrate_indexes.py
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+from datetime import date, datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+
+import certifi
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import BulkWriteError
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from auth import pwd_context
+
+
+# Relative department sizes.
+DEPARTMENTS = {
+    "Engineering": 24, "Customer Support": 16, "Sales": 14, "Operations": 10,
+    "Product": 6, "Marketing": 6, "IT": 5, "Finance": 5, "Design": 4,
+    "HR": 4, "Research": 3, "Legal": 3,
+}
+
+# Absence-rate multiplier per department.
+DEPARTMENT_ABSENCE = {"Customer Support": 1.4, "Operations": 1.2, "Sales": 1.1, "Legal": 0.8, "Research": 0.8}
+
+# Users' signup times are drawn from the seed within USER_SIGNUP_DAYS after this date.
+USER_EPOCH = datetime(2020, 1, 1)
+USER_SIGNUP_DAYS = 3 * 365
+
+# (month, day) public holidays; weekends are always off.
+HOLIDAYS = {(1, 1), (5, 1), (7, 4), (11, 11), (12, 25), (12, 26)}
+
+FIRST_NAMES = [
+    "John", "Jane", "Michael", "Sarah", "David", "Emily", "Robert", "Jessica", "William", "Ashley",
+    "James", "Amanda", "Christopher", "Melissa", "Daniel", "Nicole", "Matthew", "Michelle", "Anthony",
+    "Kimberly", "Mark", "Amy", "Donald", "Angela", "Steven", "Lisa", "Paul", "Nancy", "Andrew", "Karen",
+    "Joshua", "Betty", "Kenneth", "Helen", "Kevin", "Sandra", "Brian", "Donna", "George", "Carol",
+    "Edward", "Ruth", "Ronald", "Sharon", "Timothy", "Laura", "Jason", "Jeffrey", "Priya", "Wei",
+]
+
+LAST_NAMES = [
+    "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Rodriguez",
+    "Martinez", "Hernandez", "Lopez", "Wilson", "Anderson", "Thomas", "Taylor", "Moore", "Jackson",
+    "Martin", "Lee", "Thompson", "White", "Harris", "Sanchez", "Clark", "Ramirez", "Lewis", "Robinson",
+    "Walker", "Young", "Allen", "King", "Wright", "Scott", "Torres", "Nguyen", "Hill", "Flores",
+    "Green", "Adams", "Nelson", "Baker", "Hall", "Rivera", "Campbell", "Mitchell", "Carter", "Roberts",
+    "Patel", "Chen",
+]
+
+DOMAINS = ["example.com", "test.com", "demo.com", "sample.org", "mail.com"]
+
+DEFAULT_PASSWORD = "password123"
+
+
+def person_name(i):
+    """Deterministic (first, last) name for index i."""
+    return FIRST_NAMES[(i * 7919) % len(FIRST_NAMES)], LAST_NAMES[(i * 104729) % len(LAST_NAMES)]
+
+
+def employee_id(i):
+    return f"EMP{i + 1:06d}"
+
+
+def user_email(i):
+    first, last = person_name(i)
+    return f"{first.lower()}.{last.lower()}.{i}@{DOMAINS[i % len(DOMAINS)]}"
+
+
+def user_password(i, seed):
+    return f"pw-{seed}-{i}"
+
+
+def working_days(start, end):
+    """Dates in [start, end] that are neither weekends nor holidays."""
+    days = []
+    day = start
+    while day <= end:
+        if day.weekday() < 5 and (day.month, day.day) not in HOLIDAYS:
+            days.append(day)
+        day += timedelta(days=1)
+    return days
+
+
+def employee_docs(count, start, end, seed):
+    """Yield employee documents; department and hire date are drawn from the seed."""
+    rng = random.Random(f"employees-{seed}")
+    departments = list(DEPARTMENTS)
+    weights = list(DEPARTMENTS.values())
+    span = (end - start).days
+    for i in range(count):
+        first, last = person_name(i)
+        # Most of the workforce predates the generated period; the rest joined during it.
+        hired = start - timedelta(days=rng.randint(1, 3650)) if rng.random() < 0.7 else start + timedelta(days=rng.randint(0, span))
+        hired_at = datetime.combine(hired, datetime.min.time())
+        yield {
+            "employeeId": employee_id(i),
+            "fullName": f"{first} {last}",
+            "email": f"{first.lower()}.{last.lower()}.{i}@{DOMAINS[(i * 3) % len(DOMAINS)]}",
+            "department": rng.choices(departments, weights)[0],
+            "createdAt": hired_at,
+            "updatedAt": hired_at,
+        }
+
+
+def attendance_docs(employees, days, seed):
+    """
+    Yield one attendance document per employee per working day since hire.
+
+    Each employee gets their own RNG (seeded from the seed and employee ID), so
+    output doesn't depend on iteration order or batch size.
+    """
+    day_datetimes = [datetime.combine(day, datetime.min.time()) for day in days]
+    for employee in employees:
+        rng = random.Random(f"attendance-{seed}-{employee['employeeId']}")
+        base_rate = rng.betavariate(2, 58) * DEPARTMENT_ABSENCE.get(employee["department"], 1.0)
+        hired_at = employee["createdAt"]
+        absent_yesterday = False
+        for day in day_datetimes:
+            if day < hired_at:
+                continue
+            rate = base_rate * (1.3 if day.weekday() in (0, 4) else 1.0)
+            # Sick leave tends to come in streaks.
+            absent = rng.random() < (0.45 if absent_yesterday else rate)
+            absent_yesterday = absent
+            marked_at = day + timedelta(hours=8, minutes=rng.randint(0, 120))
+            yield {
+                "employeeId": employee["employeeId"],
+                "employee_id": employee["employeeId"],
+                "date": day,
+                "status": "Absent" if absent else "Present",
+                "createdAt": marked_at,
+                "updatedAt": marked_at,
+            }
+
+
+def _hash_passwords(passwords, rounds):
+    context = pwd_context.copy(bcrypt__rounds=rounds) if rounds else pwd_context
+    return [context.hash(password) for password in passwords]
+
+
+def user_docs(count, seed, unique_passwords, bcrypt_rounds, workers, hash_chunk_size=256):
+    """
+    Yield user documents.
+
+    By default every user shares DEFAULT_PASSWORD, hashed once. With
+    unique_passwords each user gets user_password(i, seed), hashed in a process
+    pool since bcrypt is CPU-bound and deliberately slow.
+    """
+    def doc(i, password_hash):
+        first, last = person_name(i)
+        # Per-user RNG, so the timestamp doesn't depend on generation order.
+        rng = random.Random(f"user-{seed}-{i}")
+        created_at = USER_EPOCH + timedelta(seconds=rng.randrange(USER_SIGNUP_DAYS * 86400))
+        return {"email": user_email(i), "password": password_hash, "fullName": f"{first} {last}", "createdAt": created_at, "updatedAt": created_at}
+
+    if not unique_passwords:
+        shared_hash = _hash_passwords([DEFAULT_PASSWORD], bcrypt_rounds)[0]
+        for i in range(count):
+            yield doc(i, shared_hash)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        chunks = [range(start, min(start + hash_chunk_size, count)) for start in range(0, count, hash_chunk_size)]
+        hashed_chunks = pool.map(
+            _hash_passwords,
+            [[user_password(i, seed) for i in chunk] for chunk in chunks],
+            [bcrypt_rounds] * len(chunks),
+        )
+        for chunk, hashes in zip(chunks, hashed_chunks):
+            for i, password_hash in zip(chunk, hashes):
+                yield doc(i, password_hash)
+
+
+async def insert_stream(collection, docs, batch_size, concurrency):
+    """Insert docs in unordered batches with up to `concurrency` batches in flight."""
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = set()
+    counts = {"inserted": 0, "duplicates": 0}
+    batches = 0
+    started = time.perf_counter()
+
+    async def insert(batch):
+        try:
+            result = await collection.insert_many(batch, ordered=False)
+            counts["inserted"] += len(result.inserted_ids)
+        except BulkWriteError as e:
+            # Re-running over existing data: skip duplicates, fail on anything else.
+            write_errors = e.details.get("writeErrors", [])
+            if any(error.get("code") != 11000 for error in write_errors):
+                raise
+            counts["inserted"] += e.details.get("nInserted", 0)
+            counts["duplicates"] += len(write_errors)
+        finally:
+            semaphore.release()
+
+    batch = []
+    for doc in docs:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            await semaphore.acquire()
+            task = asyncio.create_task(insert(batch))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            batch = []
+            batches += 1
+            if batches % 50 == 0:
+                done = counts["inserted"] + counts["duplicates"]
+                print(f"  {collection.name}: {done:,} rows ({done / (time.perf_counter() - started):,.0f}/s)")
+    if batch:
+        await semaphore.acquire()
+        tasks.add(asyncio.create_task(insert(batch)))
+    await asyncio.gather(*tasks)
+
+    elapsed = time.perf_counter() - started
+    print(f"✅ {collection.name}: inserted {counts['inserted']:,}, skipped {counts['duplicates']:,} existing ({elapsed:.1f}s)")
+    return counts
+
+
+async def generate(args, client=None):
+    own_client = client is None
+    if own_client:
+        tls_options = {"tls": True, "tlsCAFile": certifi.where()} if os.getenv("MONGODB_TLS", "true").lower() != "false" else {}
+        client = AsyncIOMotorClient(args.uri, serverSelectionTimeoutMS=30000, **tls_options)
+    database = client[args.db]
+
+    try:
+        print(f"Generating into {args.db} (seed {args.seed})")
+        if args.drop:
+            for name in ("employees", "attendances", "users"):
+                await database.drop_collection(name)
+
+        start = date.fromisoformat(args.start)
+        end = date.fromisoformat(args.end)
+        days = working_days(start, end)
+
+        await insert_stream(database.employees, employee_docs(args.employees, start, end, args.seed), args.batch_size, args.concurrency)
+        if args.attendance:
+            # Employees are regenerated rather than read back; the generator is deterministic.
+            employees = employee_docs(args.employees, start, end, args.seed)
+            await insert_stream(database.attendances, attendance_docs(employees, days, args.seed), args.batch_size, args.concurrency)
+        if args.users:
+            users = user_docs(args.users, args.seed, args.unique_passwords, args.bcrypt_rounds, args.workers)
+            await insert_stream(database.users, users, args.batch_size, args.concurrency)
+
+        if args.unique_passwords:
+            print(f"User i's password is pw-{args.seed}-<i>")
+        elif args.users:
+            print(f"Default password for all users: {DEFAULT_PASSWORD}")
+        print("ℹ️ Run scripts/migrate_indexes.py to build indexes if the server hasn't")
+
+    finally:
+        if own_client:
+            client.close()
+
+
+def parse_args(argv=None):
+    today = date.today()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", default=os.getenv("MONGODB_URI"))
+    parser.add_argument("--db", default=os.getenv("MONGODB_DB", "hrms_lite"))
+    parser.add_argument("--employees", type=int, default=10_000)
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument("--start", default=(today - timedelta(days=365)).isoformat(), help="first attendance day (YYYY-MM-DD)")
+    parser.add_argument("--end", default=(today - timedelta(days=1)).isoformat(), help="last attendance day (YYYY-MM-DD)")
+    parser.add_argument("--no-attendance", dest="attendance", action="store_false")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=5_000)
+    parser.add_argument("--concurrency", type=int, default=4, help="insert_many batches in flight")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="processes for password hashing")
+    parser.add_argument("--unique-passwords", action="store_true", help="hash a distinct password per user")
+    parser.add_argument("--bcrypt-rounds", type=int, default=None, help="lower bcrypt cost for test data (e.g. 4)")
+    parser.add_argument("--drop", action="store_true", help="drop employees/attendances/users first")
+    args = parser.parse_args(argv)
+    if not args.uri:
+        parser.error("MONGODB_URI environment variable is not set (or pass --uri)")
+    return args
+
+
+if __name__ == "__main__":
+    asyncio.run(generate(parse_args()))
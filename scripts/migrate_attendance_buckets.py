@@ -0,0 +1,114 @@
+import asyncio
+import argparse
+import sys
+import os
+import time
+
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pymongo import ReplaceOne
+from database import init_db, close_db, get_database
+from tenancy import current_tenant
+from attendance_store import BucketAttendanceStore, STATUS_CODES
+from models.attendance_bucket import UNMARKED, DAYS_PER_BUCKET
+
+BATCH_SIZE = 1000
+
+
+async def migrate_attendance_buckets(tenant=None):
+    """
+    Copy per-day `attendances` documents into per-employee-month `attendance_buckets`.
+
+    Run before switching the server to ATTENDANCE_STORAGE=buckets. Buckets are
+    rebuilt from scratch, so the script can be re-run; marks made in buckets mode
+    in the meantime are overwritten by the per-day data. `tenant` migrates a
+    tenant's database instead of the default one.
+    """
+    try:
+        if await init_db(startup_mode="full") is None:
+            raise RuntimeError("Could not connect to MongoDB")
+        current_tenant.set(tenant)
+        database = get_database()
+
+        store = BucketAttendanceStore()
+        source = database.attendances
+        target = database[store.collection_name]
+
+        # Legacy documents may only have employee_id; give them employeeId so the sort uses the index.
+        backfilled = await source.update_many(
+            {"employeeId": {"$exists": False}, "employee_id": {"$exists": True}},
+            [{"$set": {"employeeId": "$employee_id"}}],
+        )
+        if backfilled.modified_count:
+            print(f"Backfilled employeeId on {backfilled.modified_count} legacy records")
+
+        started = time.perf_counter()
+        buckets = {}
+        writes = []
+        records = buckets_written = 0
+        current_employee = None
+
+        def flush_employee():
+            for bucket in buckets.values():
+                writes.append(ReplaceOne({"_id": bucket["_id"]}, bucket, upsert=True))
+            buckets.clear()
+
+        cursor = source.find(
+            {"employeeId": {"$exists": True}},
+            {"employeeId": 1, "date": 1, "status": 1, "updatedAt": 1},
+        ).sort([("employeeId", 1), ("date", 1)])
+
+        async for record in cursor:
+            employee_id = record["employeeId"]
+            day = record["date"]
+            code = STATUS_CODES.get(record.get("status"))
+            if code is None:
+                continue
+
+            if employee_id != current_employee:
+                flush_employee()
+                current_employee = employee_id
+
+            bucket_id = store.bucket_id(employee_id, day)
+            bucket = buckets.get(bucket_id)
+            if bucket is None:
+                bucket = buckets[bucket_id] = {
+                    "_id": bucket_id,
+                    "employeeId": employee_id,
+                    "month": day.replace(day=1, hour=0, minute=0, second=0, microsecond=0),
+                    "days": [UNMARKED] * DAYS_PER_BUCKET,
+                    "updatedAt": [None] * DAYS_PER_BUCKET,
+                }
+            bucket["days"][day.day - 1] = code
+            bucket["updatedAt"][day.day - 1] = record.get("updatedAt")
+            records += 1
+
+            if len(writes) >= BATCH_SIZE:
+                await target.bulk_write(writes, ordered=False)
+                buckets_written += len(writes)
+                writes.clear()
+
+        flush_employee()
+        if writes:
+            await target.bulk_write(writes, ordered=False)
+            buckets_written += len(writes)
+
+        print(
+            f"✅ Migrated {records} attendance records into {buckets_written} buckets "
+            f"({time.perf_counter() - started:.1f}s)"
+        )
+
+    except Exception as e:
+        print("Error migrating attendance buckets:", e)
+        raise
+
+    finally:
+        await close_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Copy per-day attendance into monthly buckets.")
+    parser.add_argument("--tenant", help="migrate this tenant's database instead of the default one")
+    args = parser.parse_args()
+    asyncio.run(migrate_attendance_buckets(args.tenant))
@@ -0,0 +1,53 @@
+import asyncio
+import argparse
+import sys
+import os
+
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import init_db, close_db, check_indexes, ensure_tenant_indexes, get_database, TENANT_MODELS
+from tenancy import current_tenant
+
+
+async def migrate_indexes(tenants=()):
+    """
+    Create/repair all MongoDB indexes.
+
+    Run this once per deploy when the server starts with MONGODB_STARTUP_MODE=fast,
+    which only verifies indexes instead of building them. Tenant databases
+    listed in `tenants` are migrated too (otherwise each server process builds
+    a tenant's indexes the first time it serves the tenant).
+    """
+    try:
+        database = await init_db(startup_mode="full")
+        if database is None:
+            raise RuntimeError("Could not connect to MongoDB")
+
+        problems = await check_indexes(database)
+        if problems:
+            raise RuntimeError(f"Indexes still missing after migration: {problems}")
+
+        for tenant in tenants:
+            current_tenant.set(tenant)
+            tenant_db = get_database()
+            await ensure_tenant_indexes(tenant_db)
+            problems = await check_indexes(tenant_db, TENANT_MODELS)
+            if problems:
+                raise RuntimeError(f"Indexes still missing in {tenant_db.name} after migration: {problems}")
+
+        print("✅ Indexes are up to date")
+
+    except Exception as e:
+        print("Error migrating indexes:", e)
+        raise
+
+    finally:
+        await close_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create/repair all MongoDB indexes.")
+    parser.add_argument("--tenant", action="append", default=[], help="also migrate this tenant's database (repeatable)")
+    args = parser.parse_args()
+    asyncio.run(migrate_indexes(args.tenant))
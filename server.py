@@ -0,0 +1,55 @@
+"""
+Production server entry point.
+
+Runs main:app under uvicorn with one process per worker. The app is passed as an
+import string so every worker imports it (and runs the lifespan, i.e. init_db)
+after it has been started, so the Motor client and its connection pool are
+created per worker instead of being shared across processes.
+
+    python server.py
+"""
+import os
+import importlib.util
+import multiprocessing
+import uvicorn
+
+
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", 5000))
+WORKERS = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+
+# Keep-alive should outlive the load balancer's idle timeout (60s on most LBs),
+# otherwise the server closes connections the LB is about to reuse.
+KEEP_ALIVE_SECONDS = int(os.getenv("SERVER_KEEP_ALIVE", 75))
+BACKLOG = int(os.getenv("SERVER_BACKLOG", 2048))
+# On SIGTERM, stop accepting connections and give in-flight requests this long to finish.
+GRACEFUL_SHUTDOWN_SECONDS = int(os.getenv("SERVER_GRACEFUL_SHUTDOWN", 30))
+
+
+def _pick(module, preferred, fallback):
+    """Use the faster implementation when it's installed (uvloop/httptools aren't on Windows)."""
+    return preferred if importlib.util.find_spec(module) else fallback
+
+
+def run():
+    loop = os.getenv("SERVER_LOOP", _pick("uvloop", "uvloop", "asyncio"))
+    http = os.getenv("SERVER_HTTP", _pick("httptools", "httptools", "h11"))
+
+    print(f"Starting {WORKERS} worker(s) on {HOST}:{PORT} (loop={loop}, http={http})")
+    uvicorn.run(
+        "main:app",
+        host=HOST,
+        port=PORT,
+        workers=WORKERS,
+        loop=loop,
+        http=http,
+        timeout_keep_alive=KEEP_ALIVE_SECONDS,
+        backlog=BACKLOG,
+        timeout_graceful_shutdown=GRACEFUL_SHUTDOWN_SECONDS,
+        proxy_headers=True,
+        access_log=os.getenv("SERVER_ACCESS_LOG", "false").lower() == "true",
+    )
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,108 @@
+"""
+Single-flight coalescing of identical concurrent GET requests.
+
+For the read endpoints listed in SINGLE_FLIGHT_ROUTES, SingleFlightMiddleware
+runs only the first of several identical in-flight requests (the leader); the
+others (followers) wait for it and get a copy of its response, so the MongoDB
+query and the JSON encoding happen once per burst instead of once per client.
+
+Requests are identical when they have the same path, the same query
+parameters (in any order) and the same values for SINGLE_FLIGHT_VARY_HEADERS.
+X-Request-Timeout is always among them: the leader's fetch runs under the
+leader's deadline (deadlines.py), so a client asking for a short one must
+not cut short everyone else's response.
+Nothing is cached: once the leader's response is complete the key is removed
+and the next request fetches again. At most SINGLE_FLIGHT_MAX_KEYS keys are
+tracked; beyond that requests run on their own.
+
+Coalescing is counted in metrics.py (singleflight_requests_total by outcome:
+leader, follower, bypass).
+"""
+import os
+import asyncio
+from urllib.parse import parse_qsl, urlencode
+
+from metrics import singleflight_requests
+from deadlines import DEADLINE_HEADER
+
+
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() != "false"
+SINGLE_FLIGHT_ROUTES = {
+    route.strip().rstrip("/")
+    for route in os.getenv("SINGLE_FLIGHT_ROUTES", "/api/employees,/api/attendance,/api/dashboard/summary").split(",")
+    if route.strip()
+}
+SINGLE_FLIGHT_VARY_HEADERS = {
+    header.strip().lower().encode()
+    for header in os.getenv("SINGLE_FLIGHT_VARY_HEADERS", "authorization,x-causal-token").split(",")
+    if header.strip()
+} | {DEADLINE_HEADER}
+SINGLE_FLIGHT_MAX_KEYS = int(os.getenv("SINGLE_FLIGHT_MAX_KEYS", 1024))
+
+# Scope entries set by the router, copied to followers so they are labelled like the leader.
+ROUTING_SCOPE_KEYS = ("route", "endpoint", "path_params")
+
+
+def request_key(scope):
+    query = urlencode(sorted(parse_qsl(scope.get("query_string", b"").decode("latin-1"), keep_blank_values=True)))
+    headers = tuple(sorted((name, value) for name, value in scope["headers"] if name in SINGLE_FLIGHT_VARY_HEADERS))
+    return scope["path"].rstrip("/"), query, headers
+
+
+def _count(path, outcome):
+    key = (path, outcome)
+    singleflight_requests[key] = singleflight_requests.get(key, 0) + 1
+
+
+class SingleFlightMiddleware:
+    """Pure ASGI middleware sharing one response between identical concurrent GETs."""
+
+    def __init__(self, app):
+        self.app = app
+        self.in_flight = {}  # request key -> task producing (leader scope, response messages)
+
+    async def _fetch(self, scope):
+        messages = []
+        request_sent = False
+
+        async def receive():
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            # A GET has no more body; the response is shared, so no single client's
+            # disconnect should stop it. Streaming responses cancel this wait when done.
+            await asyncio.Future()
+
+        async def send(message):
+            messages.append(message)
+
+        await self.app(scope, receive, send)
+        return scope, messages
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET":
+            return await self.app(scope, receive, send)
+        path = scope["path"].rstrip("/")
+        if path not in SINGLE_FLIGHT_ROUTES:
+            return await self.app(scope, receive, send)
+
+        key = request_key(scope)
+        task = self.in_flight.get(key)
+        if task is None:
+            if len(self.in_flight) >= SINGLE_FLIGHT_MAX_KEYS:
+                _count(path, "bypass")
+                return await self.app(scope, receive, send)
+            _count(path, "leader")
+            task = self.in_flight[key] = asyncio.create_task(self._fetch(scope))
+            task.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        else:
+            _count(path, "follower")
+
+        # Shielded: a client that goes away must not cancel the fetch the others wait for.
+        leader_scope, messages = await asyncio.shield(task)
+        if leader_scope is not scope:
+            scope.update({name: leader_scope[name] for name in ROUTING_SCOPE_KEYS if name in leader_scope})
+        for message in messages:
+            # Copies: outer middlewares may modify the messages they send.
+            await send(dict(message))
@@ -0,0 +1,124 @@
+"""
+Multi-tenant routing.
+
+Each tenant (company) has its own database, `<TENANT_DATABASE_PREFIX><tenant>`,
+holding its employees, attendance and reports with their own indexes, so one
+tenant's data size doesn't affect another's queries and a large tenant can be
+moved to its own cluster by itself. All tenant databases are reached through
+the one MongoDB client, so they share its connection pool.
+
+The tenant comes from the "tenant" claim of the access token (added by
+create_access_token for users that belong to a tenant). TenantMiddleware reads
+it into current_tenant for the request; database.get_database() and the Beanie
+models deriving from TenantDocument then resolve to that tenant's database.
+Requests without a tenant use the default database (MONGODB_DB), which also
+holds the user accounts. Set TENANT_REQUIRED=true to reject data requests that
+don't carry a tenant.
+"""
+import os
+import re
+from contextvars import ContextVar
+
+from beanie import Document
+from fastapi.responses import JSONResponse
+from jose import JWTError, jwt
+
+from auth import SECRET_KEY, ALGORITHM
+
+
+TENANT_DATABASE_PREFIX = os.getenv("TENANT_DATABASE_PREFIX", "hrms_tenant_")
+TENANT_REQUIRED = os.getenv("TENANT_REQUIRED", "false").lower() == "true"
+
+# Tenant IDs become part of a database name (at most 63 bytes, no "." or "/").
+TENANT_PATTERN = re.compile(r"^[a-z0-9][a-z0-9_-]{0,39}$")
+
+# Paths that work without a tenant: account endpoints (users are global) and operations.
+TENANT_EXEMPT_PATHS = ("/api/auth", "/api/health", "/api/admin")
+
+current_tenant = ContextVar("current_tenant", default=None)
+
+_tenant_collections = {}  # (tenant, collection name) -> (default collection, tenant collection)
+
+
+def is_valid_tenant(tenant):
+    return isinstance(tenant, str) and bool(TENANT_PATTERN.match(tenant))
+
+
+def tenant_database_name(tenant):
+    return TENANT_DATABASE_PREFIX + tenant
+
+
+class TenantDocument(Document):
+    """Beanie document stored in the current tenant's database."""
+
+    @classmethod
+    def get_motor_collection(cls):
+        collection = super().get_motor_collection()
+        tenant = current_tenant.get()
+        if tenant is None or collection is None:
+            return collection
+        key = (tenant, collection.name)
+        cached = _tenant_collections.get(key)
+        # Rebuilt when init_db has bound the models to a new client.
+        if cached is None or cached[0] is not collection:
+            tenant_collection = collection.database.client[tenant_database_name(tenant)][collection.name]
+            cached = _tenant_collections[key] = (collection, tenant_collection)
+        return cached[1]
+
+
+def tenant_from_authorization(authorization):
+    """Tenant claim of a Bearer token (None without a token, tenant or valid signature)."""
+    if not authorization or not authorization.lower().startswith("bearer "):
+        return None
+    try:
+        payload = jwt.decode(authorization[7:].strip(), SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        # Routes that need authentication reject it themselves.
+        return None
+    return payload.get("tenant")
+
+
+class TenantMiddleware:
+    """
+    Pure ASGI middleware setting current_tenant from the access token.
+
+    prepare(tenant) is awaited before the request is handled (database.prepare_tenant
+    builds a tenant's indexes the first time it is seen by this process).
+    """
+
+    def __init__(self, app, prepare=None):
+        self.app = app
+        self.prepare = prepare
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        authorization = None
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                authorization = value.decode("latin-1")
+                break
+        tenant = tenant_from_authorization(authorization)
+
+        if tenant is not None and not is_valid_tenant(tenant):
+            response = JSONResponse({"detail": "Invalid tenant"}, status_code=400)
+            return await response(scope, receive, send)
+        if (
+            tenant is None
+            and TENANT_REQUIRED
+            and scope["path"].startswith("/api/")
+            and not scope["path"].startswith(TENANT_EXEMPT_PATHS)
+        ):
+            response = JSONResponse(
+                {"detail": "Tenant required"}, status_code=401, headers={"WWW-Authenticate": "Bearer"}
+            )
+            return await response(scope, receive, send)
+
+        token = current_tenant.set(tenant)
+        try:
+            if tenant is not None and self.prepare is not None:
+                await self.prepare(tenant)
+            await self.app(scope, receive, send)
+        finally:
+            current_tenant.reset(token)